@@ -1,28 +1,86 @@
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import os
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+
+from x402.http import ProcessSettleResult
+
+from .coalesce import Coalescer, coalesce_key
 from .config import (
+    CACHE_MAX_STALE_MS,
+    CORE_REGISTRY_SIZE,
+    NO_PAYMENT_REQUIRED,
     BotsManager,
+    BotsView,
     CachedConfigManager,
+    ConfigSnapshotManager,
     FacilitatorManager,
     HostConfigManager,
+    PooledAsyncClient,
     PaymentMethodsManager,
     RestrictionsManager,
+    SnapshotFieldView,
     build_request_metadata,
+    get_facilitator_client,
 )
-from .handler import handle_request, handle_settlement
-from .health import HEALTH_PATH, build_health_response
+from .grants import GRANT_HEADER, Grants, LocalGrantCounter, grant_scope
+from .handler import handle_request, handle_settlement, settle_payment
+from .loop import cancel_task
+from .health import HEALTH_PATH, READY_PATH, build_health_response, build_ready_response
 from .mcp import handle_mcp_request
 from .server import HttpServerManager
-from .store import create_redis_store, fetch_redis_credentials
+from .settlement import (
+    PendingSettlements,
+    SettledPayments,
+    SettlementError,
+    SettlementQueue,
+    aprepend_chunks,
+    asettle_before_last,
+    default_settlement_queue_path,
+    prepend_chunks,
+    settle_before_last,
+)
+from .shared import SharedConfigStore
+from .snapshot import SnapshotFile
+from .store import RedisGrantCounter, create_redis_store, fetch_redis_credentials
 from .types import (
+    ConfigSnapshot,
     ConfigStore,
+    FacilitatorHttpOptions,
     FoldsetOptions,
+    GrantOptions,
+    HttpServerResult,
     ProcessRequestResult,
     RedisCredentials,
     RequestAdapter,
+    SettlementMode,
+    StreamSettlement,
 )
 
-_cached_core: WorkerCore | None = None
+_live_cores: weakref.WeakSet[WorkerCore] = weakref.WeakSet()
+
+
+def _reset_cores_after_fork() -> None:
+    _registry._after_fork()
+    for core in list(_live_cores):
+        core._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_cores_after_fork)
+
+
+def _warn_deprecated(name: str) -> None:
+    warnings.warn(
+        f"WorkerCore.{name} is deprecated; use (await core.config.get()).{name}",
+        DeprecationWarning,
+        stacklevel=3,
+    )
 
 
 class WorkerCore:
@@ -32,59 +90,262 @@ class WorkerCore:
         api_key: str,
         platform: str,
         sdk_version: str,
+        max_stale_ms: int = CACHE_MAX_STALE_MS,
+        snapshot_file: SnapshotFile | None = None,
+        settlement_mode: SettlementMode = "before",
+        settlement_queue_path: str | None = None,
+        facilitator_http: FacilitatorHttpOptions | None = None,
+        grants: GrantOptions | None = None,
     ) -> None:
-        self.host_config = HostConfigManager(store)
-        self.restrictions = RestrictionsManager(store)
-        self.payment_methods = PaymentMethodsManager(store)
-        self.bots = BotsManager(store)
+        self.config = ConfigSnapshotManager(store, max_stale_ms, snapshot_file, facilitator_http)
+        self._snapshot_file = snapshot_file
+        self._background: set[asyncio.Task[None]] = set()
+        self._credentials: RedisCredentials | None = None
+        self._shared_config_path: str | None = None
         self.api_key = api_key
-        self.http_server = HttpServerManager(store)
+        self.settled = SettledPayments()
+        self.http_server = HttpServerManager(self.settled)
         self.platform = platform
         self.sdk_version = sdk_version
+        self.settlement_mode = settlement_mode
+        self.pending_settlements = PendingSettlements()
+        self.verifications: Coalescer[HttpServerResult] = Coalescer()
+        self.settlements: Coalescer[ProcessSettleResult] = Coalescer()
+        self.grants = Grants(grants) if grants is not None else None
+        self.settlement_queue = (
+            SettlementQueue(
+                settlement_queue_path or default_settlement_queue_path(api_key),
+                api_key,
+                self._settle_queued,
+            )
+            if settlement_mode == "deferred"
+            else None
+        )
+        _live_cores.add(self)
 
     @classmethod
     async def from_options(cls, options: FoldsetOptions) -> WorkerCore:
-        global _cached_core
-        if _cached_core:
-            return _cached_core
+        """Return the process-wide core for ``options.api_key`` (and ``host``), creating it once."""
+        return await _registry.get(options, cls._create)
 
-        credentials = options.redis_credentials or await fetch_redis_credentials(
-            options.api_key
+    @classmethod
+    async def _create(cls, options: FoldsetOptions) -> WorkerCore:
+        snapshot_file = (
+            SnapshotFile(options.snapshot_path, options.api_key) if options.snapshot_path else None
         )
-        store = create_redis_store(credentials)
-        _cached_core = cls(
+        saved = snapshot_file.load() if snapshot_file else None
+
+        credentials = options.redis_credentials or (saved and saved.credentials)
+        saved_credentials = credentials is not None and credentials is not options.redis_credentials
+        if credentials is None:
+            credentials = await fetch_redis_credentials(options.api_key)
+        if snapshot_file:
+            snapshot_file.credentials = credentials
+
+        store = _create_store(credentials, options.shared_config_path)
+        core = cls(
             store,
             options.api_key,
             options.platform or "unknown",
             options.sdk_version or "unknown",
+            options.config_max_stale_ms or CACHE_MAX_STALE_MS,
+            snapshot_file,
+            options.settlement_mode,
+            options.settlement_queue_path,
+            options.facilitator_http,
+            options.grants,
         )
-        return _cached_core
+        core._credentials = credentials
+        core._shared_config_path = options.shared_config_path
+        if core.settlement_queue is not None:
+            core.settlement_queue.tenant = credentials.tenant_id
+        if core.grants is not None and core.grants.options.shared:
+            core.grants.counter = RedisGrantCounter(credentials)
+        if saved and saved.raws:
+            try:
+                core.config.seed(saved.raws, saved.version, saved.timestamp)
+            except Exception:
+                pass  # Unusable saved config; load from the store instead
+        if saved_credentials:
+            core._start_background(core._revalidate_credentials(credentials))
+        if core.settlement_queue is not None:
+            # Pick up settlements left queued by an earlier process
+            core.settlement_queue.start()
+
+        return core
+
+    def _start_background(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _revalidate_credentials(self, saved: RedisCredentials) -> None:
+        """Swap in fresh Redis credentials if the saved ones were rotated."""
+        try:
+            credentials = await fetch_redis_credentials(self.api_key)
+        except Exception:
+            return
+        if credentials == saved:
+            return
+        self._credentials = credentials
+        self.config.set_store(_create_store(credentials, self._shared_config_path))
+        if self._snapshot_file:
+            self._snapshot_file.credentials = credentials
+            await self.config.persist()
+
+    async def _settle_queued(self, host: str, payment_payload, payment_requirements):
+        return await settle_payment(self, host, payment_payload, payment_requirements)
+
+    def _after_fork(self) -> None:
+        """Drop state a forked child cannot use: locks, tasks and open connections.
+
+        Parsed config and built servers are kept, so a core warmed up in a
+        pre-fork master (e.g. gunicorn ``preload_app``) serves right away.
+        """
+        self._background = set()
+        self.pending_settlements.clear()
+        self.verifications.clear()
+        self.settlements.clear()
+        if self.grants is not None:
+            self.grants.clear()
+        self.config.reset_after_fork()
+        if self._credentials is not None:
+            self.config.set_store(_create_store(self._credentials, self._shared_config_path))
+
+    def close(self) -> None:
+        """Stop this core's background work and drop its per-request caches.
+
+        Called when the registry evicts or replaces the core. Deferred
+        settlements stay queued on disk for the next core with this API key;
+        settlements already running in the background are left to finish.
+        A closed core still works if it is used again; what it needs restarts
+        lazily.
+        """
+        for task in list(self._background):
+            cancel_task(task)
+        self._background = set()
+        if self.settlement_queue is not None:
+            self.settlement_queue.close()
+        self.verifications.clear()
+        self.settlements.clear()
+        if self.grants is not None:
+            self.grants.clear()
+
+    @classmethod
+    async def warmup(cls, options: FoldsetOptions) -> WorkerCore:
+        """Load credentials, every config blob and the x402 server ahead of traffic.
+
+        Framework startup hooks call this when ``options.warmup`` is set so
+        the first request in a worker does not pay for it. Afterwards
+        ``ready`` is True.
+        """
+        core = await cls.from_options(options)
+        await core._warm()
+        return core
+
+    async def _warm(self) -> None:
+        snapshot = await self.config.get()
+        self.http_server.prune(snapshot)
+        for site in snapshot.site_snapshots():
+            await self.http_server.get(site)
+
+    # Deprecated views of the current snapshot, kept from when each config
+    # key had its own manager on the core; read ``core.config`` instead.
+
+    @property
+    def host_config(self) -> SnapshotFieldView:
+        _warn_deprecated("host_config")
+        return SnapshotFieldView(self.config, "host_config")
+
+    @property
+    def restrictions(self) -> SnapshotFieldView:
+        _warn_deprecated("restrictions")
+        return SnapshotFieldView(self.config, "restrictions")
+
+    @property
+    def payment_methods(self) -> SnapshotFieldView:
+        _warn_deprecated("payment_methods")
+        return SnapshotFieldView(self.config, "payment_methods")
+
+    @property
+    def bots(self) -> BotsView:
+        _warn_deprecated("bots")
+        return BotsView(self.config)
+
+    @property
+    def ready(self) -> bool:
+        """True once a config snapshot has loaded, from the store or a saved file.
+
+        A tenant without host config or a facilitator is ready too: its
+        requests are answered, just never gated.
+        """
+        return self.config.loaded
 
     async def process_request(self, adapter: RequestAdapter) -> ProcessRequestResult:
-        metadata = build_request_metadata()
+        path = adapter.get_path()
 
-        if adapter.get_path() == HEALTH_PATH:
+        if path == HEALTH_PATH:
             return ProcessRequestResult(
                 type="health-check",
-                metadata=metadata,
+                metadata=build_request_metadata(),
                 response=type(
                     "HealthResponse",
                     (),
                     {
                         "status": 200,
-                        "body": build_health_response(self.platform, self.sdk_version),
+                        "body": build_health_response(
+                            self.platform, self.sdk_version, self.ready
+                        ),
                         "headers": {"Content-Type": "application/json"},
                     },
                 )(),
             )
 
-        host_config = await self.host_config.get()
+        if path == READY_PATH:
+            # For load balancer readiness probes: the probe loads config and
+            # builds the x402 servers itself, and gets a 503 until config loads
+            try:
+                await self._warm()
+            except Exception:
+                # ``ready`` below tells whether config has loaded
+                pass
+            return ProcessRequestResult(
+                type="health-check",
+                metadata=build_request_metadata(),
+                response=type(
+                    "HealthResponse",
+                    (),
+                    {
+                        "status": 200 if self.ready else 503,
+                        "body": build_ready_response(self.ready),
+                        "headers": {"Content-Type": "application/json"},
+                    },
+                )(),
+            )
+
+        snapshot = self.config.peek() or await self.config.get()
+        self.http_server.prune(snapshot)
+
+        if snapshot.sites is not None:
+            site = snapshot.sites.lookup(adapter.get_host())
+            if site is None:
+                return NO_PAYMENT_REQUIRED
+            snapshot = site
+
+        # Paths no restriction or endpoint can match skip bot matching,
+        # request metadata and the x402 server entirely.
+        if snapshot.gate and not snapshot.gate.may_gate(path):
+            return NO_PAYMENT_REQUIRED
+
+        metadata = build_request_metadata()
+
+        host_config = snapshot.host_config
         mcp_endpoint = host_config.mcp_endpoint if host_config else None
 
-        if mcp_endpoint and adapter.get_path() == mcp_endpoint:
-            return await handle_mcp_request(self, adapter, mcp_endpoint, metadata)
+        if mcp_endpoint and path == mcp_endpoint:
+            return await handle_mcp_request(self, adapter, mcp_endpoint, metadata, snapshot)
 
-        return await handle_request(self, adapter, metadata)
+        return await handle_request(self, adapter, metadata, snapshot)
 
     async def process_settlement(
         self,
@@ -93,6 +354,7 @@ class WorkerCore:
         payment_requirements,
         upstream_status_code: int,
         request_id: str,
+        http_server=None,
     ):
         return await handle_settlement(
             self,
@@ -101,19 +363,162 @@ class WorkerCore:
             payment_requirements,
             upstream_status_code,
             request_id,
+            http_server,
         )
 
 
+_CoreKey = tuple[str, str | None]
+
+
+class WorkerCoreRegistry:
+    """Bounded LRU of WorkerCores, one per API key (and host, if given).
+
+    Lets one process serve many Foldset tenants. Each core keeps its own
+    store, config caches and x402 servers; tenants on the same Upstash
+    database share its HTTP connection pool (see ``create_redis_store``).
+    The least recently used core is closed and dropped once ``max_size`` is
+    exceeded, and rebuilt on its next request.
+
+    Creation is single-flight per key: concurrent first requests, from any
+    thread or event loop, wait for one ``create`` call. It runs as its own
+    task, so a cancelled caller does not cancel it for the others.
+    """
+
+    def __init__(self, max_size: int = CORE_REGISTRY_SIZE) -> None:
+        self.max_size = max_size
+        self._cores: OrderedDict[_CoreKey, WorkerCore] = OrderedDict()
+        self._creating: dict[_CoreKey, concurrent.futures.Future[WorkerCore]] = {}
+        # The loop only holds weak references to running tasks
+        self._tasks: set[asyncio.Future[WorkerCore]] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cores)
+
+    def peek(self, api_key: str, host: str | None = None) -> WorkerCore | None:
+        key = (api_key, host)
+        with self._lock:
+            core = self._cores.get(key)
+            if core is not None:
+                self._cores.move_to_end(key)
+            return core
+
+    async def get(self, options: FoldsetOptions, create) -> WorkerCore:
+        key = (options.api_key, options.host)
+        with self._lock:
+            core = self._cores.get(key)
+            if core is not None:
+                self._cores.move_to_end(key)
+                return core
+            future = self._creating.get(key)
+            leader = future is None
+            if future is None:
+                future = self._creating[key] = concurrent.futures.Future()
+
+        if leader:
+            task = asyncio.ensure_future(create(options))
+            self._tasks.add(task)
+            task.add_done_callback(lambda task: self._created(key, future, task))
+        # Shield so a cancelled caller doesn't cancel the shared future
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _created(
+        self,
+        key: _CoreKey,
+        future: concurrent.futures.Future[WorkerCore],
+        task: asyncio.Future[WorkerCore],
+    ) -> None:
+        self._tasks.discard(task)
+        with self._lock:
+            if self._creating.get(key) is future:
+                del self._creating[key]
+        if task.cancelled():
+            future.cancel()
+            return
+        if task.exception() is not None:
+            future.set_exception(task.exception())  # type: ignore[arg-type]
+            return
+
+        core = task.result()
+        with self._lock:
+            # A core registered with add() meanwhile wins over this one
+            existing = self._cores.get(key)
+        if existing is not None:
+            core.close()
+            future.set_result(existing)
+            return
+        self.add(key[0], core, key[1])
+        future.set_result(core)
+
+    def add(self, api_key: str, core: WorkerCore, host: str | None = None) -> None:
+        key = (api_key, host)
+        closing: list[WorkerCore] = []
+        with self._lock:
+            replaced = self._cores.get(key)
+            if replaced is not None and replaced is not core:
+                closing.append(replaced)
+            self._cores[key] = core
+            self._cores.move_to_end(key)
+            while len(self._cores) > self.max_size:
+                closing.append(self._cores.popitem(last=False)[1])
+        for old in closing:
+            old.close()
+
+    def _after_fork(self) -> None:
+        # Creations in flight belong to the parent's loops and threads
+        self._creating = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def evict(self, api_key: str, host: str | None = None) -> WorkerCore | None:
+        """Remove and close the core for ``api_key`` (and ``host``), returning it."""
+        with self._lock:
+            core = self._cores.pop((api_key, host), None)
+        if core is not None:
+            core.close()
+        return core
+
+    def clear(self) -> None:
+        with self._lock:
+            cores = list(self._cores.values())
+            self._cores.clear()
+        for core in cores:
+            core.close()
+
+
+_registry = WorkerCoreRegistry()
+
+
+def get_core_registry() -> WorkerCoreRegistry:
+    return _registry
+
+
+def _create_store(credentials: RedisCredentials, shared_config_path: str | None) -> ConfigStore:
+    store = create_redis_store(credentials)
+    if shared_config_path:
+        return SharedConfigStore(store, shared_config_path)
+    return store
+
+
 # Re-exports
 __all__ = [
     "WorkerCore",
+    "WorkerCoreRegistry",
+    "get_core_registry",
     # Types
+    "ConfigSnapshot",
     "ConfigStore",
+    "FacilitatorHttpOptions",
     "FoldsetOptions",
+    "GrantOptions",
     "ProcessRequestResult",
     "RedisCredentials",
     "RequestAdapter",
+    "SettlementMode",
+    "StreamSettlement",
     # Store
+    "SharedConfigStore",
+    "SnapshotFile",
     "create_redis_store",
     "fetch_redis_credentials",
     # Paywall
@@ -124,10 +529,13 @@ __all__ = [
     # Config managers
     "BotsManager",
     "CachedConfigManager",
+    "ConfigSnapshotManager",
     "FacilitatorManager",
     "HostConfigManager",
     "PaymentMethodsManager",
+    "PooledAsyncClient",
     "RestrictionsManager",
+    "get_facilitator_client",
     # Server
     "HttpServerManager",
     # MCP
@@ -147,11 +555,34 @@ __all__ = [
     # Handlers
     "handle_request",
     "handle_settlement",
+    "settle_payment",
     "format_api_payment_error",
     "format_web_payment_error",
+    # Settlement
+    "Coalescer",
+    "PendingSettlements",
+    "SettledPayments",
+    "SettlementError",
+    "SettlementQueue",
+    "aprepend_chunks",
+    "asettle_before_last",
+    "coalesce_key",
+    "prepend_chunks",
+    "settle_before_last",
+    # Grants
+    "GRANT_HEADER",
+    "Grants",
+    "LocalGrantCounter",
+    "RedisGrantCounter",
+    "grant_scope",
     # Health
     "HEALTH_PATH",
+    "READY_PATH",
     "build_health_response",
+    "build_ready_response",
+    # Loop
+    "get_background_loop",
+    "run_sync",
 ]
 
 # Lazy imports for __all__ items
@@ -170,3 +601,4 @@ from .telemetry import build_event_payload, log_event, report_error, send_event
 from .handler import handle_payment_request  # noqa: E402
 from .api import format_api_payment_error  # noqa: E402
 from .web import format_web_payment_error  # noqa: E402
+from .loop import get_background_loop, run_sync  # noqa: E402
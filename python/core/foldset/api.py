@@ -1,27 +1,17 @@
 from __future__ import annotations
 
 import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
 
-from .types import ApiRestriction, PaymentMethod, ProcessRequestResult
+from .types import ApiRestriction, PaymentMethod, ProcessRequestResult, Restriction
 
+PAYMENT_ERROR_CACHE_SIZE = 1024
 
-def format_api_payment_error(
-    result: ProcessRequestResult,
-    restriction: ApiRestriction,
-    payment_methods: list[PaymentMethod],
-    terms_of_service_url: str | None = None,
-) -> None:
-    body: dict = {
-        "error": "payment_required",
-        "version": result.metadata.version,
-        "request_id": result.metadata.request_id,
-        "timestamp": result.metadata.timestamp,
-        "message": restriction.description,
-        "price": restriction.price,
-    }
-    if terms_of_service_url:
-        body["terms_of_service_url"] = terms_of_service_url
-    body["payment_methods"] = [
+
+def payment_methods_body(payment_methods: list[PaymentMethod]) -> list[dict[str, Any]]:
+    return [
         {
             "network": pm.caip2_id,
             "asset": pm.contract_address,
@@ -32,5 +22,85 @@ def format_api_payment_error(
         }
         for pm in payment_methods
     ]
-    result.response.body = json.dumps(body)
+
+
+def request_fields_json(result: ProcessRequestResult) -> str:
+    """The per-request fields of a 402 body, as JSON object members."""
+    metadata = result.metadata
+    return (
+        f'"version": {json.dumps(metadata.version)}, '
+        f'"request_id": {json.dumps(metadata.request_id)}, '
+        f'"timestamp": {json.dumps(metadata.timestamp)}'
+    )
+
+
+class PaymentErrorCache:
+    """Caches the static part of API and MCP 402 bodies.
+
+    Everything in those bodies except the version, request id and timestamp
+    depends only on the restriction, the payment methods and the ToS URL.
+    That part is serialized once, keyed by object identity like
+    PaywallCache (ConfigSnapshotManager keeps the same objects while their
+    config is unchanged), so each 402 only formats the per-request fields.
+    """
+
+    def __init__(self, size: int = PAYMENT_ERROR_CACHE_SIZE) -> None:
+        self._size = size
+        self._fragments: OrderedDict[tuple, tuple[object, object, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fragment(
+        self,
+        kind: str,
+        restriction: Restriction | None,
+        payment_methods: list[PaymentMethod],
+        terms_of_service_url: str | None,
+        build: Callable[[], dict[str, Any]],
+    ) -> str:
+        """Return ``build()`` serialized without its opening brace."""
+        key = (kind, id(restriction), id(payment_methods), terms_of_service_url)
+        with self._lock:
+            entry = self._fragments.get(key)
+            # The stored objects guard against a reused id()
+            if entry is not None and entry[0] is restriction and entry[1] is payment_methods:
+                self._fragments.move_to_end(key)
+                return entry[2]
+
+        fragment = json.dumps(build())[1:]
+        with self._lock:
+            self._fragments[key] = (restriction, payment_methods, fragment)
+            while len(self._fragments) > self._size:
+                self._fragments.popitem(last=False)
+        return fragment
+
+
+_payment_error_cache = PaymentErrorCache()
+
+
+def get_payment_error_cache() -> PaymentErrorCache:
+    return _payment_error_cache
+
+
+def format_api_payment_error(
+    result: ProcessRequestResult,
+    restriction: ApiRestriction,
+    payment_methods: list[PaymentMethod],
+    terms_of_service_url: str | None = None,
+) -> None:
+    def build() -> dict[str, Any]:
+        body: dict[str, Any] = {
+            "message": restriction.description,
+            "price": restriction.price,
+        }
+        if terms_of_service_url:
+            body["terms_of_service_url"] = terms_of_service_url
+        body["payment_methods"] = payment_methods_body(payment_methods)
+        return body
+
+    static = _payment_error_cache.fragment(
+        "api", restriction, payment_methods, terms_of_service_url, build
+    )
+    result.response.body = (
+        f'{{"error": "payment_required", {request_fields_json(result)}, {static}'
+    )
     result.response.headers["Content-Type"] = "application/json"
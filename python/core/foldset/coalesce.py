@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hashlib
+import threading
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def coalesce_key(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class Coalescer(Generic[T]):
+    """Runs one call per key at a time.
+
+    Callers that arrive while a call for their key is in flight wait for it
+    instead of starting another. Nothing is kept once the call finishes, so
+    a later caller always makes a call of its own. The call runs as its own
+    task, so a caller that is cancelled (a client that disconnected) does
+    not cancel it for the others, and it is shared through a concurrent
+    future, so callers on other event loops can join it.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, concurrent.futures.Future[T]] = {}
+        # The loop only holds weak references to running tasks
+        self._tasks: set[asyncio.Future[T]] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of ``call``, or of the call already in flight for ``key``."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if future is None:
+                future = self._in_flight[key] = concurrent.futures.Future()
+
+        if leader:
+            task = asyncio.ensure_future(call())
+            self._tasks.add(task)
+            task.add_done_callback(lambda task: self._finish(key, future, task))
+        # Shield so a cancelled caller doesn't cancel the shared future
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _finish(
+        self,
+        key: str,
+        future: concurrent.futures.Future[T],
+        task: asyncio.Future[T],
+    ) -> None:
+        self._tasks.discard(task)
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())  # type: ignore[arg-type]
+        else:
+            future.set_result(task.result())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._in_flight.clear()
+        self._tasks = set()
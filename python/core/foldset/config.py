@@ -1,18 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import importlib.util
 import json
+import os
+import threading
 import time
 import uuid
+import weakref
 from datetime import datetime, timezone
 from typing import Any
 
+import httpx
+from x402.http import CreateHeadersAuthProvider
 from x402.http import FacilitatorConfig as X402FacilitatorConfig
 from x402.http import HTTPFacilitatorClient
 
+from .matching import BotMatcher, GateFilter, HostIndex
+from .routes import build_gate_filter
+from .snapshot import SnapshotFile
 from .types import (
     Bot,
+    ConfigSnapshot,
     ConfigStore,
     FacilitatorConfig,
+    FacilitatorHttpOptions,
     HostConfig,
     PaymentMethod,
     ProcessRequestResult,
@@ -27,7 +39,20 @@ from importlib.metadata import version as _pkg_version
 
 PACKAGE_VERSION = _pkg_version("foldset")
 CACHE_TTL_MS = 30_000
+# Entries older than CACHE_TTL_MS are served stale while a single background
+# refresh runs; past this window a caller must block on a fresh fetch.
+CACHE_MAX_STALE_MS = 300_000
+# Failed background refreshes back off exponentially between these bounds
+CACHE_RETRY_BACKOFF_MS = 1_000
+CACHE_RETRY_MAX_BACKOFF_MS = 30_000
+CORE_REGISTRY_SIZE = 256
 API_BASE_URL = "https://api.foldset.com"
+# Tenant-level key bumped by the control plane whenever any config key changes.
+# Optional: without it every refresh reloads all blobs.
+CONFIG_VERSION_KEY = "config-version"
+# Blobs are reloaded at least this often even while the version is unchanged,
+# so a version key that is not bumped cannot pin old config forever
+CONFIG_FULL_RELOAD_MS = 300_000
 
 
 def build_request_metadata() -> RequestMetadata:
@@ -42,27 +67,144 @@ def no_payment_required(metadata: RequestMetadata) -> ProcessRequestResult:
     return ProcessRequestResult(type="no-payment-required", metadata=metadata)
 
 
+# Shared result for requests turned away before any metadata is built (an
+# unknown host or an ungated path); nothing reads its metadata.
+NO_PAYMENT_REQUIRED = ProcessRequestResult(
+    type="no-payment-required",
+    metadata=RequestMetadata(version=PACKAGE_VERSION, request_id="", timestamp=""),
+)
+
+
 class CachedConfigManager[T]:
-    def __init__(self, config_store: ConfigStore, key: str, fallback: T) -> None:
+    """TTL cache over a single config store key.
+
+    Within ``CACHE_TTL_MS`` the cached value is returned as-is. Between the TTL
+    and ``max_stale_ms`` the stale value is returned immediately while one
+    background task refreshes it (stale-while-revalidate). Past
+    ``max_stale_ms``, or before the first successful load, callers block on a
+    fetch that is shared by every concurrent caller (single-flight).
+
+    A failed background refresh is not retried until a backoff has passed
+    (doubling per consecutive failure), so a store outage does not get a
+    refetch per request while the stale value is served.
+    """
+
+    def __init__(
+        self,
+        config_store: ConfigStore,
+        key: str,
+        fallback: T,
+        max_stale_ms: int = CACHE_MAX_STALE_MS,
+    ) -> None:
         self._config_store = config_store
         self._key = key
         self._fallback = fallback
+        self._max_stale_ms = max(max_stale_ms, CACHE_TTL_MS)
         self._cached: T = fallback
         self._cache_timestamp: float = 0
+        self._refresh_task: asyncio.Task[T] | None = None
+        self._refresh_lock = threading.Lock()
+        self._failures = 0
+        self._retry_at: float = 0
+
+    def _cache_age_ms(self) -> float:
+        return time.time() * 1000 - self._cache_timestamp
 
     def _is_cache_valid(self) -> bool:
-        return self._cache_timestamp > 0 and (time.time() * 1000 - self._cache_timestamp) < CACHE_TTL_MS
+        return self._cache_timestamp > 0 and self._cache_age_ms() < CACHE_TTL_MS
+
+    def _is_cache_usable(self) -> bool:
+        return self._cache_timestamp > 0 and self._cache_age_ms() < self._max_stale_ms
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def loaded(self) -> bool:
+        """True once a value has been loaded, even if it has since gone stale."""
+        return self._cache_timestamp > 0
 
     def _deserialize(self, raw: str) -> T:
         return json.loads(raw)
 
-    async def get(self) -> T:
+    def parse(self, raw: str | None) -> T:
+        return self._deserialize(raw) if raw else self._fallback
+
+    async def _load(self) -> T:
+        return self.parse(await self._config_store.get(self._key))
+
+    async def _refresh(self) -> T:
+        value = await self._load()
+        self._cached = value
+        self._cache_timestamp = time.time() * 1000
+        return value
+
+    def _start_refresh(self, *, background: bool) -> asyncio.Task[T] | None:
+        """Return the in-flight refresh task, starting one if needed.
+
+        Tasks are bound to the loop that created them. A refresh running on
+        another loop (one core can be driven from a server's loop and from
+        the background loop sync frameworks share) still counts as in flight
+        for background refreshes, but a blocking caller starts its own task
+        since it cannot await a foreign one.
+        """
+        loop = asyncio.get_running_loop()
+        with self._refresh_lock:
+            task = self._refresh_task
+            if task is not None and not task.done():
+                if task.get_loop() is loop:
+                    return task
+                if background:
+                    return None
+            if background and time.time() * 1000 < self._retry_at:
+                return None
+            task = loop.create_task(self._refresh())
+            task.add_done_callback(self._on_refresh_done)
+            self._refresh_task = task
+            return task
+
+    def _on_refresh_done(self, task: asyncio.Task[T]) -> None:
+        # Retrieve the exception so failed background refreshes don't log
+        # "exception was never retrieved"; the stale value keeps being served.
+        failed = not task.cancelled() and task.exception() is not None
+        with self._refresh_lock:
+            if self._refresh_task is task:
+                self._refresh_task = None
+            if failed:
+                self._failures += 1
+                backoff = min(
+                    CACHE_RETRY_BACKOFF_MS * 2 ** (self._failures - 1), CACHE_RETRY_MAX_BACKOFF_MS
+                )
+                self._retry_at = time.time() * 1000 + backoff
+            elif not task.cancelled():
+                self._failures = 0
+                self._retry_at = 0
+
+    def reset_after_fork(self) -> None:
+        """Forget refresh state inherited from the parent of a forked process."""
+        self._refresh_task = None
+        self._refresh_lock = threading.Lock()
+
+    def peek(self) -> T | None:
+        """Return the cached value without awaiting, or None if a fetch must block.
+
+        Starts a background refresh when the value is stale but still usable.
+        """
         if self._is_cache_valid():
             return self._cached
-        raw = await self._config_store.get(self._key)
-        self._cached = self._deserialize(raw) if raw else self._fallback
-        self._cache_timestamp = time.time() * 1000
-        return self._cached
+        if self._is_cache_usable():
+            self._start_refresh(background=True)
+            return self._cached
+        return None
+
+    async def get(self) -> T:
+        if self._is_cache_usable():
+            return self.peek()  # type: ignore[return-value]
+        task = self._start_refresh(background=False)
+        assert task is not None
+        # Shield so a cancelled caller doesn't cancel the fetch shared with others
+        return await asyncio.shield(task)
 
 
 def _parse_restriction(data: dict[str, Any]) -> Restriction:
@@ -72,6 +214,7 @@ def _parse_restriction(data: dict[str, Any]) -> Restriction:
             description=data["description"],
             price=data["price"],
             scheme=data["scheme"],
+            host=data.get("host"),
             path=data.get("path", ""),
         )
     elif rtype == "api":
@@ -79,6 +222,7 @@ def _parse_restriction(data: dict[str, Any]) -> Restriction:
             description=data["description"],
             price=data["price"],
             scheme=data["scheme"],
+            host=data.get("host"),
             path=data.get("path", ""),
             http_method=data.get("httpMethod"),
         )
@@ -87,29 +231,38 @@ def _parse_restriction(data: dict[str, Any]) -> Restriction:
             description=data["description"],
             price=data["price"],
             scheme=data["scheme"],
+            host=data.get("host"),
             method=data.get("method", ""),
             name=data.get("name", ""),
         )
     raise ValueError(f"Unknown restriction type: {rtype}")
 
 
-class HostConfigManager(CachedConfigManager[HostConfig | None]):
-    def __init__(self, store: ConfigStore) -> None:
-        super().__init__(store, "host-config", None)
+def _parse_host_config(data: dict[str, Any]) -> HostConfig:
+    return HostConfig(
+        host=data["host"],
+        api_protection_mode=data.get("apiProtectionMode", "bots"),
+        mcp_endpoint=data.get("mcpEndpoint"),
+        terms_of_service_url=data.get("termsOfServiceUrl"),
+    )
+
+
+class HostConfigManager(CachedConfigManager[HostConfig | list[HostConfig] | None]):
+    """Host config: one object for a single site, or a list for many hosts."""
+
+    def __init__(self, store: ConfigStore, max_stale_ms: int = CACHE_MAX_STALE_MS) -> None:
+        super().__init__(store, "host-config", None, max_stale_ms)
 
-    def _deserialize(self, raw: str) -> HostConfig | None:
+    def _deserialize(self, raw: str) -> HostConfig | list[HostConfig] | None:
         data = json.loads(raw)
-        return HostConfig(
-            host=data["host"],
-            api_protection_mode=data.get("apiProtectionMode", "bots"),
-            mcp_endpoint=data.get("mcpEndpoint"),
-            terms_of_service_url=data.get("termsOfServiceUrl"),
-        )
+        if isinstance(data, list):
+            return [_parse_host_config(item) for item in data]
+        return _parse_host_config(data)
 
 
 class RestrictionsManager(CachedConfigManager[list[Restriction]]):
-    def __init__(self, store: ConfigStore) -> None:
-        super().__init__(store, "restrictions", [])
+    def __init__(self, store: ConfigStore, max_stale_ms: int = CACHE_MAX_STALE_MS) -> None:
+        super().__init__(store, "restrictions", [], max_stale_ms)
 
     def _deserialize(self, raw: str) -> list[Restriction]:
         data = json.loads(raw)
@@ -117,8 +270,8 @@ class RestrictionsManager(CachedConfigManager[list[Restriction]]):
 
 
 class PaymentMethodsManager(CachedConfigManager[list[PaymentMethod]]):
-    def __init__(self, store: ConfigStore) -> None:
-        super().__init__(store, "payment-methods", [])
+    def __init__(self, store: ConfigStore, max_stale_ms: int = CACHE_MAX_STALE_MS) -> None:
+        super().__init__(store, "payment-methods", [], max_stale_ms)
 
     def _deserialize(self, raw: str) -> list[PaymentMethod]:
         data = json.loads(raw)
@@ -137,8 +290,10 @@ class PaymentMethodsManager(CachedConfigManager[list[PaymentMethod]]):
 
 
 class BotsManager(CachedConfigManager[list[Bot]]):
-    def __init__(self, store: ConfigStore) -> None:
-        super().__init__(store, "bots", [])
+    def __init__(self, store: ConfigStore, max_stale_ms: int = CACHE_MAX_STALE_MS) -> None:
+        super().__init__(store, "bots", [], max_stale_ms)
+        self._matcher: BotMatcher | None = None
+        self._matched_bots: list[Bot] | None = None
 
     def _deserialize(self, raw: str) -> list[Bot]:
         data = json.loads(raw)
@@ -152,16 +307,133 @@ class BotsManager(CachedConfigManager[list[Bot]]):
 
     async def match_bot(self, user_agent: str) -> Bot | None:
         bots = await self.get()
-        ua = user_agent.lower()
-        for bot in bots:
-            if bot.user_agent in ua:
-                return bot
-        return None
+        if self._matcher is None or self._matched_bots is not bots:
+            self._matcher = BotMatcher(bots)
+            self._matched_bots = bots
+        return self._matcher.match(user_agent)
+
+
+class SnapshotFieldView:
+    """Read-only view of one ConfigSnapshot field, shaped like a config manager.
+
+    Stands in for the per-key managers WorkerCore used to expose, so
+    ``await core.restrictions.get()`` keeps returning the current value.
+    """
+
+    def __init__(self, config: ConfigSnapshotManager, field: str) -> None:
+        self._config = config
+        self._field = field
+
+    async def get(self) -> Any:
+        return getattr(await self._config.get(), self._field)
+
+
+class BotsView(SnapshotFieldView):
+    def __init__(self, config: ConfigSnapshotManager) -> None:
+        super().__init__(config, "bots")
+
+    async def match_bot(self, user_agent: str) -> Bot | None:
+        return (await self._config.get()).bot_matcher.match(user_agent)
+
+
+class PooledAsyncClient:
+    """Stands in for the httpx.AsyncClient of an HTTPFacilitatorClient.
+
+    An httpx.AsyncClient's connections belong to the event loop that opened
+    them, and a process can drive its cores from more than one loop (the
+    server's and the sync bridge's), so this keeps one pooled client per
+    loop and forwards each call to the running loop's.
+    """
+
+    def __init__(self, options: FacilitatorHttpOptions) -> None:
+        self._options = options
+        self._clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(loop)
+                if client is None:
+                    client = self._clients[loop] = self._create()
+        return client
+
+    def _create(self) -> httpx.AsyncClient:
+        options = self._options
+        return httpx.AsyncClient(
+            http2=options.http2 and importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=options.max_connections,
+                max_keepalive_connections=options.max_keepalive_connections,
+                keepalive_expiry=options.keepalive_expiry_s,
+            ),
+            timeout=httpx.Timeout(options.read_timeout_s, connect=options.connect_timeout_s),
+            follow_redirects=True,
+        )
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client().post(url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client().get(url, **kwargs)
+
+
+# Facilitator clients by (HTTP options, URL, headers), shared by every core
+_facilitator_clients: dict[tuple[FacilitatorHttpOptions, str, str], HTTPFacilitatorClient] = {}
+_facilitator_clients_lock = threading.Lock()
+
+
+def _clear_facilitator_clients() -> None:
+    global _facilitator_clients_lock
+    _facilitator_clients.clear()
+    _facilitator_clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked child must not reuse the parent's connections
+    os.register_at_fork(after_in_child=_clear_facilitator_clients)
+
+
+def get_facilitator_client(
+    url: str, headers: dict[str, dict[str, str]] | None, options: FacilitatorHttpOptions
+) -> HTTPFacilitatorClient:
+    """Return the process-wide facilitator client for ``url`` and ``headers``.
+
+    Config refreshes that leave the facilitator unchanged get the same
+    client back, so its pooled keep-alive connections survive them (and
+    HttpServerManager keeps its initialized resource server).
+    """
+    key = (options, url, json.dumps(headers, sort_keys=True))
+    with _facilitator_clients_lock:
+        client = _facilitator_clients.get(key)
+        if client is None:
+            auth_provider = (
+                CreateHeadersAuthProvider(lambda: headers) if headers is not None else None
+            )
+            client = _facilitator_clients[key] = HTTPFacilitatorClient(
+                X402FacilitatorConfig(
+                    url=url,
+                    timeout=options.read_timeout_s,
+                    http_client=PooledAsyncClient(options),
+                    auth_provider=auth_provider,
+                )
+            )
+        return client
 
 
 class FacilitatorManager(CachedConfigManager[HTTPFacilitatorClient | None]):
-    def __init__(self, store: ConfigStore) -> None:
-        super().__init__(store, "facilitator", None)
+    def __init__(
+        self,
+        store: ConfigStore,
+        max_stale_ms: int = CACHE_MAX_STALE_MS,
+        http_options: FacilitatorHttpOptions | None = None,
+    ) -> None:
+        super().__init__(store, "facilitator", None, max_stale_ms)
+        self._http_options = http_options or FacilitatorHttpOptions()
 
     def _deserialize(self, raw: str) -> HTTPFacilitatorClient:
         config = json.loads(raw)
@@ -172,12 +444,183 @@ class FacilitatorManager(CachedConfigManager[HTTPFacilitatorClient | None]):
             or config.get("supportedHeaders")
         )
 
-        facilitator_config: dict[str, Any] = {"url": config["url"]}
+        headers = None
         if has_auth_headers:
-            facilitator_config["create_headers"] = lambda: {
+            headers = {
                 "verify": config.get("verifyHeaders") or {},
                 "settle": config.get("settleHeaders") or {},
                 "supported": config.get("supportedHeaders") or {},
             }
 
-        return HTTPFacilitatorClient(facilitator_config)
+        return get_facilitator_client(config["url"], headers, self._http_options)
+
+
+class ConfigSnapshotManager(CachedConfigManager[ConfigSnapshot]):
+    """Loads every config key in one round trip into an immutable ConfigSnapshot.
+
+    Shares the stale-while-revalidate behaviour of CachedConfigManager, so a
+    refresh replaces the whole snapshot at once. When the tenant publishes a
+    CONFIG_VERSION_KEY, refreshes poll only that key and keep the current
+    snapshot (the same object) until the version changes, or until
+    CONFIG_FULL_RELOAD_MS has passed since the last full load. Without the
+    key (nothing publishes it yet), every refresh reloads all blobs.
+
+    Blobs whose raw value is unchanged keep their previously parsed object,
+    so consumers can tell what changed between snapshots by identity.
+
+    With a ``snapshot_file``, every changed config is saved to it, and
+    ``seed`` can start the manager from a file written by another process.
+    """
+
+    def __init__(
+        self,
+        store: ConfigStore,
+        max_stale_ms: int = CACHE_MAX_STALE_MS,
+        snapshot_file: SnapshotFile | None = None,
+        facilitator_http: FacilitatorHttpOptions | None = None,
+    ) -> None:
+        super().__init__(store, "snapshot", ConfigSnapshot(), max_stale_ms)
+        self._snapshot_file = snapshot_file
+        self._host_config = HostConfigManager(store)
+        self._restrictions = RestrictionsManager(store)
+        self._payment_methods = PaymentMethodsManager(store)
+        self._bots = BotsManager(store)
+        self._facilitator = FacilitatorManager(store, http_options=facilitator_http)
+        self._raw: dict[str, str | None] = {}
+        self._full_load_at: float = 0
+        # Parsed host-config value, which is not kept on multi-site snapshots
+        self._host_configs: HostConfig | list[HostConfig] | None = None
+        self._site_inputs: tuple[object, object] = (None, None)
+        self._site_parts: list[tuple[HostConfig, list[Restriction], GateFilter | None]] = []
+
+    def _parse_field(
+        self, manager: CachedConfigManager[Any], raws: dict[str, str | None], previous: Any
+    ) -> Any:
+        raw = raws.get(manager.key)
+        if manager.key in self._raw and self._raw[manager.key] == raw:
+            return previous
+        return manager.parse(raw)
+
+    async def _load(self) -> ConfigSnapshot:
+        current = self._cached
+        full_load_due = time.time() * 1000 - self._full_load_at >= CONFIG_FULL_RELOAD_MS
+        if self._cache_timestamp > 0 and current.version is not None and not full_load_due:
+            version = await self._config_store.get(CONFIG_VERSION_KEY)
+            # A missing key never matches, so its absence means a full load
+            if version is not None and version == current.version:
+                return current
+
+        keys = [
+            self._host_config.key,
+            self._restrictions.key,
+            self._payment_methods.key,
+            self._bots.key,
+            self._facilitator.key,
+        ]
+        # The version is read in the same MGET as the blobs so it always
+        # describes exactly the config it is stored with.
+        version, *values = await self._config_store.get_many([CONFIG_VERSION_KEY, *keys])
+        raws = dict(zip(keys, values))
+        self._full_load_at = time.time() * 1000
+
+        changed = raws != self._raw
+        snapshot = self._build(raws, version)
+        if changed and self._snapshot_file is not None:
+            # fsync can block for a while, so the write runs off the event loop
+            await asyncio.to_thread(self._snapshot_file.save, raws, version)
+        return snapshot
+
+    def _build(self, raws: dict[str, str | None], version: str | None) -> ConfigSnapshot:
+        current = self._cached
+        host_config = self._parse_field(self._host_config, raws, self._host_configs)
+        restrictions = self._parse_field(self._restrictions, raws, current.restrictions)
+        bots = self._parse_field(self._bots, raws, current.bots)
+        shared = {
+            "payment_methods": self._parse_field(
+                self._payment_methods, raws, current.payment_methods
+            ),
+            "bots": bots,
+            "facilitator": self._parse_field(self._facilitator, raws, current.facilitator),
+            "version": version,
+            "bot_matcher": current.bot_matcher if bots is current.bots else BotMatcher(bots),
+        }
+
+        if isinstance(host_config, list):
+            snapshot = ConfigSnapshot(
+                restrictions=restrictions,
+                sites=self._build_sites(host_config, restrictions, shared),
+                **shared,
+            )
+        else:
+            # Derived lookups are rebuilt only when their inputs changed
+            if current.gate and host_config is current.host_config and restrictions is current.restrictions:
+                gate = current.gate
+            else:
+                gate = build_gate_filter(host_config, restrictions)
+            snapshot = ConfigSnapshot(
+                host_config=host_config, restrictions=restrictions, gate=gate, **shared
+            )
+
+        self._raw = raws
+        self._host_configs = host_config
+        return snapshot
+
+    def _build_sites(
+        self,
+        host_configs: list[HostConfig],
+        restrictions: list[Restriction],
+        shared: dict[str, Any],
+    ) -> HostIndex:
+        """Build one snapshot per host, each with only the restrictions for it.
+
+        Per-site restriction lists and gates are reused while the host
+        configs and restrictions are unchanged, so HttpServerManager keeps
+        each site's server across unrelated config changes.
+        """
+        host_inputs, restriction_inputs = self._site_inputs
+        if host_configs is host_inputs and restrictions is restriction_inputs:
+            parts = self._site_parts
+        else:
+            parts = []
+            for site_config in host_configs:
+                host = site_config.host.lower()
+                site_restrictions = [
+                    r for r in restrictions if r.host is None or r.host.lower() == host
+                ]
+                parts.append(
+                    (site_config, site_restrictions, build_gate_filter(site_config, site_restrictions))
+                )
+            self._site_inputs = (host_configs, restrictions)
+            self._site_parts = parts
+
+        return HostIndex(
+            (site_config.host, ConfigSnapshot(
+                host_config=site_config, restrictions=site_restrictions, gate=gate, **shared
+            ))
+            for site_config, site_restrictions, gate in parts
+        )
+
+    async def persist(self) -> None:
+        """Save the current config to the snapshot file, if there is one."""
+        if self._snapshot_file is not None and self._raw:
+            await asyncio.to_thread(self._snapshot_file.save, self._raw, self._cached.version)
+
+    def set_store(self, store: ConfigStore) -> None:
+        """Read config from ``store`` from the next refresh on."""
+        self._config_store = store
+
+    def seed(self, raws: dict[str, str | None], version: str | None, saved_at: float) -> bool:
+        """Start from config blobs saved by an earlier process at ``saved_at``.
+
+        A snapshot older than ``max_stale_ms`` is rejected (returns False), so
+        the caller loads from the store as on a cold start. Otherwise it is
+        served right away with its saved age, counting as stale, and a refresh
+        against the store starts immediately in the background.
+        """
+        now = time.time() * 1000
+        if saved_at <= 0 or now - saved_at >= self._max_stale_ms:
+            return False
+        self._cached = self._build(raws, version)
+        self._cache_timestamp = min(saved_at, now - CACHE_TTL_MS)
+        self._start_refresh(background=True)
+        return True
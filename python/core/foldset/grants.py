@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from .types import GrantOptions, McpRestriction, Restriction
+
+GRANT_HEADER = "FOLDSET-GRANT"
+# Verified requests whose grant scope waits for their settlement
+GRANT_PENDING_SIZE = 4096
+GRANT_COUNTER_SIZE = 65536
+# Longer headers are rejected before decoding
+GRANT_MAX_LENGTH = 1024
+
+
+def grant_scope(restriction: Restriction) -> str:
+    """The restriction pattern a grant is valid for."""
+    if isinstance(restriction, McpRestriction):
+        return f"mcp {restriction.method}:{restriction.name}"
+    method = getattr(restriction, "http_method", None)
+    return f"{restriction.type} {(method or '*').upper()} {restriction.path}"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class GrantCounter(Protocol):
+    def reserve(self, grant_id: str, expires: int) -> bool: ...
+
+    async def increment(self, grant_id: str, expires: int) -> int: ...
+
+
+class LocalGrantCounter:
+    """Counts grant uses in this process (see RedisGrantCounter to share them).
+
+    Only expired counters are evicted: dropping a live one would reset its
+    grant's uses. At ``size`` live counters no new grant is issued, and a
+    grant without a counter here cannot be redeemed until one expires.
+    """
+
+    def __init__(self, size: int = GRANT_COUNTER_SIZE) -> None:
+        self._size = size
+        self._counts: OrderedDict[str, list[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _add(self, grant_id: str, expires: int) -> list[int] | None:
+        """Return the counter for ``grant_id``, adding it if there is room."""
+        entry = self._counts.get(grant_id)
+        if entry is not None:
+            return entry
+        now = time.time()
+        # Grants share one TTL, so the oldest entries expire first
+        while self._counts and next(iter(self._counts.values()))[1] <= now:
+            self._counts.popitem(last=False)
+        if len(self._counts) >= self._size:
+            return None
+        entry = self._counts[grant_id] = [0, expires]
+        return entry
+
+    def reserve(self, grant_id: str, expires: int) -> bool:
+        """Make room for a grant about to be issued, or return False if full."""
+        with self._lock:
+            return self._add(grant_id, expires) is not None
+
+    async def increment(self, grant_id: str, expires: int) -> int:
+        with self._lock:
+            entry = self._add(grant_id, expires)
+            if entry is None:
+                raise RuntimeError("Too many live grants to count another")
+            entry[0] += 1
+            return entry[0]
+
+
+class Grants:
+    """Issues and redeems prepaid access grants.
+
+    A grant is an HMAC-signed token, returned in the FOLDSET-GRANT header
+    of a settled response, that lets the payer make ``max_requests`` more
+    requests to the same restriction on the same host for ``ttl_s`` seconds
+    without paying again. Grants are checked in-process; only the use count
+    is stateful, and it lives in this process unless ``counter`` is shared.
+
+    A grant is a bearer token: whoever holds it can spend it, like the
+    resource it pays for.
+    """
+
+    def __init__(self, options: GrantOptions, counter: GrantCounter | None = None) -> None:
+        self.options = options
+        self.counter: GrantCounter = counter or LocalGrantCounter()
+        self._key = options.secret.encode()
+        self._pending: OrderedDict[str, tuple[str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sign(self, body: str) -> str:
+        return _b64encode(hmac.new(self._key, body.encode(), hashlib.sha256).digest())
+
+    def note(self, request_id: str, host: str, restriction: Restriction) -> None:
+        """Remember what a verified request would be granted once it settles."""
+        with self._lock:
+            self._pending[request_id] = (host, grant_scope(restriction))
+            while len(self._pending) > GRANT_PENDING_SIZE:
+                self._pending.popitem(last=False)
+
+    def discard(self, request_id: str) -> None:
+        with self._lock:
+            self._pending.pop(request_id, None)
+
+    def issue(self, request_id: str, grant_id: str) -> str | None:
+        """Return a grant for a request that settled, if it was noted.
+
+        ``grant_id`` is derived from the payment and the route it paid for,
+        so retries of one payment get grants that share a use count.
+        """
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return None
+        host, scope = pending
+        expires = int(time.time() + self.options.ttl_s)
+        if not self.counter.reserve(grant_id, expires):
+            # No room to count its uses; the payment still stands
+            return None
+        claims = {
+            "id": grant_id,
+            "host": host,
+            "scope": scope,
+            "n": self.options.max_requests,
+            "exp": expires,
+        }
+        body = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{body}.{self._sign(body)}"
+
+    def _claims(self, token: str) -> dict[str, Any] | None:
+        if len(token) > GRANT_MAX_LENGTH:
+            return None
+        body, _, signature = token.partition(".")
+        if not hmac.compare_digest(signature.encode(), self._sign(body).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(body))
+        except ValueError:
+            return None
+        return claims if isinstance(claims, dict) else None
+
+    async def redeem(self, token: str, host: str, restriction: Restriction) -> bool:
+        """Spend one use of ``token`` on a request to ``restriction``."""
+        claims = self._claims(token)
+        if (
+            claims is None
+            or claims.get("host") != host
+            or claims.get("scope") != grant_scope(restriction)
+        ):
+            return False
+        expires = claims.get("exp")
+        if not isinstance(expires, int) or expires <= time.time():
+            return False
+        try:
+            count = await self.counter.increment(str(claims.get("id")), expires)
+        except Exception:
+            # Without a count the grant cannot be checked; pay as usual
+            return False
+        return count <= claims.get("n", 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
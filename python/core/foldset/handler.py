@@ -1,30 +1,143 @@
 from __future__ import annotations
 
+import dataclasses
 from typing import TYPE_CHECKING, Any
 
 from x402.http import HTTPRequestContext, ProcessSettleResult
 
 from .api import format_api_payment_error
+from .coalesce import coalesce_key
 from .config import no_payment_required
-from .telemetry import log_event
-from .types import ProcessRequestResult, RequestAdapter, RequestMetadata
+from .grants import GRANT_HEADER
+from .telemetry import build_event_payload, log_event
+from .types import (
+    ConfigSnapshot,
+    HttpServerResult,
+    ProcessRequestResult,
+    RequestAdapter,
+    RequestMetadata,
+)
 from .web import format_web_payment_error
 
 if TYPE_CHECKING:
     from . import WorkerCore
+    from .server import FoldsetHTTPResourceServer
 
 
 def _settlement_failure(reason: str, network: str) -> ProcessSettleResult:
     return ProcessSettleResult(success=False, error_reason=reason)
 
 
+async def _verify_payment(
+    core: WorkerCore,
+    http_server: FoldsetHTTPResourceServer,
+    context: HTTPRequestContext,
+    metadata: RequestMetadata,
+    host: str,
+) -> HttpServerResult:
+    """Verify the request's payment, sharing the call with identical requests.
+
+    Requests with the same payment header for the same route that arrive
+    while its verification is in flight share it; a later one verifies
+    again, and gets a 402 once the payment has settled (see
+    SettledPayments). Each caller gets its own copy, since the result is
+    filled in per request afterwards.
+    """
+    if not context.payment_header:
+        return await http_server.process_http_request_with_restriction(context, metadata=metadata)
+
+    key = coalesce_key(
+        context.payment_header, str(id(http_server)), host, context.method, context.path
+    )
+
+    async def verify() -> HttpServerResult:
+        return await http_server.process_http_request_with_restriction(context, metadata=metadata)
+
+    shared = await core.verifications.run(key, verify)
+    response = shared.response
+    if response is not None:
+        response = dataclasses.replace(response, headers=dict(response.headers))
+    return dataclasses.replace(shared, metadata=metadata, response=response)
+
+
+def _settlement_key(
+    payment_payload: Any, payment_requirements: Any, host: str, method: str, path: str
+) -> str:
+    """Identify one payment for one route, like the verification key does."""
+    return coalesce_key(
+        payment_payload.model_dump_json(by_alias=True),
+        payment_requirements.model_dump_json(by_alias=True),
+        host,
+        method,
+        path,
+    )
+
+
+async def _settle_once(
+    core: WorkerCore,
+    http_server: FoldsetHTTPResourceServer,
+    payment_payload: Any,
+    payment_requirements: Any,
+    host: str,
+    method: str = "",
+    path: str = "",
+) -> ProcessSettleResult:
+    """Settle a payload, sharing the call with identical settlements in flight.
+
+    Concurrent settlements of the same payload for the same requirements,
+    host, method and path share one facilitator call. Once it succeeds the
+    payload is recorded in ``core.settled``, so replaying it gets a 402 at
+    verification. The same payload sent to another route settles on its
+    own (and the facilitator rejects the reuse).
+    """
+    key = _settlement_key(payment_payload, payment_requirements, host, method, path)
+
+    async def settle() -> ProcessSettleResult:
+        result = await http_server.process_settlement(payment_payload, payment_requirements)
+        if result.success:
+            core.settled.add(payment_payload, payment_requirements.max_timeout_seconds)
+        return result
+
+    return await core.settlements.run(key, settle)
+
+
+def _with_grant(
+    core: WorkerCore,
+    adapter: RequestAdapter,
+    request_id: str,
+    payment_payload: Any,
+    payment_requirements: Any,
+    result: ProcessSettleResult,
+) -> ProcessSettleResult:
+    """Add a prepaid grant to a successful settlement, when grants are on."""
+    if core.grants is None:
+        return result
+    if not result.success:
+        core.grants.discard(request_id)
+        return result
+    # Retries of one payment on one route share the grant's use count
+    grant_id = _settlement_key(
+        payment_payload,
+        payment_requirements,
+        adapter.get_host(),
+        adapter.get_method(),
+        adapter.get_path(),
+    )[:32]
+    grant = core.grants.issue(request_id, grant_id)
+    if grant is None:
+        return result
+    # The result may be shared with other requests for the same payment
+    return dataclasses.replace(result, headers={**result.headers, GRANT_HEADER: grant})
+
+
 async def handle_payment_request(
     core: WorkerCore,
     adapter: RequestAdapter,
     metadata: RequestMetadata,
+    snapshot: ConfigSnapshot,
     path_override: str | None = None,
 ) -> ProcessRequestResult:
-    http_server = await core.http_server.get()
+    http_server = await core.http_server.get(snapshot)
     if not http_server:
         return no_payment_required(metadata)
 
@@ -43,14 +156,44 @@ async def handle_payment_request(
     if not http_server.requires_payment(context):
         return no_payment_required(metadata)
 
-    result = await http_server.process_http_request_with_restriction(context)
-    result.metadata = metadata
+    grants = core.grants
+    restriction = None
+    if grants is not None:
+        restriction = http_server.get_restriction(context.path, context.method)
+        grant = adapter.get_header(GRANT_HEADER)
+        if (
+            grant
+            and restriction is not None
+            and await grants.redeem(grant, adapter.get_host(), restriction)
+        ):
+            await log_event(core, adapter, 200, metadata.request_id)
+            return no_payment_required(metadata)
+
+    result = await _verify_payment(core, http_server, context, metadata, adapter.get_host())
 
     if result.type == "payment-error":
         if result.restriction and result.restriction.price == 0:
             await log_event(core, adapter, 200, metadata.request_id)
             return no_payment_required(metadata)
         await log_event(core, adapter, result.response.status if result.response else 402, metadata.request_id)
+    elif result.type == "payment-verified":
+        # Settle against the config this payment was verified with
+        result.http_server = http_server
+        if grants is not None and restriction is not None:
+            grants.note(metadata.request_id, adapter.get_host(), restriction)
+        if core.settlement_mode == "concurrent":
+            core.pending_settlements.start(
+                metadata.request_id,
+                _settle_once(
+                    core,
+                    http_server,
+                    result.payment_payload,
+                    result.payment_requirements,
+                    adapter.get_host(),
+                    context.method,
+                    context.path,
+                ),
+            )
 
     return result
 
@@ -59,16 +202,17 @@ async def handle_request(
     core: WorkerCore,
     adapter: RequestAdapter,
     metadata: RequestMetadata,
+    snapshot: ConfigSnapshot,
 ) -> ProcessRequestResult:
     user_agent = adapter.get_user_agent()
-    bot = await core.bots.match_bot(user_agent) if user_agent else None
-    host_config = await core.host_config.get()
+    bot = snapshot.bot_matcher.match(user_agent) if user_agent else None
+    host_config = snapshot.host_config
 
     should_check = bot or (host_config and host_config.api_protection_mode == "all")
     if not should_check:
         return no_payment_required(metadata)
 
-    result = await handle_payment_request(core, adapter, metadata)
+    result = await handle_payment_request(core, adapter, metadata, snapshot)
 
     if result.type != "payment-error":
         return result
@@ -77,7 +221,7 @@ async def handle_request(
     if result.restriction and result.restriction.type == "web" and not bot:
         return no_payment_required(metadata)
 
-    payment_methods = await core.payment_methods.get()
+    payment_methods = snapshot.payment_methods
 
     if payment_methods and result.restriction:
         if result.restriction.type == "api":
@@ -89,12 +233,38 @@ async def handle_request(
                 result, result.restriction, payment_methods, adapter, host_config.terms_of_service_url if host_config else None
             )
 
-    if bot and bot.force_200 and result.response:
+    # A 304 revalidation stays a 304
+    if bot and bot.force_200 and result.response and result.response.status != 304:
         result.response.status = 200
 
     return result
 
 
+async def settle_payment(
+    core: WorkerCore,
+    host: str,
+    payment_payload: Any,
+    payment_requirements: Any,
+    http_server: FoldsetHTTPResourceServer | None = None,
+    method: str = "",
+    path: str = "",
+) -> ProcessSettleResult:
+    """Settle with ``http_server``, or with the current config's server for ``host``.
+
+    Pass the server the payment was verified with, so a config swap in
+    between cannot mix two configs within one request. ``method`` and
+    ``path`` name the route, so settlements are only shared within it.
+    """
+    if http_server is None:
+        snapshot = (await core.config.get()).for_host(host)
+        http_server = await core.http_server.get(snapshot) if snapshot else None
+    if not http_server:
+        return _settlement_failure("Server not initialized", "")
+    return await _settle_once(
+        core, http_server, payment_payload, payment_requirements, host, method, path
+    )
+
+
 async def handle_settlement(
     core: WorkerCore,
     adapter: RequestAdapter,
@@ -102,18 +272,71 @@ async def handle_settlement(
     payment_requirements: Any,
     upstream_status_code: int,
     request_id: str,
+    http_server: FoldsetHTTPResourceServer | None = None,
 ) -> ProcessSettleResult:
-    http_server = await core.http_server.get()
-    if not http_server:
-        return _settlement_failure("Server not initialized", "")
+    """Settle a verified payment once the upstream response status is known.
+
+    ``http_server`` is the result's ``http_server``: the server the payment
+    was verified with. Without it the current config's server is used.
+
+    How depends on ``core.settlement_mode``:
+
+    - ``"before"`` (default): settle now, before the response is sent. The
+      resource is only served once the payment settled, and upstream errors
+      (status >= 400) are never charged, at the cost of a facilitator round
+      trip on every paid response.
+    - ``"concurrent"``: join the settlement handle_payment_request started
+      when the payment verified, so it overlapped the handler. A failed
+      settlement still withholds the resource, but the payer is charged
+      even when the handler fails.
+    - ``"deferred"``: queue the payment in the core's durable
+      SettlementQueue and succeed immediately, with no PAYMENT-RESPONSE
+      header. The resource is served before payment is final; a payment
+      that later fails to settle is content given away.
+
+    With ``core.grants`` set, a successful settlement also carries a
+    FOLDSET-GRANT header (see Grants); deferred settlements get none, as
+    their payment is not final yet.
+    """
+    if core.settlement_mode == "concurrent":
+        result = await core.pending_settlements.join(request_id)
+        if result is not None:
+            if result.success:
+                payment_response = result.headers.get("PAYMENT-RESPONSE")
+                await log_event(core, adapter, upstream_status_code, request_id, payment_response)
+            elif upstream_status_code >= 400:
+                await log_event(core, adapter, upstream_status_code, request_id)
+                result = _settlement_failure("Upstream error", "")
+            else:
+                await log_event(core, adapter, 402, request_id)
+            return _with_grant(core, adapter, request_id, payment_payload, payment_requirements, result)
 
     if upstream_status_code >= 400:
         await log_event(core, adapter, upstream_status_code, request_id)
-        return _settlement_failure("Upstream error", "")
+        result = _settlement_failure("Upstream error", "")
+        return _with_grant(core, adapter, request_id, payment_payload, payment_requirements, result)
+
+    if core.settlement_mode == "deferred" and core.settlement_queue is not None:
+        if core.grants is not None:
+            core.grants.discard(request_id)
+        # Spent from here on, though it settles later
+        core.settled.add(payment_payload, payment_requirements.max_timeout_seconds)
+        await core.settlement_queue.enqueue(
+            adapter.get_host(),
+            payment_payload,
+            payment_requirements,
+            build_event_payload(adapter, upstream_status_code, request_id),
+        )
+        return ProcessSettleResult(success=True, headers={})
 
-    result = await http_server.process_settlement(
+    result = await settle_payment(
+        core,
+        adapter.get_host(),
         payment_payload,
         payment_requirements,
+        http_server,
+        adapter.get_method(),
+        adapter.get_path(),
     )
 
     if result.success:
@@ -122,4 +345,4 @@ async def handle_settlement(
     else:
         await log_event(core, adapter, 402, request_id)
 
-    return result
+    return _with_grant(core, adapter, request_id, payment_payload, payment_requirements, result)
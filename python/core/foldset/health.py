@@ -6,13 +6,21 @@ from datetime import datetime, timezone
 from .config import PACKAGE_VERSION
 
 HEALTH_PATH = "/.well-known/foldset"
+READY_PATH = "/.well-known/foldset/ready"
 
 
-def build_health_response(platform: str, sdk_version: str) -> str:
-    return json.dumps({
+def build_health_response(platform: str, sdk_version: str, ready: bool | None = None) -> str:
+    body = {
         "status": "ok",
         "core_version": PACKAGE_VERSION,
         "sdk_version": sdk_version,
         "platform": platform,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    })
+    }
+    if ready is not None:
+        body["ready"] = ready
+    return json.dumps(body)
+
+
+def build_ready_response(ready: bool) -> str:
+    return json.dumps({"status": "ready" if ready else "starting"})
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import re
+from collections import deque
+from collections.abc import Callable, Iterable, Sequence
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .types import Bot
+
+ROUTE_CACHE_SIZE = 4096
+BOT_CACHE_SIZE = 4096
+
+_REGEX_META = frozenset(".^$*+?{}[]|()")
+# Constructs that change meaning or fail to compile inside a combined
+# alternation: backreferences, named groups, conditionals and global flags.
+_UNCOMBINABLE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+def _literal_run(body: str) -> tuple[str, bool]:
+    """Return the literal text a regex body starts with, and whether that is all of it."""
+    chars: list[str] = []
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if char == "\\":
+            escaped = body[i + 1] if i + 1 < len(body) else ""
+            if not escaped or escaped.isalnum():
+                return "".join(chars), False
+            step = 2
+        elif char in _REGEX_META:
+            # A quantifier applies to the previous character, so drop it
+            if char in "*+?{" and chars:
+                chars.pop()
+            return "".join(chars), False
+        else:
+            escaped = char
+            step = 1
+        chars.append(escaped)
+        i += step
+    return "".join(chars), True
+
+
+def parse_literal_pattern(pattern: str) -> tuple[str, bool] | None:
+    """Return ``(literal, exact)`` if a route regex only matches a fixed string.
+
+    Route regexes are applied with ``re.match``, so a literal pattern matches
+    every path it prefixes, or only itself when it ends with ``$``. Returns
+    None for anything that needs the regex engine.
+    """
+    body = pattern[1:] if pattern.startswith("^") else pattern
+    exact = body.endswith("$") and not body.endswith("\\$")
+    if exact:
+        body = body[:-1]
+
+    literal, complete = _literal_run(body)
+    # Case-insensitive regex matching only agrees with str.lower() for ASCII
+    if not complete or not literal.isascii():
+        return None
+    return literal.lower(), exact
+
+
+def literal_prefix(pattern: str) -> str:
+    """Return the lowercased literal text every match of a route regex starts with.
+
+    Empty when the pattern has no such prefix (top-level alternation, leading
+    wildcard, inline flags or non-ASCII text).
+    """
+    if "|" in pattern:
+        return ""
+    body = pattern[1:] if pattern.startswith("^") else pattern
+    literal, _ = _literal_run(body)
+    # A trailing "$" anchor still leaves the text before it as a prefix
+    return literal.lower() if literal.isascii() else ""
+
+
+class _TrieNode:
+    __slots__ = ("children", "routes", "patterns")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        # Literal prefix routes that match once the path reaches this node
+        self.routes: list[tuple[int, str]] = []
+        # Regex routes whose literal prefix ends here and still need a match
+        self.patterns: list[int] = []
+
+    def descend(self, text: str) -> _TrieNode:
+        node = self
+        for char in text:
+            node = node.children.setdefault(char, _TrieNode())
+        return node
+
+
+class RouteIndex:
+    """First-match route lookup over x402 compiled routes.
+
+    Equivalent to scanning ``routes`` in order and returning the first one
+    whose regex matches the normalized path and whose verb is ``*`` or the
+    request method, but:
+
+    - literal patterns are answered by an exact-match dict and a prefix trie
+    - regex patterns that start with literal text hang off the same trie, so
+      only those whose prefix matches the path are tried
+    - the remaining patterns are grouped per verb into one alternation regex,
+      which reports the first matching alternative in a single match call
+    - results are memoized per (path, method) in a bounded LRU
+
+    Built once per route table, so it lives as long as the server it indexes.
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[Any],
+        normalize_path: Callable[[str], str],
+        cache_size: int = ROUTE_CACHE_SIZE,
+    ) -> None:
+        self._routes = list(routes)
+        self._normalize_path = normalize_path
+        self._exact: dict[str, list[tuple[int, str]]] = {}
+        self._prefixes = _TrieNode()
+        self._combined: dict[str, tuple[re.Pattern[str], dict[str, int]]] = {}
+        self._standalone: list[int] = []
+
+        regex_routes: dict[str, list[int]] = {}
+        for index, route in enumerate(self._routes):
+            if not route.regex.flags & re.IGNORECASE:
+                self._standalone.append(index)
+                continue
+
+            literal = parse_literal_pattern(route.regex.pattern)
+            if literal is not None:
+                text, exact = literal
+                if exact:
+                    self._exact.setdefault(text, []).append((index, route.verb))
+                else:
+                    self._prefixes.descend(text).routes.append((index, route.verb))
+                continue
+
+            prefix = literal_prefix(route.regex.pattern)
+            if prefix:
+                self._prefixes.descend(prefix).patterns.append(index)
+            elif _UNCOMBINABLE.search(route.regex.pattern):
+                self._standalone.append(index)
+            else:
+                regex_routes.setdefault(route.verb, []).append(index)
+
+        for verb, indexes in regex_routes.items():
+            self._add_combined(verb, indexes)
+
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _add_combined(self, verb: str, indexes: list[int]) -> None:
+        groups = {f"_r{index}": index for index in indexes}
+        alternation = "|".join(
+            f"(?P<_r{index}>{self._routes[index].regex.pattern})" for index in indexes
+        )
+        try:
+            combined = re.compile(alternation, re.IGNORECASE)
+        except re.error:
+            self._standalone.extend(indexes)
+            self._standalone.sort()
+            return
+        self._combined[verb] = (combined, groups)
+
+    def _lookup(self, path: str, method: str) -> Any | None:
+        normalized = self._normalize_path(path)
+        verb = method.upper()
+
+        if not normalized.isascii():
+            return self._scan(normalized, verb)
+
+        best = len(self._routes)
+        lowered = normalized.lower()
+
+        # "$" also matches before a trailing newline
+        for key in (lowered, lowered[:-1]) if lowered.endswith("\n") else (lowered,):
+            for index, route_verb in self._exact.get(key, ()):
+                if index < best and (route_verb == "*" or route_verb == verb):
+                    best = index
+
+        candidates: list[int] = []
+        node: _TrieNode | None = self._prefixes
+        position = 0
+        while node is not None:
+            for index, route_verb in node.routes:
+                if index < best and (route_verb == "*" or route_verb == verb):
+                    best = index
+            candidates.extend(node.patterns)
+            if position == len(lowered):
+                break
+            node = node.children.get(lowered[position])
+            position += 1
+
+        for group_verb in ("*", verb) if verb != "*" else ("*",):
+            entry = self._combined.get(group_verb)
+            if entry is None:
+                continue
+            combined, groups = entry
+            match = combined.match(normalized)
+            if match and match.lastgroup is not None:
+                best = min(best, groups[match.lastgroup])
+
+        candidates.extend(self._standalone)
+        for index in sorted(candidates):
+            if index >= best:
+                break
+            route = self._routes[index]
+            if (route.verb == "*" or route.verb == verb) and route.regex.match(normalized):
+                best = index
+                break
+
+        return self._routes[best].config if best < len(self._routes) else None
+
+    def _scan(self, normalized: str, verb: str) -> Any | None:
+        for route in self._routes:
+            if route.regex.match(normalized) and (route.verb == "*" or route.verb == verb):
+                return route.config
+        return None
+
+
+class BotMatcher:
+    """Aho-Corasick matcher over bot user-agent substrings.
+
+    ``match`` returns the earliest bot in list order whose ``user_agent`` occurs
+    in the lowercased User-Agent, exactly like testing each bot in turn, but
+    in a single pass over the string. Results are memoized per raw
+    User-Agent, which repeats heavily in real traffic.
+    """
+
+    def __init__(self, bots: Sequence[Bot], cache_size: int = BOT_CACHE_SIZE) -> None:
+        self._bots = list(bots)
+        goto: list[dict[str, int]] = [{}]
+        # Lowest bot index matched by any pattern ending in each state,
+        # including those reached through failure links.
+        self._best: list[int] = [len(self._bots)]
+
+        for index, bot in enumerate(self._bots):
+            state = 0
+            for char in bot.user_agent:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    self._best.append(len(self._bots))
+                state = next_state
+            self._best[state] = min(self._best[state], index)
+
+        # Fold failure links into a full transition table so matching is one
+        # dict lookup per character.
+        fail = [0] * len(goto)
+        self._delta: list[dict[str, int]] = [{} for _ in goto]
+        self._delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self._best[state] = min(self._best[state], self._best[fail[state]])
+            self._delta[state] = {**self._delta[fail[state]], **goto[state]}
+            for char, child in goto[state].items():
+                fail[child] = self._delta[fail[state]].get(char, 0)
+                queue.append(child)
+
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, user_agent: str) -> Bot | None:
+        delta, best_of = self._delta, self._best
+        best = best_of[0]
+        state = 0
+        for char in user_agent.lower():
+            state = delta[state].get(char, 0)
+            if best_of[state] < best:
+                best = best_of[state]
+                if best == 0:
+                    break
+        return self._bots[best] if best < len(self._bots) else None
+
+
+class GateFilter:
+    """Cheap pre-check for whether a path could need payment under a config.
+
+    ``may_gate`` is False only when no route pattern can match the path and
+    the path is not one of the exact endpoints (such as the MCP endpoint), so
+    such requests can skip every other payment step. Patterns without a
+    literal prefix make the filter pass everything.
+    """
+
+    def __init__(
+        self,
+        route_keys: Iterable[str],
+        exact_paths: Iterable[str],
+        normalize_path: Callable[[str], str],
+    ) -> None:
+        self._exact = frozenset(exact_paths)
+        self._normalize_path = normalize_path
+        self._match_all = False
+
+        by_length: dict[int, set[str]] = {}
+        for key in route_keys:
+            # Same verb/path split as FoldsetHTTPResourceServer._parse_route_pattern
+            parts = key.split(None, 1)
+            prefix = literal_prefix(parts[1] if len(parts) == 2 else key)
+            if not prefix:
+                self._match_all = True
+                break
+            by_length.setdefault(len(prefix), set()).add(prefix)
+        self._prefixes = sorted(by_length.items())
+
+    def may_gate(self, path: str) -> bool:
+        if self._match_all or path in self._exact:
+            return True
+        if not self._prefixes:
+            return False
+
+        normalized = self._normalize_path(path)
+        # Case-insensitive regex matching only agrees with str.lower() for ASCII
+        if not normalized.isascii():
+            return True
+
+        lowered = normalized.lower()
+        for length, prefixes in self._prefixes:
+            if length > len(lowered):
+                break
+            if lowered[:length] in prefixes:
+                return True
+        return False
+
+
+class HostIndex:
+    """Resolves a request hostname to the site config serving it.
+
+    Sites are keyed by host pattern: an exact hostname, ``*.example.com``
+    for any subdomain of example.com (the most specific wildcard wins), or
+    ``*`` for every host nothing else matches. A lookup is one dict probe
+    per label of the hostname, which may carry a port.
+    """
+
+    def __init__(self, sites: Iterable[tuple[str, Any]]) -> None:
+        self._sites: dict[str, Any] = {}
+        self._exact: dict[str, Any] = {}
+        self._wildcards: dict[str, Any] = {}
+        self._default: Any | None = None
+
+        for pattern, site in sites:
+            pattern = pattern.strip().lower().rstrip(".")
+            # The first site listed for a pattern wins
+            if pattern in self._sites:
+                continue
+            self._sites[pattern] = site
+            if pattern == "*":
+                self._default = site
+            elif pattern.startswith("*."):
+                self._wildcards[pattern[2:]] = site
+            else:
+                self._exact[pattern] = site
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    def get(self, pattern: str) -> Any | None:
+        """Return the site registered under exactly ``pattern``."""
+        return self._sites.get(pattern.strip().lower().rstrip("."))
+
+    def values(self) -> list[Any]:
+        return list(self._sites.values())
+
+    def lookup(self, host: str) -> Any | None:
+        site = self._exact.get(host)
+        if site is not None:
+            return site
+        host = host.lower()
+        if ":" in host:
+            # A Host header may still carry its port: "example.com:8080", "[::1]:8080"
+            name, _, port = host.rpartition(":")
+            if port.isdigit() and (":" not in name or name.endswith("]")):
+                host = name
+        host = host.rstrip(".")
+        site = self._exact.get(host)
+        if site is not None:
+            return site
+
+        if self._wildcards:
+            dot = host.find(".")
+            while dot != -1:
+                site = self._wildcards.get(host[dot + 1:])
+                if site is not None:
+                    return site
+                dot = host.find(".", dot + 1)
+        return self._default
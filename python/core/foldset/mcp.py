@@ -1,17 +1,18 @@
 from __future__ import annotations
 
-import asyncio
 import json
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any
 
 from x402.http import RouteConfig
 
+from .api import get_payment_error_cache, payment_methods_body, request_fields_json
 from .config import no_payment_required
 from .handler import handle_payment_request
 from .routes import RoutesConfig, build_route_entry, price_to_amount
 from .telemetry import log_event
 from .types import (
+    ConfigSnapshot,
     McpRestriction,
     PaymentMethod,
     ProcessRequestResult,
@@ -155,39 +156,34 @@ def get_mcp_list_payment_requirements(
     ]
 
 
-async def _format_mcp_payment_error(
-    core: WorkerCore,
+def _format_mcp_payment_error(
+    snapshot: ConfigSnapshot,
     result: ProcessRequestResult,
     rpc_id: str | int | None,
 ) -> None:
-    payment_methods, host_config = await asyncio.gather(
-        core.payment_methods.get(),
-        core.host_config.get(),
-    )
-
-    data: dict[str, Any] = {
-        "version": result.metadata.version,
-        "request_id": result.metadata.request_id,
-        "timestamp": result.metadata.timestamp,
-        "description": result.restriction.description if result.restriction else "",
-        "price": result.restriction.price if result.restriction else 0,
-    }
-    if host_config and host_config.terms_of_service_url:
-        data["terms_of_service_url"] = host_config.terms_of_service_url
-    data["payment_methods"] = [
-        {
-            "network": pm.caip2_id,
-            "asset": pm.contract_address,
-            "decimals": pm.decimals,
-            "pay_to": pm.circle_wallet_address,
-            "chain": pm.chain_display_name,
-            "asset_name": pm.asset_display_name,
+    payment_methods = snapshot.payment_methods
+    host_config = snapshot.host_config
+    restriction = result.restriction
+    terms_of_service_url = host_config.terms_of_service_url if host_config else None
+
+    def build() -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "description": restriction.description if restriction else "",
+            "price": restriction.price if restriction else 0,
         }
-        for pm in payment_methods
-    ]
-
-    result.response.body = json.dumps(
-        build_json_rpc_error(rpc_id, 402, "Payment required", data)
+        if terms_of_service_url:
+            data["terms_of_service_url"] = terms_of_service_url
+        data["payment_methods"] = payment_methods_body(payment_methods)
+        return data
+
+    # Same layout as build_json_rpc_error(rpc_id, 402, "Payment required", data)
+    static = get_payment_error_cache().fragment(
+        "mcp", restriction, payment_methods, terms_of_service_url, build
+    )
+    result.response.body = (
+        f'{{"jsonrpc": "2.0", "id": {json.dumps(rpc_id)}, '
+        f'"error": {{"code": 402, "message": "Payment required", '
+        f'"data": {{{request_fields_json(result)}, {static}}}}}'
     )
     result.response.headers["Content-Type"] = "application/json"
 
@@ -197,6 +193,7 @@ async def handle_mcp_request(
     adapter: RequestAdapter,
     mcp_endpoint: str,
     metadata: RequestMetadata,
+    snapshot: ConfigSnapshot,
 ) -> ProcessRequestResult:
     if adapter.get_method() != "POST":
         return no_payment_required(metadata)
@@ -208,13 +205,9 @@ async def handle_mcp_request(
 
     # List methods: pass through with payment requirements header
     if is_mcp_list_method(rpc.method):
-        restrictions, payment_methods, host_config = await asyncio.gather(
-            core.restrictions.get(),
-            core.payment_methods.get(),
-            core.host_config.get(),
-        )
+        host_config = snapshot.host_config
         requirements = get_mcp_list_payment_requirements(
-            rpc.method, restrictions, payment_methods
+            rpc.method, snapshot.restrictions, snapshot.payment_methods
         )
         headers: dict[str, str] = {}
         if requirements:
@@ -243,9 +236,9 @@ async def handle_mcp_request(
     if not route_key:
         return no_payment_required(metadata)
 
-    result = await handle_payment_request(core, adapter, metadata, route_key)
+    result = await handle_payment_request(core, adapter, metadata, snapshot, route_key)
 
     if result.type == "payment-error":
-        await _format_mcp_payment_error(core, result, rpc.id)
+        _format_mcp_payment_error(snapshot, result, rpc.id)
 
     return result
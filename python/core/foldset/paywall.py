@@ -1,13 +1,40 @@
 from __future__ import annotations
 
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 from .types import PaymentMethod, Restriction
 
+try:
+    import brotli
+except ImportError:  # Optional: pip install foldset[brotli]
+    brotli = None
+
+PAYWALL_TEMPLATE_CACHE_SIZE = 256
+PAYWALL_BODY_CACHE_SIZE = 1024
+
+# Stands in for the URL while rendering a template; cannot occur in a URL
+_URL_SLOT = "\x00url\x00"
+_ENCODING_SUFFIXES = {"gzip": "-gz", "br": "-br"}
+
 
 def generate_paywall_html(
     restriction: Restriction,
     payment_methods: list[PaymentMethod],
     url: str,
     terms_of_service_url: str | None = None,
+) -> str:
+    return _paywall_cache.template(restriction, payment_methods, terms_of_service_url).splice(url)
+
+
+def _render_paywall_html(
+    restriction: Restriction,
+    payment_methods: list[PaymentMethod],
+    url: str,
+    terms_of_service_url: str | None = None,
 ) -> str:
     # Group payment methods by network
     methods_by_network: dict[str, list[PaymentMethod]] = {}
@@ -104,3 +131,177 @@ def generate_paywall_html(
   </footer>
 </body>
 </html>"""
+
+
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted: set[str] = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class PaywallTemplate:
+    """A paywall page rendered once without its URL, split around the URL slot.
+
+    ``digest`` identifies the rendered template itself, so equal templates
+    built from different config objects share their cached pages.
+    """
+
+    __slots__ = ("prefix", "suffix", "digest")
+
+    def __init__(self, html: str) -> None:
+        self.prefix, _, self.suffix = html.partition(_URL_SLOT)
+        self.digest = hashlib.sha256(html.encode()).hexdigest()
+
+    def splice(self, url: str) -> str:
+        return f"{self.prefix}{url}{self.suffix}"
+
+
+class PaywallBody:
+    """One paywall page (template + URL) with lazily compressed variants and ETags.
+
+    The HTML is spliced from the template when read rather than stored per
+    URL. Compression is only worth it for pages that get requested again,
+    so ``encoding_for`` offers a content coding only from the page's second
+    request on; first requests are served uncompressed.
+
+    ETags are strong and differ per content coding, as each coding is its
+    own representation; ``matches`` compares If-None-Match weakly, so any
+    coding of the same page validates.
+    """
+
+    __slots__ = ("template", "url", "hits", "_digest", "_encoded", "_lock")
+
+    def __init__(self, template: PaywallTemplate, url: str) -> None:
+        self.template = template
+        self.url = url
+        self.hits = 0
+        self._digest = hashlib.sha256(f"{template.digest}\n{url}".encode()).hexdigest()[:32]
+        self._encoded: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def html(self) -> str:
+        return self.template.splice(self.url)
+
+    def encoding_for(self, accepted: str | None) -> str | None:
+        """The coding to send for a negotiated ``accepted`` coding."""
+        return accepted if self.hits > 1 else None
+
+    def etag(self, encoding: str | None = None) -> str:
+        return f'"{self._digest}{_ENCODING_SUFFIXES.get(encoding or "", "")}"'
+
+    def content(self, encoding: str | None = None) -> str | bytes:
+        if encoding is None:
+            return self.html
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            raw = self.html.encode()
+            if encoding == "br":
+                encoded = brotli.compress(raw, quality=5)
+            else:
+                encoded = gzip.compress(raw, compresslevel=6, mtime=0)
+            with self._lock:
+                self._encoded[encoding] = encoded
+        return encoded
+
+    def matches(self, if_none_match: str) -> bool:
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            tag = tag.removeprefix("W/").strip('"')
+            for suffix in _ENCODING_SUFFIXES.values():
+                tag = tag.removesuffix(suffix)
+            if tag == self._digest:
+                return True
+        return False
+
+
+class PaywallCache:
+    """Caches paywall templates and pages.
+
+    A template is rendered once per (restriction, payment methods, ToS URL),
+    looked up by object identity, since ConfigSnapshotManager keeps the same
+    objects while their config is unchanged. Pages are kept per (template
+    digest, URL) so repeat crawls reuse their ETags and compressed bodies.
+    Both caches are bounded LRUs.
+    """
+
+    def __init__(
+        self,
+        template_size: int = PAYWALL_TEMPLATE_CACHE_SIZE,
+        body_size: int = PAYWALL_BODY_CACHE_SIZE,
+    ) -> None:
+        self._template_size = template_size
+        self._body_size = body_size
+        self._templates: OrderedDict[tuple, tuple[object, object, PaywallTemplate]] = OrderedDict()
+        self._bodies: OrderedDict[tuple[str, str], PaywallBody] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def template(
+        self,
+        restriction: Restriction,
+        payment_methods: list[PaymentMethod],
+        terms_of_service_url: str | None = None,
+    ) -> PaywallTemplate:
+        key = (id(restriction), id(payment_methods), terms_of_service_url)
+        with self._lock:
+            entry = self._templates.get(key)
+            # The stored objects guard against a reused id()
+            if entry is not None and entry[0] is restriction and entry[1] is payment_methods:
+                self._templates.move_to_end(key)
+                return entry[2]
+
+        template = PaywallTemplate(
+            _render_paywall_html(restriction, payment_methods, _URL_SLOT, terms_of_service_url)
+        )
+        with self._lock:
+            self._templates[key] = (restriction, payment_methods, template)
+            while len(self._templates) > self._template_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def render(
+        self,
+        restriction: Restriction,
+        payment_methods: list[PaymentMethod],
+        url: str,
+        terms_of_service_url: str | None = None,
+    ) -> PaywallBody:
+        template = self.template(restriction, payment_methods, terms_of_service_url)
+        key = (template.digest, url)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                body = self._bodies[key] = PaywallBody(template, url)
+                while len(self._bodies) > self._body_size:
+                    self._bodies.popitem(last=False)
+            else:
+                self._bodies.move_to_end(key)
+            body.hits += 1
+        return body
+
+
+_paywall_cache = PaywallCache()
+
+
+def get_paywall_cache() -> PaywallCache:
+    return _paywall_cache
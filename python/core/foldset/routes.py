@@ -1,8 +1,16 @@
 from __future__ import annotations
 
-from x402.http import PaymentOption, RouteConfig
+from x402.http import PaymentOption, RouteConfig, x402HTTPResourceServer
 
-from .types import ApiRestriction, McpRestriction, PaymentMethod, Restriction
+from .matching import GateFilter
+from .types import (
+    ApiRestriction,
+    HostConfig,
+    McpRestriction,
+    PaymentMethod,
+    Restriction,
+    WebRestriction,
+)
 
 RoutesConfig = dict[str, RouteConfig]
 
@@ -41,6 +49,12 @@ def build_route_entry(
     return config
 
 
+def route_key(restriction: ApiRestriction | WebRestriction) -> str:
+    if isinstance(restriction, ApiRestriction) and restriction.http_method:
+        return f"{restriction.http_method.upper()} {restriction.path}"
+    return restriction.path
+
+
 def build_routes_config(
     restrictions: list[Restriction],
     payment_methods: list[PaymentMethod],
@@ -51,11 +65,20 @@ def build_routes_config(
     for r in restrictions:
         if isinstance(r, McpRestriction):
             continue
-        key = (
-            f"{r.http_method.upper()} {r.path}"
-            if isinstance(r, ApiRestriction) and r.http_method
-            else r.path
-        )
-        routes_config[key] = build_route_entry(r, payment_methods, terms_of_service_url)
+        routes_config[route_key(r)] = build_route_entry(r, payment_methods, terms_of_service_url)
 
     return routes_config
+
+
+def build_gate_filter(
+    host_config: HostConfig | None,
+    restrictions: list[Restriction],
+) -> GateFilter:
+    """Build the cheap "could this path need payment" check for a config."""
+    if not host_config:
+        return GateFilter([], [], x402HTTPResourceServer._normalize_path)
+    return GateFilter(
+        [route_key(r) for r in restrictions if not isinstance(r, McpRestriction)],
+        [host_config.mcp_endpoint] if host_config.mcp_endpoint else [],
+        x402HTTPResourceServer._normalize_path,
+    )
@@ -1,40 +1,65 @@
 from __future__ import annotations
 
-import asyncio
 import re
-import time
+import threading
+from collections import OrderedDict
+from collections.abc import Generator
+from typing import Any
 
 from x402 import x402ResourceServer
 from x402.http import (
+    HTTPFacilitatorClient,
     HTTPProcessResult,
     HTTPRequestContext,
     HTTPResponseInstructions,
     PaywallConfig,
+    RouteConfig,
+    RouteConfigurationError,
     x402HTTPResourceServer,
 )
+from x402.http.constants import PAYMENT_REQUIRED_HEADER
+from x402.http.utils import encode_payment_required_header
 from x402.mechanisms.evm.exact.register import register_exact_evm_server
 from x402.mechanisms.svm.exact.register import register_exact_svm_server
+from x402.schemas import VerifyResponse
 
-from .config import (
-    CACHE_TTL_MS,
-    FacilitatorManager,
-    HostConfigManager,
-    PaymentMethodsManager,
-    RestrictionsManager,
-)
+from .matching import RouteIndex
 from .mcp import build_mcp_routes_config
 from .routes import RoutesConfig, build_routes_config
-from .types import ConfigStore, HttpServerResult, Restriction
+from .settlement import SettledPayments
+from .types import ConfigSnapshot, HttpServerResult, RequestMetadata, Restriction
+
+PAYMENT_REQUIRED_CACHE_SIZE = 1024
 
 
 class FoldsetHTTPResourceServer(x402HTTPResourceServer):
     """x402HTTPResourceServer with Foldset-specific overrides.
 
     - Treats route patterns as raw regex (restrictions store regex paths)
+    - Matches routes through a RouteIndex shared by requires_payment and the
+      restriction lookup
     - Returns empty body on payment-required (body set later by api/web/mcp)
     - Attaches matched restriction to payment-error results
+    - Builds each route's payment requirements once and caches the encoded
+      PAYMENT-REQUIRED header per (route, URL, error); a new server is
+      built whenever routes change, so neither outlives its config
+    - Answers payloads in ``settled`` as invalid without asking the
+      facilitator, so a payment that already paid for a request cannot
+      pass for another
     """
 
+    def __init__(
+        self,
+        server: x402ResourceServer,
+        routes: RoutesConfig,
+        settled: SettledPayments | None = None,
+    ) -> None:
+        self._settled = settled if settled is not None else SettledPayments()
+        self._requirements: dict[int, tuple[object, list]] = {}
+        self._headers: OrderedDict[tuple, tuple[tuple[object, ...], str]] = OrderedDict()
+        self._headers_lock = threading.Lock()
+        super().__init__(server, routes)
+
     @staticmethod
     def _parse_route_pattern(pattern: str) -> tuple[str, re.Pattern[str]]:
         parts = pattern.split(None, 1)
@@ -46,6 +71,80 @@ class FoldsetHTTPResourceServer(x402HTTPResourceServer):
             path = pattern
         return verb, re.compile(path, re.IGNORECASE)
 
+    def _compile_routes(self, routes: RoutesConfig) -> None:
+        super()._compile_routes(routes)
+        self._route_index = RouteIndex(self._compiled_routes, self._normalize_path)
+
+    def _get_route_config(self, path: str, method: str) -> RouteConfig | None:
+        return self._route_index.lookup(path, method)
+
+    def get_restriction(self, path: str, method: str) -> Restriction | None:
+        route_config = self._get_route_config(path, method)
+        return getattr(route_config, "restriction", None) if route_config else None
+
+    async def _build_payment_requirements_from_options(self, options, context, timeout):
+        entry = self._requirements.get(id(options))
+        if entry is not None and entry[0] is options:
+            return entry[1]
+
+        requirements = await super()._build_payment_requirements_from_options(
+            options, context, timeout
+        )
+        # Foldset routes have static prices and pay-to addresses; anything
+        # resolved per request is left uncached.
+        static = options if isinstance(options, list) else [options]
+        if not any(callable(o.price) or callable(o.pay_to) for o in static):
+            self._requirements[id(options)] = (options, requirements)
+        return requirements
+
+    def _encode_payment_required(self, payment_required) -> str:
+        resource = payment_required.resource
+        if payment_required.extensions or resource is None:
+            return encode_payment_required_header(payment_required)
+
+        accepts = tuple(payment_required.accepts)
+        key = (
+            tuple(map(id, accepts)),
+            resource.url,
+            resource.description,
+            resource.mime_type,
+            payment_required.error,
+        )
+        with self._headers_lock:
+            entry = self._headers.get(key)
+            # The stored requirements guard against a reused id()
+            if entry is not None and all(a is b for a, b in zip(entry[0], accepts)):
+                self._headers.move_to_end(key)
+                return entry[1]
+
+        header = encode_payment_required_header(payment_required)
+        with self._headers_lock:
+            self._headers[key] = (accepts, header)
+            while len(self._headers) > PAYMENT_REQUIRED_CACHE_SIZE:
+                self._headers.popitem(last=False)
+        return header
+
+    def _process_request_core(
+        self, context: HTTPRequestContext, paywall_config: PaywallConfig | None
+    ) -> Generator[Any, Any, HTTPProcessResult]:
+        # Relays the base class's steps to the sync or async driver, except
+        # verifying a settled payload, which is answered here.
+        steps = super()._process_request_core(context, paywall_config)
+        send, value = steps.send, None
+        while True:
+            try:
+                phase, target, ctx = send(value)
+            except StopIteration as stop:
+                return stop.value
+            if phase == "verify_payment" and target[0] in self._settled:
+                send = steps.send
+                value = VerifyResponse(is_valid=False, invalid_reason="payment_already_settled")
+                continue
+            try:
+                send, value = steps.send, (yield phase, target, ctx)
+            except Exception as error:
+                send, value = steps.throw, error
+
     def _create_http_response(
         self,
         payment_required,
@@ -58,13 +157,10 @@ class FoldsetHTTPResourceServer(x402HTTPResourceServer):
 
         Body is set later by api.py, web.py, or mcp.py based on restriction type.
         """
-        from x402.http.utils import encode_payment_required_header
-        from x402.http.constants import PAYMENT_REQUIRED_HEADER
-
         return HTTPResponseInstructions(
             status=402,
             headers={
-                PAYMENT_REQUIRED_HEADER: encode_payment_required_header(payment_required),
+                PAYMENT_REQUIRED_HEADER: self._encode_payment_required(payment_required),
             },
             body="",
         )
@@ -73,18 +169,18 @@ class FoldsetHTTPResourceServer(x402HTTPResourceServer):
         self,
         context: HTTPRequestContext,
         paywall_config: PaywallConfig | None = None,
+        metadata: RequestMetadata | None = None,
     ) -> HttpServerResult:
         result = await self.process_http_request(context, paywall_config)
 
         restriction = None
         if result.type == "payment-error":
-            route_config = self._get_route_config(context.path, context.method)
-            if route_config:
-                restriction = getattr(route_config, "restriction", None)
+            restriction = self.get_restriction(context.path, context.method)
 
-        from .config import build_request_metadata
+        if metadata is None:
+            from .config import build_request_metadata
 
-        metadata = build_request_metadata()
+            metadata = build_request_metadata()
 
         return HttpServerResult(
             type=result.type,
@@ -96,52 +192,123 @@ class FoldsetHTTPResourceServer(x402HTTPResourceServer):
         )
 
 
+class _SiteServer:
+    __slots__ = ("snapshot", "server", "route_inputs")
+
+    def __init__(self) -> None:
+        self.snapshot: ConfigSnapshot | None = None
+        self.server: FoldsetHTTPResourceServer | None = None
+        self.route_inputs: tuple[object, ...] = ()
+
+
 class HttpServerManager:
-    def __init__(self, store: ConfigStore) -> None:
-        self._cached: FoldsetHTTPResourceServer | None = None
-        self._cache_timestamp: float = 0
-        self._host_config = HostConfigManager(store)
-        self._restrictions = RestrictionsManager(store)
-        self._payment_methods = PaymentMethodsManager(store)
-        self._facilitator = FacilitatorManager(store)
-
-    async def get(self) -> FoldsetHTTPResourceServer | None:
-        if self._cached and (time.time() * 1000 - self._cache_timestamp) < CACHE_TTL_MS:
-            return self._cached
-
-        host_config, restrictions, payment_methods, facilitator = await asyncio.gather(
-            self._host_config.get(),
-            self._restrictions.get(),
-            self._payment_methods.get(),
-            self._facilitator.get(),
-        )
+    """Builds the x402 HTTP server for a ConfigSnapshot.
+
+    ConfigSnapshotManager keeps the parsed object for every unchanged blob,
+    so inputs are fingerprinted by identity. Identical inputs reuse the
+    server as-is; a change that only touches routes (host config,
+    restrictions, payment methods) rebuilds just the route table on top of
+    the already-initialized x402ResourceServer, keeping the facilitator
+    client and its supported kinds.
+
+    Multi-site configs get one server per site (keyed by host pattern),
+    all sharing the same x402ResourceServer. ``prune`` drops the servers of
+    sites a new config no longer has.
+
+    Servers refuse to verify payloads in ``settled`` (see
+    FoldsetHTTPResourceServer).
+    """
+
+    def __init__(self, settled: SettledPayments | None = None) -> None:
+        self.settled = settled if settled is not None else SettledPayments()
+        self._sites: dict[str | None, _SiteServer] = {}
+        self._config: ConfigSnapshot | None = None
+        self._resource_server: x402ResourceServer | None = None
+        self._facilitator: HTTPFacilitatorClient | None = None
+
+    @property
+    def ready(self) -> bool:
+        """True once a server has been resolved for a config snapshot."""
+        return bool(self._sites)
+
+    def _get_resource_server(self, facilitator: HTTPFacilitatorClient) -> x402ResourceServer:
+        if self._resource_server is None or facilitator is not self._facilitator:
+            server = x402ResourceServer(facilitator)
+            register_exact_evm_server(server)
+            register_exact_svm_server(server)
+            server.initialize()
+            self._resource_server = server
+            self._facilitator = facilitator
+            for site in self._sites.values():
+                site.route_inputs = ()
+        return self._resource_server
+
+    def prune(self, config: ConfigSnapshot) -> None:
+        """Forget sites missing from ``config``, a top-level snapshot.
+
+        Only does work when ``config`` is a different snapshot from the last
+        call, so it is cheap to call on every request.
+        """
+        if config is self._config:
+            return
+        self._config = config
+        keep = {
+            site.host_config.host if site.host_config else None
+            for site in config.site_snapshots()
+        }
+        for key in list(self._sites):
+            if key not in keep:
+                self._sites.pop(key, None)
+
+    async def get(self, snapshot: ConfigSnapshot) -> FoldsetHTTPResourceServer | None:
+        host_config = snapshot.host_config
+        key = host_config.host if host_config else None
+        site = self._sites.get(key)
+        if site is not None and snapshot is site.snapshot:
+            return site.server
+        if site is None:
+            site = self._sites[key] = _SiteServer()
+
+        facilitator = snapshot.facilitator
 
         if not host_config or not facilitator:
+            site.server = None
+            site.snapshot = snapshot
             return None
 
-        server = x402ResourceServer(facilitator)
-        register_exact_evm_server(server)
-        register_exact_svm_server(server)
+        server = self._get_resource_server(facilitator)
 
-        content_routes = build_routes_config(
-            restrictions, payment_methods, host_config.terms_of_service_url
-        )
-        mcp_routes = (
-            build_mcp_routes_config(
-                restrictions,
-                payment_methods,
-                host_config.mcp_endpoint,
-                host_config.terms_of_service_url,
+        route_inputs = (host_config, snapshot.restrictions, snapshot.payment_methods)
+        if site.server is None or not _same_objects(route_inputs, site.route_inputs):
+            content_routes = build_routes_config(
+                snapshot.restrictions, snapshot.payment_methods, host_config.terms_of_service_url
             )
-            if host_config.mcp_endpoint
-            else {}
-        )
-        routes_config: RoutesConfig = {**content_routes, **mcp_routes}
+            mcp_routes = (
+                build_mcp_routes_config(
+                    snapshot.restrictions,
+                    snapshot.payment_methods,
+                    host_config.mcp_endpoint,
+                    host_config.terms_of_service_url,
+                )
+                if host_config.mcp_endpoint
+                else {}
+            )
+            routes_config: RoutesConfig = {**content_routes, **mcp_routes}
+
+            http_server = FoldsetHTTPResourceServer(server, routes_config, self.settled)
+            # Same as http_server.initialize() minus re-fetching facilitator
+            # support, which the shared resource server already holds.
+            errors = http_server._validate_route_configuration()
+            if errors:
+                raise RouteConfigurationError(errors)
+
+            site.server = http_server
+            site.route_inputs = route_inputs
+
+        site.snapshot = snapshot
 
-        http_server = FoldsetHTTPResourceServer(server, routes_config)
-        http_server.initialize()
+        return site.server
 
-        self._cached = http_server
-        self._cache_timestamp = time.time() * 1000
 
-        return self._cached
+def _same_objects(a: tuple[object, ...], b: tuple[object, ...]) -> bool:
+    return len(a) == len(b) and all(x is y for x, y in zip(a, b))
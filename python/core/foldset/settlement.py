@@ -0,0 +1,449 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator
+
+from x402.http import ProcessSettleResult
+from x402.schemas import PaymentPayload, PaymentRequirements
+
+from .coalesce import coalesce_key
+from .loop import cancel_task
+from .telemetry import get_event_pipeline
+from .types import EventPayload
+
+# How long a concurrent settlement waits to be joined before it is dropped
+SETTLEMENT_JOIN_TIMEOUT_S = 300.0
+SETTLEMENT_QUEUE_BATCH = 16
+SETTLEMENT_MAX_ATTEMPTS = 8
+SETTLEMENT_MAX_BACKOFF_S = 60.0
+# A claimed entry returns to the queue if its process dies mid-settlement
+SETTLEMENT_LEASE_S = 60.0
+SETTLEMENT_POLL_INTERVAL_S = 1.0
+SETTLED_PAYMENTS_SIZE = 65536
+
+SettleFn = Callable[[str, Any, Any], Awaitable[ProcessSettleResult]]
+
+_END = object()
+
+
+def default_data_dir() -> str:
+    """Per-user directory for Foldset state that has to survive restarts.
+
+    ``$FOLDSET_DATA_DIR`` if set, else ``foldset`` under ``%LOCALAPPDATA%``
+    on Windows or ``$XDG_STATE_HOME`` (``~/.local/state``) elsewhere.
+    """
+    override = os.environ.get("FOLDSET_DATA_DIR")
+    if override:
+        return override
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_STATE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".local", "state"
+        )
+    return os.path.join(base, "foldset")
+
+
+def default_settlement_queue_path(api_key: str) -> str:
+    """A settlement queue file of this API key's own in ``default_data_dir()``.
+
+    Creates the directory, readable by the owner only. Raises OSError when it
+    cannot be created; pass ``settlement_queue_path`` explicitly then.
+    """
+    directory = default_data_dir()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return os.path.join(directory, f"settlements-{digest}.sqlite3")
+
+
+class SettlementError(Exception):
+    """Raised from a streamed body to abort it when settlement fails."""
+
+
+def prepend_chunks(
+    head: list[bytes], chunks: Iterator[bytes], source: Iterable[bytes]
+) -> Iterator[bytes]:
+    """Yield ``head`` and then the rest of ``chunks``, closing ``source`` at the end."""
+    try:
+        yield from head
+        yield from chunks
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+
+
+async def aprepend_chunks(head: list[bytes], chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    try:
+        for chunk in head:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def settle_before_last(chunks: Iterable[bytes], settle: Callable[[], bool]) -> Iterator[bytes]:
+    """Stream ``chunks``, calling ``settle`` before the last one is released.
+
+    Holds back one chunk at a time (never the whole body), so a failed
+    settlement withholds the end of the body and aborts the response with
+    SettlementError instead of completing it.
+    """
+    try:
+        iterator = iter(chunks)
+        held = next(iterator, _END)
+        for chunk in iterator:
+            yield held  # type: ignore[misc]
+            held = chunk
+        if not settle():
+            raise SettlementError("Settlement failed")
+        if held is not _END:
+            yield held  # type: ignore[misc]
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+async def asettle_before_last(
+    chunks: AsyncIterable[bytes], settle: Callable[[], Awaitable[bool]]
+) -> AsyncIterator[bytes]:
+    """Async version of settle_before_last."""
+    iterator = aiter(chunks)
+    try:
+        held = await anext(iterator, _END)
+        async for chunk in iterator:
+            yield held  # type: ignore[misc]
+            held = chunk
+        if not await settle():
+            raise SettlementError("Settlement failed")
+        if held is not _END:
+            yield held  # type: ignore[misc]
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class PendingSettlements:
+    """Settlements started at verification time, joined by request id."""
+
+    def __init__(self, timeout_s: float = SETTLEMENT_JOIN_TIMEOUT_S) -> None:
+        self._timeout_s = timeout_s
+        self._pending: dict[str, concurrent.futures.Future[ProcessSettleResult]] = {}
+        # The loop only holds weak references to running tasks
+        self._tasks: set[asyncio.Task[ProcessSettleResult]] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self, request_id: str, coro: Awaitable[ProcessSettleResult]) -> None:
+        loop = asyncio.get_running_loop()
+        # A concurrent future can be awaited from whichever loop joins it
+        future: concurrent.futures.Future[ProcessSettleResult] = concurrent.futures.Future()
+        self._pending[request_id] = future
+
+        def done(task: asyncio.Task[ProcessSettleResult]) -> None:
+            self._tasks.discard(task)
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())  # type: ignore[arg-type]
+            else:
+                future.set_result(task.result())
+
+        task = loop.create_task(coro)  # type: ignore[arg-type]
+        self._tasks.add(task)
+        task.add_done_callback(done)
+        loop.call_later(self._timeout_s, self._expire, request_id, future)
+
+    def _expire(self, request_id: str, future: concurrent.futures.Future) -> None:
+        if self._pending.get(request_id) is future:
+            del self._pending[request_id]
+
+    async def join(self, request_id: str) -> ProcessSettleResult | None:
+        """Wait for the settlement started for ``request_id``, if any."""
+        future = self._pending.pop(request_id, None)
+        if future is None:
+            return None
+        return await asyncio.wrap_future(future)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._tasks = set()
+
+
+class SettledPayments:
+    """Payloads this process settled (or queued to settle), until they expire.
+
+    A settled payload cannot pay for another request, but the facilitator
+    may still verify its signature as valid. Verification checks here first
+    so a replayed payment header gets a 402 instead of the resource.
+    Entries last for the requirements' ``max_timeout_seconds``, after which
+    the authorization can no longer be settled anyway. At capacity the
+    oldest entries go first; a replay of one of those still fails when the
+    facilitator refuses to settle it twice.
+    """
+
+    def __init__(self, size: int = SETTLED_PAYMENTS_SIZE) -> None:
+        self._size = size
+        self._expires: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(payment_payload: Any) -> str:
+        return coalesce_key(payment_payload.model_dump_json(by_alias=True))
+
+    def add(self, payment_payload: Any, ttl_s: float) -> None:
+        key = self._key(payment_payload)
+        now = time.monotonic()
+        with self._lock:
+            self._expires.pop(key, None)
+            self._expires[key] = now + ttl_s
+            while self._expires and (
+                len(self._expires) > self._size or next(iter(self._expires.values())) <= now
+            ):
+                self._expires.popitem(last=False)
+
+    def __contains__(self, payment_payload: Any) -> bool:
+        key = self._key(payment_payload)
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires > time.monotonic():
+                return True
+            del self._expires[key]
+            return False
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires.clear()
+
+
+@dataclasses.dataclass
+class _QueuedSettlement:
+    id: int
+    host: str
+    payload: str
+    requirements: str
+    event: str
+    attempts: int
+    expires: float
+
+
+class SettlementQueue:
+    """Durable local queue of deferred settlements, backed by SQLite.
+
+    Entries are tagged with their tenant, so tenants can share one file and
+    only ever drain their own entries. ``tenant`` starts as a hash of the API
+    key; WorkerCore sets it to the Redis tenant id once credentials are
+    known, so a rotated API key still drains its tenant's entries. A process
+    claims a batch with a lease before settling it, so the
+    processes on a host never settle the same entry at once, and entries
+    held by a process that died are picked up once the lease lapses. The
+    facilitator rejects an authorization that was already settled, so a
+    retry after an ambiguous failure cannot charge twice.
+
+    Each entry carries the telemetry event of its request, sent once the
+    entry settles (with the PAYMENT-RESPONSE) or is given up on (as a 402).
+    """
+
+    def __init__(self, path: str, api_key: str, settle: SettleFn) -> None:
+        self.path = path
+        self.tenant = hashlib.sha256(api_key.encode()).hexdigest()
+        self._api_key = api_key
+        self._settle = settle
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._task: asyncio.Task[None] | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # Connections and tasks do not survive a fork
+            self._db = None
+            self._task = None
+            self._pid = os.getpid()
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS settlements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    requirements TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    expires REAL NOT NULL,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )"""
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS settlements_due"
+                " ON settlements (tenant, next_attempt)"
+            )
+            self._db = db
+        return self._db
+
+    def _execute(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._db_lock:
+            return fn(self._connect())
+
+    def _insert(self, host: str, payload: str, requirements: str, event: str, expires: float) -> None:
+        self._execute(
+            lambda db: db.execute(
+                "INSERT INTO settlements"
+                " (tenant, host, payload, requirements, event, next_attempt, expires)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.tenant, host, payload, requirements, event, time.time(), expires),
+            )
+        )
+
+    def _claim(self, limit: int) -> list[_QueuedSettlement]:
+        def claim(db: sqlite3.Connection) -> list[_QueuedSettlement]:
+            now = time.time()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    "SELECT id, host, payload, requirements, event, attempts, expires"
+                    " FROM settlements WHERE tenant = ? AND next_attempt <= ?"
+                    " AND claimed_until <= ? ORDER BY id LIMIT ?",
+                    (self.tenant, now, now, limit),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE settlements SET claimed_until = ? WHERE id = ?",
+                    [(now + SETTLEMENT_LEASE_S, row[0]) for row in rows],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return [_QueuedSettlement(*row) for row in rows]
+
+        return self._execute(claim)
+
+    def _next_due(self) -> float | None:
+        row = self._execute(
+            lambda db: db.execute(
+                "SELECT MIN(MAX(next_attempt, claimed_until)) FROM settlements"
+                " WHERE tenant = ?",
+                (self.tenant,),
+            ).fetchone()
+        )
+        return row[0]
+
+    def _delete(self, entry_id: int) -> None:
+        self._execute(lambda db: db.execute("DELETE FROM settlements WHERE id = ?", (entry_id,)))
+
+    def _reschedule(self, entry_id: int, attempts: int, next_attempt: float) -> None:
+        self._execute(
+            lambda db: db.execute(
+                "UPDATE settlements SET attempts = ?, next_attempt = ?, claimed_until = 0"
+                " WHERE id = ?",
+                (attempts, next_attempt, entry_id),
+            )
+        )
+
+    def __len__(self) -> int:
+        return self._execute(
+            lambda db: db.execute(
+                "SELECT COUNT(*) FROM settlements WHERE tenant = ?", (self.tenant,)
+            ).fetchone()[0]
+        )
+
+    async def enqueue(
+        self,
+        host: str,
+        payment_payload: PaymentPayload,
+        payment_requirements: PaymentRequirements,
+        event: EventPayload,
+    ) -> None:
+        """Durably record a settlement, then make sure the queue is draining."""
+        await asyncio.to_thread(
+            self._insert,
+            host,
+            payment_payload.model_dump_json(by_alias=True),
+            payment_requirements.model_dump_json(by_alias=True),
+            json.dumps(dataclasses.asdict(event)),
+            time.time() + payment_requirements.max_timeout_seconds,
+        )
+        self.start()
+
+    def start(self) -> None:
+        """Drain the queue on the running loop unless it is already draining."""
+        if self._pid != os.getpid():
+            self._task = None
+        task = self._task
+        if task is not None and not task.done() and not task.get_loop().is_closed():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    def close(self) -> None:
+        """Stop draining and close the database. Queued entries stay on disk.
+
+        An entry being settled when the drain is cancelled keeps its lease
+        and is retried once it lapses.
+        """
+        task, self._task = self._task, None
+        if task is not None and self._pid == os.getpid():
+            cancel_task(task)
+        with self._db_lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    async def _drain(self) -> None:
+        while True:
+            entries = await asyncio.to_thread(self._claim, SETTLEMENT_QUEUE_BATCH)
+            if entries:
+                await asyncio.gather(*(self._process(entry) for entry in entries))
+                continue
+
+            due = await asyncio.to_thread(self._next_due)
+            if due is None:
+                return
+            await asyncio.sleep(min(max(due - time.time(), 0.0), SETTLEMENT_POLL_INTERVAL_S))
+
+    async def _process(self, entry: _QueuedSettlement) -> None:
+        try:
+            result = await self._settle(
+                entry.host,
+                PaymentPayload.model_validate_json(entry.payload),
+                PaymentRequirements.model_validate_json(entry.requirements),
+            )
+        except Exception as error:
+            result = ProcessSettleResult(success=False, error_reason=str(error))
+
+        event = EventPayload(**json.loads(entry.event))
+        attempts = entry.attempts + 1
+        if result.success:
+            event.payment_response = result.headers.get("PAYMENT-RESPONSE")
+        elif attempts < SETTLEMENT_MAX_ATTEMPTS and time.time() < entry.expires:
+            backoff = min(2.0**attempts, SETTLEMENT_MAX_BACKOFF_S)
+            await asyncio.to_thread(self._reschedule, entry.id, attempts, time.time() + backoff)
+            return
+        else:
+            event.status_code = 402
+
+        await asyncio.to_thread(self._delete, entry.id)
+        get_event_pipeline().submit(self._api_key, event)
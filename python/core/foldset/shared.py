@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .config import CACHE_MAX_STALE_MS, CACHE_TTL_MS, CONFIG_VERSION_KEY
+from .types import ConfigStore
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+SHARED_FORMAT = 1
+
+
+class _SharedData:
+    __slots__ = ("stat_key", "timestamp", "digest", "polled", "values")
+
+    def __init__(
+        self,
+        stat_key: tuple[int, int, int],
+        timestamp: float,
+        digest: str,
+        polled: bool,
+        values: dict[str, str | None],
+    ) -> None:
+        self.stat_key = stat_key
+        self.timestamp = timestamp
+        self.digest = digest
+        # Whether the values carry a tenant-published CONFIG_VERSION_KEY
+        self.polled = polled
+        self.values = values
+
+
+def _digest(values: dict[str, str | None]) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+class SharedConfigStore:
+    """ConfigStore that lets the processes on one host share a single poller.
+
+    Config is kept in a file next to a lock file. Whichever process first
+    finds the file older than ``CACHE_TTL_MS`` and wins a non-blocking
+    ``flock`` becomes the refresher for that round: it reads the store it
+    wraps (polling just CONFIG_VERSION_KEY when the tenant publishes one)
+    and replaces the file atomically. Every other process reads the file,
+    so Upstash sees one poller per host instead of one per worker.
+
+    Readers only re-read the file when its stat changes, and keep their
+    parsed values (same dict) while the content digest is unchanged. When
+    the tenant has no CONFIG_VERSION_KEY, the digest is served in its place,
+    so ConfigSnapshotManager in every worker uses its cheap version check
+    and only rebuilds routes when config actually changed.
+
+    Falls back to the wrapped store when the file is unusable and no other
+    process is refreshing it, or when ``fcntl`` is unavailable.
+
+    Only the ``stat`` runs on the event loop; reading and parsing a changed
+    file, taking the lock and the fsync'd write run in ``asyncio.to_thread``.
+    """
+
+    def __init__(
+        self,
+        store: ConfigStore,
+        path: str,
+        ttl_ms: int = CACHE_TTL_MS,
+        max_stale_ms: int = CACHE_MAX_STALE_MS,
+    ) -> None:
+        self._store = store
+        self.path = path
+        self._lock_path = f"{path}.lock"
+        self._ttl_ms = ttl_ms
+        self._max_stale_ms = max(max_stale_ms, ttl_ms)
+        self._data: _SharedData | None = None
+
+    def _load_file(self) -> dict:
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _read(self) -> _SharedData | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        stat_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        data = self._data
+        if data is not None and data.stat_key == stat_key:
+            return data
+
+        try:
+            raw = await asyncio.to_thread(self._load_file)
+            if raw.get("format") != SHARED_FORMAT:
+                return None
+            digest = raw["digest"]
+            values = (
+                data.values if data is not None and data.digest == digest else raw["values"]
+            )
+            self._data = _SharedData(stat_key, raw["timestamp"], digest, raw["polled"], values)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return self._data
+
+    def _write(self, values: dict[str, str | None], polled: bool) -> None:
+        body = {
+            "format": SHARED_FORMAT,
+            "timestamp": time.time() * 1000,
+            "digest": _digest(values),
+            "polled": polled,
+            "values": values,
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".foldset-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(body, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _try_lock(self) -> int | None:
+        """Return a locked file descriptor if this process won the refresh."""
+        try:
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _age_ms(self, data: _SharedData) -> float:
+        return time.time() * 1000 - data.timestamp
+
+    async def _fetch(self, keys: list[str], current: _SharedData | None) -> dict[str, str | None]:
+        if current is not None and current.polled:
+            version = await self._store.get(CONFIG_VERSION_KEY)
+            if version == current.values.get(CONFIG_VERSION_KEY):
+                return current.values
+
+        keys = list(dict.fromkeys([CONFIG_VERSION_KEY, *keys]))
+        return dict(zip(keys, await self._store.get_many(keys)))
+
+    async def _values(self, keys: list[str]) -> dict[str, str | None]:
+        if fcntl is None:
+            return dict(zip(keys, await self._store.get_many(keys)))
+
+        data = await self._read()
+        covered = data is not None and all(key in data.values for key in keys)
+        if data is not None and covered and self._age_ms(data) < self._ttl_ms:
+            return data.values
+
+        fd = await asyncio.to_thread(self._try_lock)
+        if fd is not None:
+            try:
+                # Another process may have refreshed while we were checking
+                data = await self._read()
+                covered = data is not None and all(key in data.values for key in keys)
+                if data is not None and covered and self._age_ms(data) < self._ttl_ms:
+                    return data.values
+
+                wanted = [*(data.values if data is not None else ()), *keys]
+                values = await self._fetch(wanted, data if covered else None)
+                polled = values.get(CONFIG_VERSION_KEY) is not None
+                try:
+                    await asyncio.to_thread(self._write, values, polled)
+                except OSError:
+                    return values
+                # Hand out the same dict other calls get from the file
+                data = await self._read()
+                return data.values if data is not None and data.values == values else values
+            finally:
+                os.close(fd)
+
+        # Someone else is refreshing; the previous file is still good to serve
+        if data is not None and covered and self._age_ms(data) < self._max_stale_ms:
+            return data.values
+        return dict(zip(keys, await self._store.get_many(keys)))
+
+    def _version(self, values: dict[str, str | None]) -> str | None:
+        version = values.get(CONFIG_VERSION_KEY)
+        if version is not None:
+            return version
+        data = self._data
+        return data.digest if data is not None and data.values is values else None
+
+    async def get(self, key: str) -> str | None:
+        values = await self._values([key])
+        if key == CONFIG_VERSION_KEY:
+            return self._version(values)
+        return values.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        values = await self._values(keys)
+        return [
+            self._version(values) if key == CONFIG_VERSION_KEY else values.get(key)
+            for key in keys
+        ]
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+from .types import RedisCredentials
+
+SNAPSHOT_FORMAT = 1
+
+
+@dataclass
+class SavedSnapshot:
+    credentials: RedisCredentials | None
+    raws: dict[str, str | None]
+    version: str | None
+    timestamp: float
+
+
+class SnapshotFile:
+    """Local file holding Redis credentials and the last good config blobs.
+
+    Lets a new process start gating straight from disk instead of calling
+    the control API and Upstash first. The file is bound to the API key it
+    was written for, written atomically (temp file + rename) and readable by
+    the owner only, since it contains the Redis token.
+
+    Reads and writes never raise: a missing, corrupt or foreign file is just
+    ignored and the process falls back to a normal cold start.
+    """
+
+    def __init__(self, path: str, api_key: str) -> None:
+        self.path = path
+        self._key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        self.credentials: RedisCredentials | None = None
+
+    def load(self) -> SavedSnapshot | None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != SNAPSHOT_FORMAT or data.get("api_key_hash") != self._key_hash:
+                return None
+            credentials = data.get("credentials")
+            return SavedSnapshot(
+                credentials=RedisCredentials(**credentials) if credentials else None,
+                raws=dict(data.get("config") or {}),
+                version=data.get("version"),
+                timestamp=data.get("timestamp") or 0,
+            )
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def save(self, raws: dict[str, str | None], version: str | None) -> None:
+        credentials = self.credentials
+        data = {
+            "format": SNAPSHOT_FORMAT,
+            "api_key_hash": self._key_hash,
+            "credentials": (
+                {
+                    "url": credentials.url,
+                    "token": credentials.token,
+                    "tenant_id": credentials.tenant_id,
+                }
+                if credentials
+                else None
+            ),
+            "version": version,
+            "timestamp": time.time() * 1000,
+            "config": raws,
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".foldset-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import threading
+import weakref
+
 import httpx
 from upstash_redis import AsyncRedis
 
@@ -27,18 +32,87 @@ async def fetch_redis_credentials(api_key: str) -> RedisCredentials:
     )
 
 
+# Upstash clients by event loop, then by (url, token): tenants on one
+# database share its HTTP connection pool. Like PooledAsyncClient, each loop
+# gets its own, as a client's connections belong to the loop that opened them.
+_redis_clients: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple[str, str], AsyncRedis]
+] = weakref.WeakKeyDictionary()
+_redis_clients_lock = threading.Lock()
+
+
+def _get_redis_client(url: str, token: str) -> AsyncRedis:
+    """Return the running loop's client for ``url`` and ``token``."""
+    loop = asyncio.get_running_loop()
+    with _redis_clients_lock:
+        clients = _redis_clients.get(loop)
+        if clients is None:
+            clients = _redis_clients[loop] = {}
+        client = clients.get((url, token))
+        if client is None:
+            client = clients[(url, token)] = AsyncRedis(url=url, token=token)
+    return client
+
+
+def _reset_redis_clients() -> None:
+    global _redis_clients_lock
+    _redis_clients.clear()
+    _redis_clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked child must not reuse the parent's connections
+    os.register_at_fork(after_in_child=_reset_redis_clients)
+
+
 class RedisConfigStore:
     def __init__(self, credentials: RedisCredentials) -> None:
-        self._redis = AsyncRedis(url=credentials.url, token=credentials.token)
+        self._credentials = credentials
         self._prefix = credentials.tenant_id
 
+    @property
+    def _redis(self) -> AsyncRedis:
+        # Looked up per call: the store is shared by every loop driving its core
+        return _get_redis_client(self._credentials.url, self._credentials.token)
+
     async def get(self, key: str) -> str | None:
-        result = await self._redis.get(f"{self._prefix}:{key}")
-        if result is None:
-            return None
-        if isinstance(result, bytes):
-            return result.decode()
-        return str(result)
+        return _decode(await self._redis.get(f"{self._prefix}:{key}"))
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        """Fetch several keys in a single MGET round trip."""
+        if not keys:
+            return []
+        results = await self._redis.mget(*(f"{self._prefix}:{key}" for key in keys))
+        return [_decode(result) for result in results]
+
+
+class RedisGrantCounter:
+    """Counts prepaid grant uses in the tenant's Redis, shared by every process."""
+
+    def __init__(self, credentials: RedisCredentials) -> None:
+        self._credentials = credentials
+
+    def reserve(self, grant_id: str, expires: int) -> bool:
+        # Keys expire in Redis on their own, so there is always room
+        return True
+
+    async def increment(self, grant_id: str, expires: int) -> int:
+        credentials = self._credentials
+        key = f"{credentials.tenant_id}:grant:{grant_id}"
+        # Looked up per call, for the running loop and a forked child's own connections
+        pipeline = _get_redis_client(credentials.url, credentials.token).pipeline()
+        pipeline.incr(key)
+        pipeline.expireat(key, expires)
+        count, _ = await pipeline.exec()
+        return int(count)
+
+
+def _decode(result: object) -> str | None:
+    if result is None:
+        return None
+    if isinstance(result, bytes):
+        return result.decode()
+    return str(result)
 
 
 def create_redis_store(credentials: RedisCredentials) -> ConfigStore:
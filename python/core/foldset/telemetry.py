@@ -1,8 +1,14 @@
 from __future__ import annotations
 
-import json
+import atexit
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
 import traceback
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 from urllib.parse import urlparse
 
 import httpx
@@ -18,6 +24,17 @@ JSON_HEADERS = {
     "Accept": "application/json",
 }
 
+EVENT_QUEUE_SIZE = 10_000
+EVENT_BATCH_SIZE = 100
+EVENT_FLUSH_INTERVAL_S = 1.0
+EVENT_MAX_ATTEMPTS = 3
+# Posts in flight at once while a batch is sent
+EVENT_SEND_CONCURRENCY = 16
+
+logger = logging.getLogger(__name__)
+
+_QueuedEvent = tuple[str, dict[str, Any], int]
+
 
 def build_event_payload(
     adapter: RequestAdapter,
@@ -44,30 +61,214 @@ def build_event_payload(
     return payload
 
 
+def _event_body(payload: EventPayload) -> dict[str, Any]:
+    return {
+        "method": payload.method,
+        "status_code": payload.status_code,
+        "user_agent": payload.user_agent,
+        "referer": payload.referer,
+        "href": payload.href,
+        "hostname": payload.hostname,
+        "pathname": payload.pathname,
+        "search": payload.search,
+        "ip_address": payload.ip_address,
+        "request_id": payload.request_id,
+        "payment_response": payload.payment_response,
+    }
+
+
 async def send_event(api_key: str, payload: EventPayload) -> None:
     try:
         async with httpx.AsyncClient() as client:
             await client.post(
                 f"{API_BASE_URL}/v1/events",
                 headers={"Authorization": f"Bearer {api_key}", **JSON_HEADERS},
-                json={
-                    "method": payload.method,
-                    "status_code": payload.status_code,
-                    "user_agent": payload.user_agent,
-                    "referer": payload.referer,
-                    "href": payload.href,
-                    "hostname": payload.hostname,
-                    "pathname": payload.pathname,
-                    "search": payload.search,
-                    "ip_address": payload.ip_address,
-                    "request_id": payload.request_id,
-                    "payment_response": payload.payment_response,
-                },
+                json=_event_body(payload),
             )
     except Exception:
         pass
 
 
+class EventPipeline:
+    """Bounded in-process event queue drained in batches by a background thread.
+
+    Events are posted to ``/v1/events`` over one pooled keep-alive HTTP
+    client, a batch at a time, flushed when ``batch_size`` events are waiting
+    or ``flush_interval`` seconds have passed. A batch's posts run
+    ``concurrency`` at a time, so sending it takes a few round trips rather
+    than one per event. Only 2xx responses count as ``sent``. Events that
+    fail with a network error, 429 or 5xx are requeued up to
+    ``EVENT_MAX_ATTEMPTS`` times; other failures are logged and counted in
+    ``failed``. When the queue is full new events are dropped and counted in
+    ``dropped``. Remaining events are flushed on interpreter shutdown.
+
+    The worker thread starts on the first event and restarts after a fork,
+    so pre-fork servers get one worker per process.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = EVENT_QUEUE_SIZE,
+        batch_size: int = EVENT_BATCH_SIZE,
+        flush_interval: float = EVENT_FLUSH_INTERVAL_S,
+        concurrency: int = EVENT_SEND_CONCURRENCY,
+    ) -> None:
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._concurrency = concurrency
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._pid = 0
+        self._queue: queue.Queue[_QueuedEvent | None] = queue.Queue(max_queue)
+        self._closing = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._client: httpx.Client | None = None
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self.dropped = 0
+        self.failed = 0
+        self.sent = 0
+        atexit.register(self.close)
+
+    def _ensure_worker(self) -> None:
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # After a fork the parent's worker thread does not exist here
+            self._queue = queue.Queue(self._max_queue)
+            self._closing = threading.Event()
+            self._client = httpx.Client(
+                headers=JSON_HEADERS,
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self._concurrency,
+                    max_keepalive_connections=self._concurrency,
+                ),
+            )
+            self._executor = None
+            self._thread = threading.Thread(
+                target=self._run, name="foldset-events", daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, api_key: str, payload: EventPayload) -> None:
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((api_key, _event_body(payload), 0))
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self) -> list[_QueuedEvent]:
+        try:
+            first = self._queue.get(timeout=self._flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first] if first else []
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._batch_size and not self._closing.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item:
+                batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._send(batch)
+            if self._closing.is_set() and self._queue.empty():
+                return
+
+    def _send(self, batch: list[_QueuedEvent]) -> None:
+        """Post a batch, ``concurrency`` events at a time, and wait for all of them."""
+        if self._executor is None:
+            # Only the worker thread sends, so this needs no lock
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                self._concurrency, thread_name_prefix="foldset-events-send"
+            )
+        for _ in self._executor.map(self._post, batch):
+            pass
+
+    def _post(self, item: _QueuedEvent) -> None:
+        assert self._client is not None
+        api_key, event, attempts = item
+        try:
+            response = self._client.post(
+                f"{API_BASE_URL}/v1/events",
+                headers={"Authorization": f"Bearer {api_key}"},
+                json=event,
+            )
+        except Exception as error:
+            self._failed(api_key, event, attempts, retry=True, reason=repr(error))
+            return
+        if response.is_success:
+            with self._counts_lock:
+                self.sent += 1
+        else:
+            retry = response.status_code == 429 or response.status_code >= 500
+            self._failed(
+                api_key, event, attempts, retry=retry, reason=f"HTTP {response.status_code}"
+            )
+
+    def _failed(
+        self,
+        api_key: str,
+        event: dict[str, Any],
+        attempts: int,
+        retry: bool,
+        reason: str,
+    ) -> None:
+        if retry and attempts + 1 < EVENT_MAX_ATTEMPTS:
+            try:
+                self._queue.put_nowait((api_key, event, attempts + 1))
+                return
+            except queue.Full:
+                pass
+        with self._counts_lock:
+            self.failed += 1
+        logger.warning(
+            "foldset: dropping event %s after %d attempt(s): %s",
+            event.get("request_id"),
+            attempts + 1,
+            reason,
+        )
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued events and stop the worker."""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._closing.set()
+        try:
+            # Wake the worker if it is waiting on an empty queue
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._client is not None:
+            self._client.close()
+        self._thread = None
+
+
+_pipeline = EventPipeline()
+
+
+def get_event_pipeline() -> EventPipeline:
+    return _pipeline
+
+
 async def report_error(
     api_key: str,
     error: BaseException,
@@ -106,4 +307,4 @@ async def log_event(
     payment_response: str | None = None,
 ) -> None:
     payload = build_event_payload(adapter, status_code, request_id, payment_response)
-    await send_event(core.api_key, payload)
+    _pipeline.submit(core.api_key, payload)
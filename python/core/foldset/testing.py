@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import os
+from typing import TYPE_CHECKING, Any
+
+from x402.schemas import SettleResponse, SupportedKind, SupportedResponse, VerifyResponse
+
+from . import config as foldset_config
+from . import telemetry
+from .types import RequestAdapter
+
+if TYPE_CHECKING:
+    from . import WorkerCore
+
+NETWORK = "eip155:8453"
+
+# A single-site config with one restriction of each type, gated for GPTBot
+CONFIG: dict[str, Any] = {
+    "host-config": {
+        "host": "example.com",
+        "apiProtectionMode": "bots",
+        "mcpEndpoint": "/mcp",
+    },
+    "restrictions": [
+        {"type": "web", "description": "Articles", "price": 0.01, "scheme": "exact", "path": "/articles/"},
+        {"type": "api", "description": "Data", "price": 0.05, "scheme": "exact", "path": "^/api/data$"},
+        {"type": "api", "description": "Other", "price": 0.05, "scheme": "exact", "path": "^/api/other$"},
+        {"type": "mcp", "description": "Tool", "price": 0.02, "scheme": "exact", "method": "tools/call", "name": "search"},
+    ],
+    "payment-methods": [
+        {
+            "caip2_id": NETWORK,
+            "decimals": 6,
+            "contract_address": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+            "circle_wallet_address": "0x000000000000000000000000000000000000dEaD",
+            "chain_display_name": "Base",
+            "asset_display_name": "USDC",
+            "extra": {"name": "USD Coin", "version": "2"},
+        }
+    ],
+    "bots": [{"user_agent": "GPTBot"}],
+    "facilitator": {"url": "https://facilitator.example"},
+}
+
+
+class FakeFacilitator:
+    """Facilitator that accepts every payment and counts its calls."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.verify_calls = 0
+        self.settle_calls = 0
+        self.settle_error: str | None = None
+
+    def get_supported(self) -> SupportedResponse:
+        return SupportedResponse(
+            kinds=[SupportedKind(x402_version=2, scheme="exact", network=NETWORK)],
+            extensions=[],
+            signers={},
+        )
+
+    async def verify(self, payload: Any, requirements: Any) -> VerifyResponse:
+        self.verify_calls += 1
+        await asyncio.sleep(0.01)
+        return VerifyResponse(is_valid=True, payer="0xabc")
+
+    async def settle(self, payload: Any, requirements: Any) -> SettleResponse:
+        self.settle_calls += 1
+        await asyncio.sleep(0.01)
+        if self.settle_error:
+            return SettleResponse(
+                success=False, error_reason=self.settle_error, network=NETWORK, transaction=""
+            )
+        return SettleResponse(success=True, transaction="0xtx", network=NETWORK, payer="0xabc")
+
+
+class MemoryStore:
+    """ConfigStore over a dict of JSON blobs, recording every lookup."""
+
+    def __init__(self, data: dict[str, Any] | None = None) -> None:
+        self.data = {key: json.dumps(value) for key, value in (data or CONFIG).items()}
+        self.calls: list[Any] = []
+
+    async def get(self, key: str) -> str | None:
+        self.calls.append(key)
+        return self.data.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        self.calls.append(tuple(keys))
+        return [self.data.get(key) for key in keys]
+
+
+class FakeAdapter(RequestAdapter):
+    """A request described by its parts, with no framework behind it."""
+
+    def __init__(
+        self,
+        path: str = "/",
+        method: str = "GET",
+        user_agent: str = "GPTBot",
+        headers: dict[str, str] | None = None,
+        body: Any = None,
+        host: str = "example.com",
+    ) -> None:
+        self.path = path
+        self.method = method
+        self.user_agent = user_agent
+        self.headers = {key.lower(): value for key, value in (headers or {}).items()}
+        self.body = body
+        self.host = host
+
+    def get_ip_address(self) -> str | None:
+        return "127.0.0.1"
+
+    def get_header(self, name: str) -> str | None:
+        return self.headers.get(name.lower())
+
+    def get_method(self) -> str:
+        return self.method
+
+    def get_path(self) -> str:
+        return self.path
+
+    def get_url(self) -> str:
+        return f"https://{self.host}{self.path}"
+
+    def get_host(self) -> str:
+        return self.host
+
+    def get_accept_header(self) -> str:
+        return self.headers.get("accept", "")
+
+    def get_user_agent(self) -> str:
+        return self.user_agent
+
+    def get_query_params(self) -> dict[str, Any]:
+        return {}
+
+    def get_query_param(self, name: str) -> None:
+        return None
+
+    async def get_body(self) -> Any:
+        return self.body
+
+
+def payment_header(payment_required: str) -> str:
+    """Build a PAYMENT-SIGNATURE for the first requirement of a 402 header."""
+    required = json.loads(base64.b64decode(payment_required))
+    accepted = required["accepts"][0]
+    payload = {
+        "x402Version": 2,
+        "resource": required.get("resource"),
+        "accepted": accepted,
+        "payload": {
+            "signature": "0x" + "11" * 65,
+            "authorization": {
+                "from": "0xabc",
+                "to": accepted["payTo"],
+                "value": accepted["amount"],
+                "validAfter": "0",
+                "validBefore": "9999999999",
+                "nonce": "0x" + os.urandom(32).hex(),
+            },
+        },
+    }
+    return base64.b64encode(json.dumps(payload).encode()).decode()
+
+
+async def pay(core: WorkerCore, path: str = "/api/data", **kwargs: Any):
+    """Request ``path`` unpaid, then again with a payment for it."""
+    unpaid = await core.process_request(FakeAdapter(path=path, **kwargs))
+    header = payment_header(unpaid.response.headers["PAYMENT-REQUIRED"])
+    headers = {**kwargs.pop("headers", {}), "PAYMENT-SIGNATURE": header}
+    return await core.process_request(FakeAdapter(path=path, headers=headers, **kwargs))
+
+
+def use_fake_facilitators(monkeypatch: Any) -> list[FakeFacilitator]:
+    """Give every core a FakeFacilitator per facilitator config, and drop telemetry.
+
+    ``monkeypatch`` is pytest's fixture (anything with its ``setattr``).
+    Returns the facilitators as they are created.
+    """
+    created: list[FakeFacilitator] = []
+
+    def deserialize(self: Any, raw: str) -> FakeFacilitator:
+        facilitator = FakeFacilitator(json.loads(raw)["url"])
+        created.append(facilitator)
+        return facilitator
+
+    monkeypatch.setattr(foldset_config.FacilitatorManager, "_deserialize", deserialize)
+    monkeypatch.setattr(telemetry.get_event_pipeline(), "submit", lambda api_key, payload: None)
+    return created
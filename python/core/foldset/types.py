@@ -3,7 +3,9 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import Any, Literal, Protocol
 
-from x402.http import HTTPAdapter, HTTPProcessResult
+from x402.http import HTTPAdapter, HTTPFacilitatorClient, HTTPProcessResult
+
+from .matching import BotMatcher, GateFilter, HostIndex
 
 
 class RequestAdapter(HTTPAdapter):
@@ -14,12 +16,66 @@ class RequestAdapter(HTTPAdapter):
     async def get_body(self) -> Any: ...
 
 
+SettlementMode = Literal["before", "concurrent", "deferred"]
+StreamSettlement = Literal["on-headers", "first-byte", "complete"]
+
+
+@dataclass(frozen=True)
+class FacilitatorHttpOptions:
+    """Connection pool and timeouts for calls to the facilitator."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry_s: float = 60.0
+    connect_timeout_s: float = 5.0
+    read_timeout_s: float = 30.0
+    # Negotiated only when the h2 package is installed
+    http2: bool = True
+
+
 @dataclass
 class FoldsetOptions:
     api_key: str
+    # Keep a separate core for this host in the core registry, for gateways
+    # that want one tenant's hosts isolated from each other
+    host: str | None = None
     redis_credentials: RedisCredentials | None = None
     platform: str | None = None
     sdk_version: str | None = None
+    config_max_stale_ms: int | None = None
+    # Load config and build the x402 server at startup, not on the first request
+    warmup: bool = False
+    # Local file to persist credentials and config in, for fast cold starts
+    snapshot_path: str | None = None
+    # File through which the processes on a host share one config poller
+    shared_config_path: str | None = None
+    # When to settle verified payments; see handle_settlement for trade-offs
+    settlement_mode: SettlementMode = "before"
+    # SQLite file for deferred settlements (defaults to a file per API key in
+    # $FOLDSET_DATA_DIR or the user's state directory, see default_data_dir)
+    settlement_queue_path: str | None = None
+    # When streamed responses settle: as headers are sent ("on-headers"),
+    # once the app produces its first chunk ("first-byte", headers held
+    # until then) or before the last chunk ("complete", PAYMENT-RESPONSE
+    # sent as a trailer where the server supports them)
+    stream_settlement: StreamSettlement = "on-headers"
+    # Pool limits, timeouts and HTTP/2 for verify and settle calls
+    facilitator_http: FacilitatorHttpOptions = field(default_factory=FacilitatorHttpOptions)
+    # Issue prepaid grants that skip verification on repeat requests
+    grants: GrantOptions | None = None
+
+
+@dataclass(frozen=True)
+class GrantOptions:
+    """Prepaid access grants issued with each settled payment."""
+
+    # HMAC key grants are signed with; every process accepting them needs it
+    secret: str
+    # Further requests a grant covers, and for how long
+    max_requests: int = 100
+    ttl_s: float = 300.0
+    # Count uses in the tenant's Redis so the limit holds across processes
+    shared: bool = False
 
 
 @dataclass
@@ -49,6 +105,8 @@ class RestrictionBase:
     description: str
     price: float
     scheme: str
+    # Host pattern of the site this applies to; None applies to every site
+    host: str | None = field(default=None, kw_only=True)
 
 
 @dataclass
@@ -99,6 +157,42 @@ class FacilitatorConfig:
     supported_headers: dict[str, str] | None = None
 
 
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """All tenant config loaded together, swapped as a single unit.
+
+    A request reads one snapshot so it never mixes old and new config.
+
+    When the tenant configures several hosts, ``sites`` maps each request
+    host to a per-site snapshot holding that host's config and
+    restrictions, and the top-level ``host_config`` is None.
+    """
+
+    host_config: HostConfig | None = None
+    restrictions: list[Restriction] = field(default_factory=list)
+    payment_methods: list[PaymentMethod] = field(default_factory=list)
+    bots: list[Bot] = field(default_factory=list)
+    facilitator: HTTPFacilitatorClient | None = None
+    version: str | None = None
+    bot_matcher: BotMatcher = field(default=None, repr=False, compare=False)  # type: ignore[assignment]
+    # None means every path may need payment
+    gate: GateFilter | None = field(default=None, repr=False, compare=False)
+    sites: HostIndex | None = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.bot_matcher is None:
+            object.__setattr__(self, "bot_matcher", BotMatcher(self.bots))
+
+    def for_host(self, host: str) -> ConfigSnapshot | None:
+        """Return the snapshot serving ``host``, or None if no site matches."""
+        if self.sites is None:
+            return self
+        return self.sites.lookup(host)
+
+    def site_snapshots(self) -> list[ConfigSnapshot]:
+        return self.sites.values() if self.sites is not None else [self]
+
+
 @dataclass
 class HttpServerResult:
     type: Literal["no-payment-required", "payment-error", "payment-verified"]
@@ -108,6 +202,8 @@ class HttpServerResult:
     payment_payload: Any | None = None
     payment_requirements: Any | None = None
     headers: dict[str, str] | None = None
+    # FoldsetHTTPResourceServer a payment was verified with, to settle with it
+    http_server: Any | None = field(default=None, repr=False)
 
 
 @dataclass
@@ -119,10 +215,13 @@ class ProcessRequestResult:
     payment_payload: Any | None = None
     payment_requirements: Any | None = None
     headers: dict[str, str] | None = None
+    # FoldsetHTTPResourceServer a payment was verified with, to settle with it
+    http_server: Any | None = field(default=None, repr=False)
 
 
 class ConfigStore(Protocol):
     async def get(self, key: str) -> str | None: ...
+    async def get_many(self, keys: list[str]) -> list[str | None]: ...
 
 
 @dataclass
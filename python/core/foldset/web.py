@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from .paywall import generate_paywall_html
+from .paywall import get_paywall_cache, negotiate_encoding
 from .types import PaymentMethod, ProcessRequestResult, RequestAdapter, WebRestriction
 
 
@@ -11,7 +11,21 @@ def format_web_payment_error(
     adapter: RequestAdapter,
     terms_of_service_url: str | None = None,
 ) -> None:
-    result.response.body = generate_paywall_html(
+    page = get_paywall_cache().render(
         restriction, payment_methods, adapter.get_url(), terms_of_service_url
     )
-    result.response.headers["Content-Type"] = "text/html"
+    encoding = page.encoding_for(negotiate_encoding(adapter.get_header("Accept-Encoding")))
+    headers = result.response.headers
+    headers["ETag"] = page.etag(encoding)
+    headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = adapter.get_header("If-None-Match")
+    if if_none_match and page.matches(if_none_match):
+        result.response.status = 304
+        result.response.body = ""
+        return
+
+    result.response.body = page.content(encoding)
+    headers["Content-Type"] = "text/html"
+    if encoding:
+        headers["Content-Encoding"] = encoding
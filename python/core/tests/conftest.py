@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from foldset import WorkerCore
+from foldset.testing import FakeFacilitator, MemoryStore, use_fake_facilitators
+
+
+@pytest.fixture
+def facilitators(monkeypatch: pytest.MonkeyPatch) -> list[FakeFacilitator]:
+    """Replace the HTTP facilitator and telemetry with in-memory fakes."""
+    return use_fake_facilitators(monkeypatch)
+
+
+@pytest.fixture
+def make_core(facilitators: list[FakeFacilitator]):
+    def make(**kwargs: Any) -> WorkerCore:
+        return WorkerCore(kwargs.pop("store", None) or MemoryStore(), "key", "test", "0", **kwargs)
+
+    return make
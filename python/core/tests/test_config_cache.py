@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from foldset.config import CACHE_TTL_MS, CachedConfigManager
+
+
+class CountingStore:
+    def __init__(self, value: str = '"fresh"', fail: bool = False) -> None:
+        self.value = value
+        self.fail = fail
+        self.gets = 0
+
+    async def get(self, key: str) -> str | None:
+        self.gets += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise ConnectionError("store down")
+        return self.value
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return [await self.get(key) for key in keys]
+
+
+def stale_manager(store: CountingStore) -> CachedConfigManager[str]:
+    manager: CachedConfigManager[str] = CachedConfigManager(store, "key", "fallback")
+    manager._cached = "stale"
+    manager._cache_timestamp = time.time() * 1000 - CACHE_TTL_MS - 1
+    return manager
+
+
+def test_stale_value_served_while_one_refresh_runs() -> None:
+    store = CountingStore()
+    manager = stale_manager(store)
+
+    async def run() -> list[str]:
+        values = await asyncio.gather(*(manager.get() for _ in range(20)))
+        await asyncio.sleep(0.05)
+        return [*values, await manager.get()]
+
+    values = asyncio.run(run())
+    assert values[:20] == ["stale"] * 20
+    assert values[20] == "fresh"
+    assert store.gets == 1
+
+
+def test_failed_refresh_backs_off() -> None:
+    store = CountingStore(fail=True)
+    manager = stale_manager(store)
+
+    async def run() -> None:
+        for _ in range(3):
+            for _ in range(10):
+                assert await manager.get() == "stale"
+            await asyncio.sleep(0.02)
+
+    asyncio.run(run())
+    assert store.gets == 1
+    assert manager._retry_at > time.time() * 1000
+
+    # Once the backoff has passed, the next request retries and recovers
+    store.fail = False
+    manager._retry_at = 0
+
+    async def recover() -> str:
+        await manager.get()
+        await asyncio.sleep(0.05)
+        return await manager.get()
+
+    assert asyncio.run(recover()) == "fresh"
+    assert store.gets == 2
+    assert manager._failures == 0
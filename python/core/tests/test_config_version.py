@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from foldset.config import CONFIG_VERSION_KEY, ConfigSnapshotManager
+from foldset.testing import CONFIG, MemoryStore
+
+
+def refresh(manager: ConfigSnapshotManager):
+    """Load config now, as if the cached snapshot had expired."""
+    if manager._cache_timestamp > 0:
+        manager._cache_timestamp = 1
+    return asyncio.run(manager.get())
+
+
+def test_without_version_key_every_refresh_reloads_all_blobs(facilitators) -> None:
+    store = MemoryStore()
+    manager = ConfigSnapshotManager(store)
+    first = refresh(manager)
+    assert first.version is None
+
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    store.calls.clear()
+    second = refresh(manager)
+
+    assert [call for call in store.calls if isinstance(call, tuple)]
+    assert CONFIG_VERSION_KEY not in store.calls
+    assert [bot.user_agent for bot in second.bots] == ["claudebot"]
+
+
+def test_unchanged_version_polls_only_the_version_key(facilitators) -> None:
+    store = MemoryStore({**CONFIG, CONFIG_VERSION_KEY: "1"})
+    manager = ConfigSnapshotManager(store)
+    first = refresh(manager)
+
+    store.calls.clear()
+    assert refresh(manager) is first
+    assert store.calls == [CONFIG_VERSION_KEY]
+
+    store.data[CONFIG_VERSION_KEY] = json.dumps("2")
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    third = refresh(manager)
+    assert third.version == json.dumps("2")
+    assert [bot.user_agent for bot in third.bots] == ["claudebot"]
+
+
+def test_version_key_removed_falls_back_to_full_reload(facilitators) -> None:
+    store = MemoryStore({**CONFIG, CONFIG_VERSION_KEY: "1"})
+    manager = ConfigSnapshotManager(store)
+    refresh(manager)
+
+    del store.data[CONFIG_VERSION_KEY]
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    snapshot = refresh(manager)
+    assert snapshot.version is None
+    assert [bot.user_agent for bot in snapshot.bots] == ["claudebot"]
+
+
+def test_stuck_version_still_reloads_periodically(facilitators) -> None:
+    store = MemoryStore({**CONFIG, CONFIG_VERSION_KEY: "1"})
+    manager = ConfigSnapshotManager(store)
+    refresh(manager)
+
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    manager._full_load_at = 0
+    snapshot = refresh(manager)
+    assert [bot.user_agent for bot in snapshot.bots] == ["claudebot"]
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+import foldset
+from foldset import GRANT_HEADER, RedisGrantCounter, WorkerCore
+from foldset import grants as foldset_grants
+from foldset import store as foldset_store
+from foldset.grants import LocalGrantCounter, _b64decode, _b64encode
+from foldset.testing import FakeAdapter, MemoryStore, pay
+from foldset.types import FoldsetOptions, GrantOptions, RedisCredentials
+
+CREDENTIALS = RedisCredentials(url="https://redis.example", token="t", tenant_id="tenant")
+
+
+class FakeRedis:
+    """Just enough of an Upstash client for RedisGrantCounter."""
+
+    def __init__(self) -> None:
+        self.counts: dict[str, int] = {}
+        self.expiry: dict[str, int] = {}
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[tuple[str, str, Any]] = []
+
+    def incr(self, key: str) -> None:
+        self.commands.append(("incr", key, None))
+
+    def expireat(self, key: str, when: int) -> None:
+        self.commands.append(("expireat", key, when))
+
+    async def exec(self) -> list[int]:
+        results = []
+        for command, key, arg in self.commands:
+            if command == "incr":
+                self.redis.counts[key] = self.redis.counts.get(key, 0) + 1
+                results.append(self.redis.counts[key])
+            else:
+                self.redis.expiry[key] = arg
+                results.append(1)
+        return results
+
+
+@pytest.fixture
+def redis(monkeypatch: pytest.MonkeyPatch) -> FakeRedis:
+    fake = FakeRedis()
+    monkeypatch.setattr(foldset_store, "_get_redis_client", lambda url, token: fake)
+    return fake
+
+
+async def grant_for(core: WorkerCore, path: str = "/api/data") -> str:
+    """Pay for ``path`` and return the grant its settlement carries."""
+    verified = await pay(core, path)
+    settlement = await core.process_settlement(
+        FakeAdapter(path=path),
+        verified.payment_payload,
+        verified.payment_requirements,
+        200,
+        verified.metadata.request_id,
+        verified.http_server,
+    )
+    assert settlement.success
+    return settlement.headers[GRANT_HEADER]
+
+
+async def use(core: WorkerCore, grant: str, path: str = "/api/data", **kwargs: Any) -> str:
+    adapter = FakeAdapter(path=path, headers={GRANT_HEADER: grant}, **kwargs)
+    return (await core.process_request(adapter)).type
+
+
+def claims(grant: str) -> dict[str, Any]:
+    return json.loads(_b64decode(grant.partition(".")[0]))
+
+
+def test_grant_is_only_valid_for_its_route_and_host(make_core) -> None:
+    core = make_core(grants=GrantOptions(secret="s3"))
+
+    async def run():
+        grant = await grant_for(core)
+        return (
+            await use(core, grant),
+            await use(core, grant, "/api/other"),
+            await use(core, grant, host="other.example"),
+        )
+
+    assert asyncio.run(run()) == ("no-payment-required", "payment-error", "payment-error")
+
+
+def test_grant_expires(make_core, monkeypatch) -> None:
+    core = make_core(grants=GrantOptions(secret="s3", ttl_s=60))
+
+    async def run():
+        grant = await grant_for(core)
+        before = await use(core, grant)
+        later = time.time() + 61
+        monkeypatch.setattr(foldset_grants, "time", SimpleNamespace(time=lambda: later))
+        return before, await use(core, grant)
+
+    assert asyncio.run(run()) == ("no-payment-required", "payment-error")
+
+
+def test_grant_covers_max_requests_uses(make_core) -> None:
+    core = make_core(grants=GrantOptions(secret="s3", max_requests=2))
+
+    async def run():
+        grant = await grant_for(core)
+        return [await use(core, grant) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["no-payment-required", "no-payment-required", "payment-error"]
+
+
+def test_local_counter_only_evicts_expired_grants() -> None:
+    counter = LocalGrantCounter(size=2)
+    now = int(time.time())
+
+    async def run():
+        assert counter.reserve("a", now - 1)
+        assert counter.reserve("b", now + 60)
+        assert await counter.increment("b", now + 60) == 1
+        # "a" has expired and makes room; "b" is live and keeps its count
+        assert counter.reserve("c", now + 60)
+        assert not counter.reserve("d", now + 60)
+        with pytest.raises(RuntimeError):
+            await counter.increment("d", now + 60)
+        return await counter.increment("b", now + 60)
+
+    assert asyncio.run(run()) == 2
+
+
+def test_full_counter_issues_no_new_grants(make_core) -> None:
+    core = make_core(grants=GrantOptions(secret="s3", max_requests=2))
+    core.grants.counter = LocalGrantCounter(size=1)
+
+    async def run():
+        grant = await grant_for(core)
+        verified = await pay(core, "/api/other")
+        settlement = await core.process_settlement(
+            FakeAdapter(path="/api/other"),
+            verified.payment_payload,
+            verified.payment_requirements,
+            200,
+            verified.metadata.request_id,
+            verified.http_server,
+        )
+        return settlement, [await use(core, grant) for _ in range(3)]
+
+    settlement, uses = asyncio.run(run())
+    assert settlement.success
+    assert GRANT_HEADER not in settlement.headers
+    # The live grant was not evicted to make room, so its count holds
+    assert uses == ["no-payment-required", "no-payment-required", "payment-error"]
+
+
+def test_tampered_grant_is_rejected(make_core) -> None:
+    core = make_core(grants=GrantOptions(secret="s3", max_requests=1))
+    other = make_core(grants=GrantOptions(secret="other"))
+
+    async def run():
+        grant = await grant_for(core)
+        body, _, signature = grant.partition(".")
+        flipped = ("B" if signature[0] == "A" else "A") + signature[1:]
+        # More uses, under the original signature
+        raised = _b64encode(json.dumps({**claims(grant), "n": 1000}).encode())
+        return (
+            await use(core, f"{raised}.{signature}"),
+            await use(core, f"{body}.{flipped}"),
+            await use(core, body),
+            # Signed with another secret
+            await use(core, await grant_for(other)),
+        )
+
+    assert asyncio.run(run()) == ("payment-error",) * 4
+
+
+def test_shared_grants_count_uses_across_processes(make_core, redis) -> None:
+    options = GrantOptions(secret="s3", max_requests=2, shared=True)
+    first, second = make_core(grants=options), make_core(grants=options)
+    for core in (first, second):
+        core.grants.counter = RedisGrantCounter(CREDENTIALS)
+
+    async def run():
+        grant = await grant_for(first)
+        return grant, [await use(core, grant) for core in (first, second, second)]
+
+    grant, types = asyncio.run(run())
+    assert types == ["no-payment-required", "no-payment-required", "payment-error"]
+    key = f"tenant:grant:{claims(grant)['id']}"
+    assert redis.counts == {key: 3}
+    assert redis.expiry[key] == claims(grant)["exp"]
+
+
+def test_shared_option_counts_in_the_tenants_redis(facilitators, monkeypatch) -> None:
+    monkeypatch.setattr(foldset, "_create_store", lambda credentials, path: MemoryStore())
+    options = FoldsetOptions(
+        api_key="key",
+        redis_credentials=CREDENTIALS,
+        grants=GrantOptions(secret="s3", shared=True),
+    )
+
+    async def run():
+        core = await WorkerCore._create(options)
+        core.close()
+        return core
+
+    assert isinstance(asyncio.run(run()).grants.counter, RedisGrantCounter)
+
+
+def test_grant_uses_are_shared_per_payment_and_route(make_core) -> None:
+    core = make_core(grants=GrantOptions(secret="s3"))
+
+    async def run():
+        verified = await pay(core)
+
+        async def settle(path: str) -> str:
+            # Each retry is noted like a fresh verification of the payment
+            restriction = verified.http_server.get_restriction(path, "GET")
+            core.grants.note(verified.metadata.request_id, "example.com", restriction)
+            settlement = await core.process_settlement(
+                FakeAdapter(path=path),
+                verified.payment_payload,
+                verified.payment_requirements,
+                200,
+                verified.metadata.request_id,
+                verified.http_server,
+            )
+            return claims(settlement.headers[GRANT_HEADER])["id"]
+
+        return await settle("/api/data"), await settle("/api/data"), await settle("/api/other")
+
+    first, retry, other = asyncio.run(run())
+    assert first == retry
+    assert other != first
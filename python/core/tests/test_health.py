@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from foldset import READY_PATH
+from foldset.testing import FakeAdapter, MemoryStore
+
+
+class DownStore(MemoryStore):
+    async def get(self, key: str) -> str | None:
+        raise ConnectionError("store down")
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        raise ConnectionError("store down")
+
+
+def probe(core) -> tuple[int, str]:
+    result = asyncio.run(core.process_request(FakeAdapter(path=READY_PATH)))
+    return result.response.status, json.loads(result.response.body)["status"]
+
+
+def test_ready_probe_loads_config_itself(make_core) -> None:
+    core = make_core()
+    assert not core.ready
+
+    assert probe(core) == (200, "ready")
+    assert core.ready
+    assert core.http_server.ready
+
+
+def test_ready_without_host_config_or_facilitator(make_core) -> None:
+    store = MemoryStore()
+    store.data = {}
+    core = make_core(store=store)
+
+    assert probe(core) == (200, "ready")
+    assert core.ready
+
+
+def test_not_ready_until_config_loads(make_core) -> None:
+    core = make_core(store=DownStore())
+
+    assert probe(core) == (503, "starting")
+    assert not core.ready
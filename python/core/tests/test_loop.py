@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from foldset.loop import BackgroundLoop, cancel_task, get_background_loop, run_sync
+
+
+async def where() -> tuple[asyncio.AbstractEventLoop, str]:
+    return asyncio.get_running_loop(), threading.current_thread().name
+
+
+def test_run_sync_reuses_one_loop_in_its_own_thread() -> None:
+    first_loop, thread = run_sync(where())
+    second_loop, _ = run_sync(where())
+
+    assert first_loop is second_loop is get_background_loop().get_loop()
+    assert thread == "foldset-loop"
+
+
+def test_run_sync_raises_what_the_coroutine_raises() -> None:
+    async def fail() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        run_sync(fail())
+
+
+def test_run_sync_times_out() -> None:
+    with pytest.raises(TimeoutError):
+        run_sync(asyncio.sleep(1), timeout=0.01)
+
+
+def test_run_from_the_loop_thread_is_refused() -> None:
+    background = BackgroundLoop()
+
+    async def nested() -> None:
+        background.run(where())
+
+    with pytest.raises(RuntimeError, match="loop thread"):
+        background.run(nested())
+
+
+def test_a_forked_child_starts_its_own_loop() -> None:
+    background = BackgroundLoop()
+    parent = background.get_loop()
+
+    # As after a fork: the recorded pid is no longer this process's
+    background._pid = -1
+
+    assert background.get_loop() is not parent
+    assert background.run(where())[0] is background.get_loop()
+
+
+def test_cancel_task_from_another_thread() -> None:
+    started = threading.Event()
+
+    async def wait() -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    async def start() -> asyncio.Task[None]:
+        return asyncio.get_running_loop().create_task(wait())
+
+    task = run_sync(start())
+    assert started.wait(1)
+    cancel_task(task)
+
+    async def outcome() -> bool:
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return task.cancelled()
+
+    assert run_sync(outcome())
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import random
+from typing import Any, NamedTuple
+
+import pytest
+from x402.http import x402HTTPResourceServer
+
+from foldset.matching import BotMatcher, HostIndex, RouteIndex
+from foldset.server import FoldsetHTTPResourceServer
+from foldset.types import Bot
+
+normalize_path = x402HTTPResourceServer._normalize_path
+
+
+class Route(NamedTuple):
+    verb: str
+    regex: Any
+    config: Any
+
+
+def compile_routes(patterns: list[str]) -> list[Route]:
+    routes = []
+    for index, pattern in enumerate(patterns):
+        verb, regex = FoldsetHTTPResourceServer._parse_route_pattern(pattern)
+        routes.append(Route(verb, regex, index))
+    return routes
+
+
+def linear_lookup(routes: list[Route], path: str, method: str) -> Any | None:
+    """The first-match scan RouteIndex replaces."""
+    normalized = normalize_path(path)
+    for route in routes:
+        if route.regex.match(normalized) and route.verb in ("*", method.upper()):
+            return route.config
+    return None
+
+
+def linear_match(bots: list[Bot], user_agent: str) -> Bot | None:
+    lowered = user_agent.lower()
+    for bot in bots:
+        if bot.user_agent in lowered:
+            return bot
+    return None
+
+
+@pytest.mark.parametrize(
+    ("patterns", "path", "method", "expected"),
+    [
+        (["/articles/", "^/api/data$"], "/articles/one", "GET", 0),
+        (["/articles/", "^/api/data$"], "/api/data", "GET", 1),
+        (["/articles/", "^/api/data$"], "/api/data/more", "GET", None),
+        (["/articles/", "^/api/data$"], "/API/Data", "GET", 1),
+        # A verb-specific route listed first wins for its verb only
+        (["POST /api/.*", "/api/.*"], "/api/x", "POST", 0),
+        (["POST /api/.*", "/api/.*"], "/api/x", "GET", 1),
+        # A "*" route listed first shadows a later verb-specific one
+        (["/api/.*", "GET /api/x"], "/api/x", "GET", 0),
+        (["GET /api/x$", "POST /api/x$"], "/api/x", "DELETE", None),
+        ([".*\\.pdf$", "/docs/"], "/docs/a.pdf", "GET", 0),
+        (["/docs/", ".*\\.pdf$"], "/docs/a.pdf", "GET", 0),
+        (["(?i)/A", "/b(c|d)"], "/bd", "GET", 1),
+        (["/(x)\\1", "/x"], "/xx", "GET", 0),
+        (["^/$", "/"], "/", "GET", 0),
+        (["/café", "/"], "/CAFÉ", "GET", 0),
+        (["/a$"], "/a%0A", "GET", 0),
+        (["/a"], "/a?x=1", "GET", 0),
+    ],
+)
+def test_route_index_table(patterns, path, method, expected) -> None:
+    routes = compile_routes(patterns)
+    assert linear_lookup(routes, path, method) == expected
+    assert RouteIndex(routes, normalize_path).lookup(path, method) == expected
+
+
+LITERALS = ["/", "/a", "/ab", "/api", "/api/", "/api/data", "/b/", "/A/b"]
+FRAGMENTS = ["", ".*", "[a-z]+", "\\d+", "(x|y)", "/", "a", "b?", "x{2}", "\\.pdf", "/.*"]
+VERBS = ["", "", "GET ", "POST "]
+ALPHABET = "/abAxy1.pdf"
+
+
+def random_pattern(rng: random.Random) -> str:
+    pattern = rng.choice(["", "^"])
+    pattern += rng.choice(LITERALS + FRAGMENTS)
+    for _ in range(rng.randint(0, 2)):
+        pattern += rng.choice(FRAGMENTS)
+    if rng.random() < 0.3:
+        pattern += "$"
+    if rng.random() < 0.1:
+        pattern = rng.choice(FRAGMENTS) + "|" + pattern
+    return rng.choice(VERBS) + pattern
+
+
+def random_path(rng: random.Random) -> str:
+    return "/" + "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 8)))
+
+
+def test_route_index_agrees_with_linear_scan() -> None:
+    rng = random.Random(6)
+    for _ in range(300):
+        routes = compile_routes([random_pattern(rng) for _ in range(rng.randint(1, 8))])
+        index = RouteIndex(routes, normalize_path)
+        for _ in range(40):
+            path = random_path(rng)
+            method = rng.choice(["GET", "POST", "get", "PUT"])
+            assert index.lookup(path, method) == linear_lookup(routes, path, method), (
+                [route.regex.pattern for route in routes],
+                [route.verb for route in routes],
+                path,
+                method,
+            )
+
+
+@pytest.mark.parametrize(
+    ("agents", "user_agent", "expected"),
+    [
+        (["gptbot", "bot"], "Mozilla/5.0 GPTBot/1.0", 0),
+        (["bot", "gptbot"], "Mozilla/5.0 GPTBot/1.0", 0),
+        (["claudebot", "bot"], "Mozilla/5.0 GPTBot/1.0", 1),
+        (["abcd", "bc"], "xabcx", 1),
+        (["he", "she", "hers"], "ushers", 0),
+        (["gptbot"], "Mozilla/5.0", None),
+        ([], "GPTBot", None),
+    ],
+)
+def test_bot_matcher_table(agents, user_agent, expected) -> None:
+    bots = [Bot(user_agent=agent) for agent in agents]
+    match = BotMatcher(bots).match(user_agent)
+    assert match is linear_match(bots, user_agent)
+    assert match is (bots[expected] if expected is not None else None)
+
+
+def test_bot_matcher_agrees_with_lowest_index_substring() -> None:
+    rng = random.Random(7)
+    for _ in range(300):
+        bots = [
+            Bot(user_agent="".join(rng.choice("abc") for _ in range(rng.randint(1, 4))))
+            for _ in range(rng.randint(1, 8))
+        ]
+        matcher = BotMatcher(bots)
+        for _ in range(40):
+            user_agent = "".join(rng.choice("abcABd") for _ in range(rng.randint(0, 12)))
+            assert matcher.match(user_agent) is linear_match(bots, user_agent), (
+                [bot.user_agent for bot in bots],
+                user_agent,
+            )
+
+
+@pytest.mark.parametrize(
+    "host, expected",
+    [
+        ("example.com", "exact"),
+        ("EXAMPLE.com.", "exact"),
+        ("example.com:8080", "exact"),
+        ("blog.example.com", "wildcard"),
+        ("a.b.example.com", "wildcard"),
+        ("a.shop.example.com", "shop wildcard"),
+        ("shop.example.com", "wildcard"),
+        ("blog.example.com:443", "wildcard"),
+        ("other.example", "default"),
+        ("other.example:8080", "default"),
+        ("[::1]:8080", "ipv6"),
+        ("::1", "bare ipv6"),
+        ("", "default"),
+    ],
+)
+def test_host_index_lookup(host, expected) -> None:
+    index = HostIndex([
+        ("example.com", "exact"),
+        ("*.example.com", "wildcard"),
+        ("*.shop.example.com", "shop wildcard"),
+        ("[::1]", "ipv6"),
+        ("::1", "bare ipv6"),
+        ("*", "default"),
+        ("Example.com", "duplicate"),
+    ])
+
+    assert index.lookup(host) == expected
+
+
+def test_host_index_without_default_misses() -> None:
+    index = HostIndex([("example.com", "exact"), ("*.example.com", "wildcard")])
+
+    assert index.lookup("example.org") is None
+    assert index.lookup("notexample.com") is None
+    assert len(index) == 2
+    assert index.get(" *.Example.com. ") == "wildcard"
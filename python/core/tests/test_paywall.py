@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import gzip
+
+from foldset.paywall import PaywallCache, generate_paywall_html
+from foldset.types import PaymentMethod, WebRestriction
+
+
+def restriction() -> WebRestriction:
+    return WebRestriction(description="Articles", price=0.01, scheme="exact", path="/articles/")
+
+
+def payment_methods() -> list[PaymentMethod]:
+    return [
+        PaymentMethod(
+            caip2_id="eip155:8453",
+            decimals=6,
+            contract_address="0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+            circle_wallet_address="0x000000000000000000000000000000000000dEaD",
+            chain_display_name="Base",
+            asset_display_name="USDC",
+        )
+    ]
+
+
+def test_page_is_the_template_with_the_url_spliced_in() -> None:
+    html = generate_paywall_html(restriction(), payment_methods(), "https://example.com/a?b=1")
+    assert "<code>https://example.com/a?b=1</code>" in html
+    assert "\x00" not in html
+
+
+def test_only_repeat_requests_are_compressed() -> None:
+    cache = PaywallCache()
+    r, methods = restriction(), payment_methods()
+
+    first = cache.render(r, methods, "https://example.com/a")
+    assert first.encoding_for("gzip") is None
+
+    again = cache.render(r, methods, "https://example.com/a")
+    assert again is first
+    assert again.encoding_for("gzip") == "gzip"
+    assert again.encoding_for(None) is None
+    assert gzip.decompress(again.content("gzip")).decode() == again.html
+
+
+def test_equal_templates_share_pages() -> None:
+    cache = PaywallCache()
+    first = cache.render(restriction(), payment_methods(), "https://example.com/a")
+    second = cache.render(restriction(), payment_methods(), "https://example.com/a")
+    other = cache.render(restriction(), payment_methods(), "https://example.com/b")
+
+    assert second is first and second.hits == 2
+    assert other is not first and other.etag() != first.etag()
+
+
+def test_etags_match_across_codings() -> None:
+    page = PaywallCache().render(restriction(), payment_methods(), "https://example.com/a")
+    assert page.etag("gzip") != page.etag()
+    assert page.matches(page.etag("gzip"))
+    assert page.matches(f"W/{page.etag()}")
+    assert not page.matches('"other"')
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from foldset import WorkerCore, WorkerCoreRegistry
+from foldset.testing import MemoryStore
+from foldset.types import FoldsetOptions
+
+
+class Core(WorkerCore):
+    def __init__(self, name: str) -> None:
+        super().__init__(MemoryStore(), name, "test", "0")
+        self.closed = 0
+
+    def close(self) -> None:
+        self.closed += 1
+        super().close()
+
+
+def slow_create(created: list[Core]):
+    async def create(options: FoldsetOptions) -> Core:
+        await asyncio.sleep(0.02)
+        core = Core(options.api_key)
+        created.append(core)
+        return core
+
+    return create
+
+
+def test_concurrent_first_requests_create_one_core() -> None:
+    registry = WorkerCoreRegistry()
+    created: list[Core] = []
+    create = slow_create(created)
+
+    async def run() -> list[WorkerCore]:
+        return await asyncio.gather(
+            *(registry.get(FoldsetOptions(api_key="a"), create) for _ in range(10))
+        )
+
+    cores = asyncio.run(run())
+    assert len(created) == 1
+    assert all(core is created[0] for core in cores)
+
+
+def test_creation_is_shared_across_event_loops() -> None:
+    registry = WorkerCoreRegistry()
+    created: list[Core] = []
+    create = slow_create(created)
+    cores: list[WorkerCore] = []
+
+    def worker() -> None:
+        cores.append(asyncio.run(registry.get(FoldsetOptions(api_key="a"), create)))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(core is created[0] for core in cores)
+
+
+def test_cancelled_caller_does_not_cancel_creation() -> None:
+    registry = WorkerCoreRegistry()
+    created: list[Core] = []
+    create = slow_create(created)
+
+    async def run() -> WorkerCore:
+        first = asyncio.ensure_future(registry.get(FoldsetOptions(api_key="a"), create))
+        second = asyncio.ensure_future(registry.get(FoldsetOptions(api_key="a"), create))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) is created[0]
+    assert registry.peek("a") is created[0]
+
+
+def test_evicted_and_replaced_cores_are_closed() -> None:
+    registry = WorkerCoreRegistry(max_size=2)
+    a, b, c, d = Core("a"), Core("b"), Core("c"), Core("d")
+    registry.add("a", a)
+    registry.add("b", b)
+    registry.peek("a")
+    registry.add("c", c)
+
+    assert (a.closed, b.closed, c.closed) == (0, 1, 0)
+    assert registry.peek("b") is None
+
+    registry.add("c", d)
+    assert c.closed == 1
+    assert registry.evict("c") is d and d.closed == 1
+
+
+def test_losing_duplicate_is_closed() -> None:
+    registry = WorkerCoreRegistry()
+    created: list[Core] = []
+    create = slow_create(created)
+    registered = Core("a")
+
+    async def run() -> WorkerCore:
+        task = asyncio.ensure_future(registry.get(FoldsetOptions(api_key="a"), create))
+        await asyncio.sleep(0)
+        registry.add("a", registered)
+        return await task
+
+    assert asyncio.run(run()) is registered
+    assert created[0].closed == 1
+    assert registered.closed == 0
+
+
+def test_host_keeps_a_separate_core() -> None:
+    registry = WorkerCoreRegistry()
+    created: list[Core] = []
+    create = slow_create(created)
+
+    async def run() -> tuple[WorkerCore, WorkerCore, WorkerCore]:
+        return (
+            await registry.get(FoldsetOptions(api_key="a"), create),
+            await registry.get(FoldsetOptions(api_key="a", host="one.example"), create),
+            await registry.get(FoldsetOptions(api_key="a", host="one.example"), create),
+        )
+
+    plain, hosted, again = asyncio.run(run())
+    assert plain is not hosted and hosted is again
+    assert registry.peek("a", "one.example") is hosted
+    assert registry.peek("a", "two.example") is None
+
+
+def test_close_stops_the_settlement_queue(tmp_path) -> None:
+    core = WorkerCore(
+        MemoryStore(),
+        "key",
+        "test",
+        "0",
+        settlement_mode="deferred",
+        settlement_queue_path=str(tmp_path / "queue.db"),
+    )
+
+    async def run() -> asyncio.Task[None]:
+        assert core.settlement_queue is not None
+        core.settlement_queue._insert("example.com", "{}", "{}", "{}", 1e12)
+        core.settlement_queue._reschedule(1, 0, 1e12)
+        core.settlement_queue.start()
+        task = core.settlement_queue._task
+        await asyncio.sleep(0.01)
+        core.close()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert core.settlement_queue._db is None
+    assert len(core.settlement_queue) == 1
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from foldset.testing import CONFIG, FakeAdapter, MemoryStore
+
+
+def multi_site_config() -> dict:
+    data = json.loads(json.dumps(CONFIG))
+    data["host-config"] = [
+        dict(CONFIG["host-config"], host="example.com"),
+        dict(CONFIG["host-config"], host="blog.example", mcpEndpoint=None),
+    ]
+    data["restrictions"] = [
+        *CONFIG["restrictions"],
+        {
+            "type": "web",
+            "description": "Posts",
+            "price": 0.03,
+            "scheme": "exact",
+            "path": "/posts/",
+            "host": "blog.example",
+        },
+    ]
+    return data
+
+
+def test_sites_removed_from_config_are_pruned(make_core) -> None:
+    store = MemoryStore(multi_site_config())
+    core = make_core(store=store)
+
+    async def run() -> tuple[list, list]:
+        await core.process_request(FakeAdapter(path="/api/data"))
+        await core.process_request(FakeAdapter(path="/posts/1", host="blog.example"))
+        before = sorted(core.http_server._sites)
+
+        store.data["host-config"] = json.dumps(CONFIG["host-config"])
+        store.data["restrictions"] = json.dumps(CONFIG["restrictions"])
+        core.config._cache_timestamp = 0
+        await core.process_request(FakeAdapter(path="/api/data"))
+        return before, sorted(core.http_server._sites)
+
+    before, after = asyncio.run(run())
+    assert before == ["blog.example", "example.com"]
+    assert after == ["example.com"]
+    assert core.ready
+
+
+def test_prune_keeps_only_sites_of_the_new_snapshot(make_core) -> None:
+    store = MemoryStore(multi_site_config())
+    core = make_core(store=store)
+
+    async def run() -> list:
+        snapshot = await core.config.get()
+        for site in snapshot.site_snapshots():
+            await core.http_server.get(site)
+
+        store.data["host-config"] = json.dumps([dict(CONFIG["host-config"], host="blog.example")])
+        core.config._cache_timestamp = 0
+        snapshot = await core.config.get()
+        core.http_server.prune(snapshot)
+        return sorted(core.http_server._sites)
+
+    assert asyncio.run(run()) == ["blog.example"]
+
+
+def test_ungated_requests_build_no_metadata(make_core, monkeypatch) -> None:
+    import foldset
+
+    built = []
+    build = foldset.build_request_metadata
+    monkeypatch.setattr(foldset, "build_request_metadata", lambda: built.append(1) or build())
+    core = make_core(store=MemoryStore(multi_site_config()))
+
+    async def run() -> list:
+        return [
+            await core.process_request(FakeAdapter(path="/about")),
+            await core.process_request(FakeAdapter(path="/api/data", host="other.example")),
+        ]
+
+    results = asyncio.run(run())
+    assert [result.type for result in results] == ["no-payment-required"] * 2
+    assert built == []
+
+    result = asyncio.run(core.process_request(FakeAdapter(path="/api/data")))
+    assert result.type == "payment-error"
+    assert built == [1]
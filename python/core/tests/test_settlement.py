@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import json
+
+import pytest
+
+from foldset.settlement import PendingSettlements
+from foldset.testing import FakeAdapter, MemoryStore, pay, payment_header
+
+
+def test_settles_with_the_server_the_payment_was_verified_with(make_core, facilitators) -> None:
+    store = MemoryStore()
+    core = make_core(store=store)
+
+    async def run():
+        verified = await pay(core)
+        assert verified.type == "payment-verified"
+
+        # The facilitator changes between verification and settlement
+        store.data["facilitator"] = json.dumps({"url": "https://other.example"})
+        core.config._cache_timestamp = 0
+        await core.config.get()
+
+        return await core.process_settlement(
+            FakeAdapter(path="/api/data"),
+            verified.payment_payload,
+            verified.payment_requirements,
+            200,
+            verified.metadata.request_id,
+            verified.http_server,
+        )
+
+    settlement = asyncio.run(run())
+    assert settlement.success
+    assert [f.url for f in facilitators] == ["https://facilitator.example", "https://other.example"]
+    assert facilitators[0].settle_calls == 1
+    assert facilitators[1].settle_calls == 0
+
+
+def test_settlements_are_shared_per_route_not_per_payload(make_core, facilitators) -> None:
+    core = make_core()
+
+    async def run():
+        verified = await pay(core)
+
+        async def settle(path: str):
+            return await core.process_settlement(
+                FakeAdapter(path=path),
+                verified.payment_payload,
+                verified.payment_requirements,
+                200,
+                verified.metadata.request_id,
+                verified.http_server,
+            )
+
+        # Concurrent settlements on one route share a call; the same payment
+        # sent to another route, with the same price, does not
+        return await asyncio.gather(settle("/api/data"), settle("/api/data"), settle("/api/other"))
+
+    first, again, other = asyncio.run(run())
+    assert first.success and again.success and other.success
+    assert again.headers == first.headers
+    assert facilitators[0].settle_calls == 2
+    assert len(core.settlements) == 0
+
+
+def test_replayed_payment_is_refused_once_settled(make_core, facilitators) -> None:
+    core = make_core()
+
+    async def run():
+        unpaid = await core.process_request(FakeAdapter(path="/api/data"))
+        header = payment_header(unpaid.response.headers["PAYMENT-REQUIRED"])
+        paid = FakeAdapter(path="/api/data", headers={"PAYMENT-SIGNATURE": header})
+
+        verified = await core.process_request(paid)
+        settlement = await core.process_settlement(
+            paid,
+            verified.payment_payload,
+            verified.payment_requirements,
+            200,
+            verified.metadata.request_id,
+            verified.http_server,
+        )
+        replays = [await core.process_request(paid) for _ in range(3)]
+        return verified, settlement, replays
+
+    verified, settlement, replays = asyncio.run(run())
+    assert verified.type == "payment-verified"
+    assert settlement.success
+    assert [replay.type for replay in replays] == ["payment-error"] * 3
+    assert all(replay.response.status == 402 for replay in replays)
+    # Refused before asking the facilitator
+    assert facilitators[0].verify_calls == 1
+    assert facilitators[0].settle_calls == 1
+
+
+def test_pending_settlements_hold_their_tasks_until_done() -> None:
+    pending = PendingSettlements()
+
+    async def settle() -> str:
+        await asyncio.sleep(0.01)
+        return "settled"
+
+    async def run():
+        pending.start("request", settle())
+        held = len(pending._tasks)
+        # Without a strong reference the task could be collected mid-flight
+        gc.collect()
+        return held, await pending.join("request")
+
+    held, result = asyncio.run(run())
+    assert held == 1
+    assert result == "settled"
+    assert len(pending._tasks) == 0
+
+
+def test_deprecated_config_views_read_the_current_snapshot(make_core) -> None:
+    core = make_core()
+
+    async def run():
+        with pytest.warns(DeprecationWarning):
+            restrictions = await core.restrictions.get()
+        with pytest.warns(DeprecationWarning):
+            bot = await core.bots.match_bot("Mozilla/5.0 GPTBot/1.0")
+        return restrictions, bot
+
+    restrictions, bot = asyncio.run(run())
+    assert [r.description for r in restrictions] == ["Articles", "Data", "Other", "Tool"]
+    assert bot is not None and bot.user_agent == "gptbot"
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from x402.http import ProcessSettleResult
+from x402.schemas import PaymentPayload, PaymentRequirements
+
+from foldset import settlement, telemetry
+from foldset.settlement import SettlementQueue, default_settlement_queue_path
+
+REQUIREMENTS = PaymentRequirements(
+    scheme="exact",
+    network="eip155:8453",
+    asset="0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+    amount="50000",
+    pay_to="0x000000000000000000000000000000000000dEaD",
+    max_timeout_seconds=300,
+    extra={},
+)
+
+EVENT = json.dumps({
+    "method": "GET",
+    "status_code": 200,
+    "user_agent": "GPTBot",
+    "referer": None,
+    "href": "https://example.com/api/data",
+    "hostname": "example.com",
+    "pathname": "/api/data",
+    "search": "",
+    "ip_address": "127.0.0.1",
+    "request_id": "r",
+})
+
+
+@pytest.fixture(autouse=True)
+def quick_queue(monkeypatch: pytest.MonkeyPatch) -> list:
+    """Short leases and backoff, and telemetry collected in a list."""
+    monkeypatch.setattr(settlement, "SETTLEMENT_LEASE_S", 0.2)
+    monkeypatch.setattr(settlement, "SETTLEMENT_MAX_BACKOFF_S", 0.01)
+    monkeypatch.setattr(settlement, "SETTLEMENT_POLL_INTERVAL_S", 0.01)
+    events: list = []
+    monkeypatch.setattr(
+        telemetry.get_event_pipeline(), "submit", lambda api_key, payload: events.append(payload)
+    )
+    return events
+
+
+class Settler:
+    """Settle function that records each call and fails while ``failures`` last."""
+
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls: list[str] = []
+
+    async def __call__(self, host: str, payload, requirements) -> ProcessSettleResult:
+        self.calls.append(payload.payload["nonce"])
+        await asyncio.sleep(0.01)
+        if self.failures > 0:
+            self.failures -= 1
+            return ProcessSettleResult(success=False, error_reason="unavailable")
+        return ProcessSettleResult(success=True, headers={"PAYMENT-RESPONSE": "ok"})
+
+
+def fill(queue: SettlementQueue, count: int) -> None:
+    for index in range(count):
+        payload = PaymentPayload(x402_version=2, accepted=REQUIREMENTS, payload={"nonce": str(index)})
+        queue._insert(
+            "example.com",
+            payload.model_dump_json(by_alias=True),
+            REQUIREMENTS.model_dump_json(by_alias=True),
+            EVENT,
+            time.time() + 60,
+        )
+
+
+def test_two_consumers_never_settle_the_same_entry(tmp_path) -> None:
+    path = str(tmp_path / "queue.db")
+    first, second = Settler(), Settler()
+    queues = [SettlementQueue(path, "key", first), SettlementQueue(path, "key", second)]
+    fill(queues[0], 40)
+
+    async def run() -> None:
+        await asyncio.gather(*(queue._drain() for queue in queues))
+
+    asyncio.run(run())
+    settled = first.calls + second.calls
+    assert sorted(settled, key=int) == [str(index) for index in range(40)]
+    assert first.calls and second.calls
+    assert len(queues[0]) == 0
+
+
+def test_failed_settlement_is_retried(tmp_path, quick_queue) -> None:
+    settle = Settler(failures=2)
+    queue = SettlementQueue(str(tmp_path / "queue.db"), "key", settle)
+    fill(queue, 1)
+
+    asyncio.run(queue._drain())
+    assert settle.calls == ["0", "0", "0"]
+    assert len(queue) == 0
+    assert quick_queue[0].payment_response == "ok"
+
+
+def test_entry_held_by_a_dead_process_is_picked_up_after_its_lease(tmp_path) -> None:
+    path = str(tmp_path / "queue.db")
+    dead = SettlementQueue(path, "key", Settler())
+    fill(dead, 1)
+    assert len(dead._claim(10)) == 1
+
+    settle = Settler()
+    queue = SettlementQueue(path, "key", settle)
+    assert queue._claim(10) == []
+
+    time.sleep(0.25)
+    asyncio.run(queue._drain())
+    assert settle.calls == ["0"]
+    assert len(queue) == 0
+
+
+def test_tenants_only_drain_their_own_entries(tmp_path) -> None:
+    path = str(tmp_path / "queue.db")
+    mine, theirs = Settler(), Settler()
+    queue = SettlementQueue(path, "key", mine)
+    other = SettlementQueue(path, "other-key", theirs)
+    fill(queue, 2)
+    other.tenant = "tenant-2"
+    fill(other, 1)
+
+    asyncio.run(queue._drain())
+    assert mine.calls == ["0", "1"]
+    assert len(other) == 1 and theirs.calls == []
+
+
+def test_default_path_is_per_api_key_in_the_data_dir(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("FOLDSET_DATA_DIR", str(tmp_path / "state"))
+    first = default_settlement_queue_path("key")
+    assert os.path.dirname(first) == str(tmp_path / "state")
+    assert first != default_settlement_queue_path("other-key")
+    assert os.stat(tmp_path / "state").st_mode & 0o077 == 0
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+
+from foldset.config import CONFIG_VERSION_KEY
+from foldset.shared import SharedConfigStore
+from foldset.testing import MemoryStore
+
+KEYS = ["host-config", "bots"]
+
+
+def make_stale(store: SharedConfigStore, age_ms: float) -> None:
+    """Backdate the shared file as if it was written ``age_ms`` ago."""
+    with open(store.path, encoding="utf-8") as f:
+        body = json.load(f)
+    body["timestamp"] -= age_ms
+    with open(store.path, "w", encoding="utf-8") as f:
+        json.dump(body, f)
+
+
+def test_followers_read_the_file_the_leader_wrote(tmp_path) -> None:
+    path = str(tmp_path / "config.json")
+    leader_store, follower_store = MemoryStore(), MemoryStore()
+    leader = SharedConfigStore(leader_store, path)
+    follower = SharedConfigStore(follower_store, path)
+
+    first = asyncio.run(leader.get_many(KEYS))
+    second = asyncio.run(follower.get_many(KEYS))
+
+    assert first == second == [leader_store.data[key] for key in KEYS]
+    assert leader_store.calls == [(CONFIG_VERSION_KEY, *KEYS)]
+    assert follower_store.calls == []
+
+
+def test_only_one_process_refreshes_an_expired_file(tmp_path) -> None:
+    path = str(tmp_path / "config.json")
+    stores = [MemoryStore() for _ in range(4)]
+    shared = [SharedConfigStore(store, path, ttl_ms=1_000) for store in stores]
+    asyncio.run(shared[0].get_many(KEYS))
+    make_stale(shared[0], 2_000)
+    for store in stores:
+        store.calls.clear()
+
+    async def run() -> list[list[str | None]]:
+        return await asyncio.gather(*(s.get_many(KEYS) for s in shared))
+
+    results = asyncio.run(run())
+    assert all(result == results[0] for result in results)
+    assert sum(len(store.calls) for store in stores) == 1
+
+
+def test_follower_serves_stale_file_while_leader_holds_the_lock(tmp_path) -> None:
+    path = str(tmp_path / "config.json")
+    leader_store, follower_store = MemoryStore(), MemoryStore()
+    leader = SharedConfigStore(leader_store, path, ttl_ms=1_000, max_stale_ms=60_000)
+    follower = SharedConfigStore(follower_store, path, ttl_ms=1_000, max_stale_ms=60_000)
+    asyncio.run(leader.get_many(KEYS))
+    make_stale(leader, 2_000)
+
+    fd = leader._try_lock()
+    assert fd is not None
+    try:
+        assert follower._try_lock() is None
+        values = asyncio.run(follower.get_many(KEYS))
+    finally:
+        os.close(fd)
+
+    assert values == [leader_store.data[key] for key in KEYS]
+    assert follower_store.calls == []
+
+
+def test_follower_falls_back_to_the_store_without_a_usable_file(tmp_path) -> None:
+    path = str(tmp_path / "config.json")
+    leader = SharedConfigStore(MemoryStore(), path)
+    follower_store = MemoryStore()
+    follower = SharedConfigStore(follower_store, path)
+
+    fd = leader._try_lock()
+    try:
+        values = asyncio.run(follower.get_many(KEYS))
+    finally:
+        os.close(fd)
+
+    assert values == [follower_store.data[key] for key in KEYS]
+    assert follower_store.calls == [tuple(KEYS)]
+
+
+def test_digest_stands_in_for_a_missing_version_key(tmp_path) -> None:
+    path = str(tmp_path / "config.json")
+    store = MemoryStore()
+    shared = SharedConfigStore(store, path)
+
+    version, *_ = asyncio.run(shared.get_many([CONFIG_VERSION_KEY, *KEYS]))
+    assert version is not None
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    make_stale(shared, 10_000_000)
+    changed, *_ = asyncio.run(shared.get_many([CONFIG_VERSION_KEY, *KEYS]))
+    assert changed is not None and changed != version
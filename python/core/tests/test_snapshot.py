@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+from foldset.config import CACHE_MAX_STALE_MS, ConfigSnapshotManager
+from foldset.snapshot import SnapshotFile
+from foldset.testing import CONFIG, MemoryStore
+
+
+def saved_raws() -> dict[str, str | None]:
+    return {key: json.dumps(value) for key, value in CONFIG.items()}
+
+
+def test_snapshot_older_than_max_stale_is_rejected(facilitators) -> None:
+    store = MemoryStore()
+    manager = ConfigSnapshotManager(store)
+
+    async def run() -> bool:
+        saved_at = time.time() * 1000 - CACHE_MAX_STALE_MS - 1
+        return manager.seed(saved_raws(), None, saved_at)
+
+    assert asyncio.run(run()) is False
+    assert manager.peek() is None
+    assert store.calls == []
+
+
+def test_seeded_snapshot_is_served_and_refreshed_immediately(facilitators) -> None:
+    store = MemoryStore()
+    store.data["bots"] = json.dumps([{"user_agent": "ClaudeBot"}])
+    manager = ConfigSnapshotManager(store)
+
+    async def run():
+        assert manager.seed(saved_raws(), None, time.time() * 1000 - 10_000)
+        seeded = manager.peek()
+        await asyncio.sleep(0.01)
+        return seeded, manager.peek()
+
+    seeded, refreshed = asyncio.run(run())
+    assert [bot.user_agent for bot in seeded.bots] == ["gptbot"]
+    assert [bot.user_agent for bot in refreshed.bots] == ["claudebot"]
+    assert store.calls
+
+
+def test_loaded_config_is_saved_and_reloaded(tmp_path, facilitators) -> None:
+    snapshot_file = SnapshotFile(str(tmp_path / "snapshot.json"), "key")
+    manager = ConfigSnapshotManager(MemoryStore(), snapshot_file=snapshot_file)
+    asyncio.run(manager.get())
+
+    saved = snapshot_file.load()
+    assert saved is not None
+    assert saved.raws == saved_raws()
+    assert SnapshotFile(snapshot_file.path, "other-key").load() is None
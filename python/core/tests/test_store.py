@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from foldset import store as foldset_store
+from foldset.config import CONFIG_VERSION_KEY, ConfigSnapshotManager
+from foldset.store import RedisConfigStore
+from foldset.testing import CONFIG, MemoryStore
+from foldset.types import RedisCredentials
+
+CREDENTIALS = RedisCredentials(url="https://redis.example", token="t", tenant_id="tenant")
+
+
+class FakeRedis:
+    """Just enough of an Upstash client for RedisConfigStore."""
+
+    def __init__(self, data: dict[str, str | bytes]) -> None:
+        self.data = data
+        self.calls: list[tuple[str, ...]] = []
+
+    async def get(self, key: str) -> str | bytes | None:
+        self.calls.append(("get", key))
+        return self.data.get(key)
+
+    async def mget(self, *keys: str) -> list[str | bytes | None]:
+        self.calls.append(("mget", *keys))
+        return [self.data.get(key) for key in keys]
+
+
+@pytest.fixture
+def redis(monkeypatch: pytest.MonkeyPatch) -> FakeRedis:
+    fake = FakeRedis({"tenant:bots": b'[{"user_agent": "GPTBot"}]', "tenant:restrictions": "[]"})
+    monkeypatch.setattr(foldset_store, "_get_redis_client", lambda url, token: fake)
+    return fake
+
+
+def test_redis_clients_are_per_event_loop() -> None:
+    async def clients() -> tuple:
+        first = foldset_store._get_redis_client(CREDENTIALS.url, CREDENTIALS.token)
+        again = foldset_store._get_redis_client(CREDENTIALS.url, CREDENTIALS.token)
+        other = foldset_store._get_redis_client(CREDENTIALS.url, "other")
+        return first, again, other
+
+    first, again, other = asyncio.run(clients())
+    assert first is again
+    assert other is not first
+
+    # A store used from another loop gets that loop's client
+    store = RedisConfigStore(CREDENTIALS)
+
+    async def store_client():
+        return store._redis
+
+    assert asyncio.run(store_client()) is not first
+
+
+def test_get_many_is_one_mget_with_missing_keys_as_none(redis) -> None:
+    store = RedisConfigStore(CREDENTIALS)
+
+    values = asyncio.run(store.get_many(["bots", "facilitator", "restrictions"]))
+
+    assert values == ['[{"user_agent": "GPTBot"}]', None, "[]"]
+    assert redis.calls == [("mget", "tenant:bots", "tenant:facilitator", "tenant:restrictions")]
+
+
+def test_get_many_without_keys_skips_redis(redis) -> None:
+    assert asyncio.run(RedisConfigStore(CREDENTIALS).get_many([])) == []
+    assert redis.calls == []
+
+
+def test_snapshot_loads_in_a_single_get_many(facilitators) -> None:
+    store = MemoryStore()
+    snapshot = asyncio.run(ConfigSnapshotManager(store).get())
+
+    assert len(store.calls) == 1
+    keys = store.calls[0]
+    assert keys[0] == CONFIG_VERSION_KEY
+    assert set(keys[1:]) == set(CONFIG)
+    assert snapshot.host_config.host == "example.com"
+    assert snapshot.version is None
+
+
+def test_snapshot_from_a_partial_get_many_falls_back_per_key(facilitators) -> None:
+    # MGET answers nil for keys the tenant never published
+    store = MemoryStore({"restrictions": CONFIG["restrictions"], "bots": CONFIG["bots"]})
+    store.data[CONFIG_VERSION_KEY] = "7"
+    snapshot = asyncio.run(ConfigSnapshotManager(store).get())
+
+    assert snapshot.version == "7"
+    assert len(snapshot.restrictions) == len(CONFIG["restrictions"])
+    assert len(snapshot.bots) == 1
+    assert snapshot.host_config is None
+    assert snapshot.payment_methods == []
+    assert snapshot.facilitator is None
+
+
+def test_snapshot_from_an_empty_store_uses_every_fallback(facilitators) -> None:
+    store = MemoryStore()
+    store.data = {}
+    snapshot = asyncio.run(ConfigSnapshotManager(store).get())
+
+    assert snapshot.host_config is None
+    assert snapshot.restrictions == []
+    assert snapshot.bots == []
+    assert len(store.calls) == 1
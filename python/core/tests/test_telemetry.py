@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import httpx
+
+from foldset.telemetry import EVENT_MAX_ATTEMPTS, EventPipeline
+
+
+def pipeline_with(statuses: list[int]) -> tuple[EventPipeline, list[httpx.Request]]:
+    """An EventPipeline whose client answers with ``statuses`` in turn."""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(statuses[min(len(requests), len(statuses)) - 1])
+
+    pipeline = EventPipeline()
+    pipeline._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return pipeline, requests
+
+
+def drain(pipeline: EventPipeline) -> None:
+    while not pipeline._queue.empty():
+        pipeline._send([pipeline._queue.get_nowait()])
+
+
+def test_events_post_to_the_events_endpoint() -> None:
+    pipeline, requests = pipeline_with([202])
+    pipeline._send([("key", {"request_id": "a"}, 0), ("key", {"request_id": "b"}, 0)])
+
+    assert pipeline.sent == 2
+    assert [request.url.path for request in requests] == ["/v1/events", "/v1/events"]
+    assert sorted(json.loads(request.content)["request_id"] for request in requests) == ["a", "b"]
+    assert requests[0].headers["Authorization"] == "Bearer key"
+
+
+def test_server_errors_are_retried_then_counted_as_failed() -> None:
+    pipeline, requests = pipeline_with([503])
+    pipeline._send([("key", {"request_id": "a"}, 0)])
+    drain(pipeline)
+
+    assert len(requests) == EVENT_MAX_ATTEMPTS
+    assert pipeline.sent == 0
+    assert pipeline.failed == 1
+
+
+def test_retry_succeeds_after_a_transient_error() -> None:
+    pipeline, requests = pipeline_with([500, 200])
+    pipeline._send([("key", {"request_id": "a"}, 0)])
+    drain(pipeline)
+
+    assert len(requests) == 2
+    assert pipeline.sent == 1
+    assert pipeline.failed == 0
+
+
+def test_client_errors_are_not_retried() -> None:
+    pipeline, requests = pipeline_with([401])
+    pipeline._send([("key", {"request_id": "a"}, 0)])
+    drain(pipeline)
+
+    assert len(requests) == 1
+    assert pipeline.sent == 0
+    assert pipeline.failed == 1
+
+
+def test_a_batch_is_posted_concurrently() -> None:
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return httpx.Response(202)
+
+    pipeline = EventPipeline(concurrency=10)
+    pipeline._client = httpx.Client(transport=httpx.MockTransport(handler))
+    started = time.monotonic()
+    pipeline._send([("key", {"request_id": str(i)}, 0) for i in range(100)])
+    elapsed = time.monotonic() - started
+
+    assert pipeline.sent == 100
+    assert peak == 10
+    # Ten rounds of 50 ms, where one post at a time would take 5 s
+    assert elapsed < 1.5
@@ -10,6 +10,8 @@ from foldset.types import RequestAdapter
 class DjangoAdapter(RequestAdapter):
     def __init__(self, request: HttpRequest) -> None:
         self._request = request
+        self._body: Any | None = None
+        self._body_read = False
 
     def get_ip_address(self) -> str | None:
         forwarded = self.get_header("x-forwarded-for")
@@ -59,7 +61,10 @@ class DjangoAdapter(RequestAdapter):
         return values if len(values) > 1 else values[0]
 
     async def get_body(self) -> Any:
-        try:
-            return json.loads(self._request.body)
-        except Exception:
-            return None
+        if not self._body_read:
+            self._body_read = True
+            try:
+                self._body = json.loads(self._request.body)
+            except Exception:
+                self._body = None
+        return self._body
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+import warnings
+
+from django.apps import AppConfig
+from foldset import WorkerCore, report_error
+from foldset.types import FoldsetOptions
+
+from .middleware import _run_async, options_from_settings
+
+
+async def _warmup(options: FoldsetOptions) -> None:
+    try:
+        await WorkerCore.warmup(options)
+    except Exception as error:
+        warnings.warn(f"[foldset] Warmup failed, loading on first request: {error}")
+        await report_error(options.api_key, error)
+
+
+class FoldsetConfig(AppConfig):
+    """Warms up the Foldset worker core when Django starts.
+
+    Add "foldset_django" to INSTALLED_APPS and set FOLDSET_WARMUP = True.
+    """
+
+    name = "foldset_django"
+    verbose_name = "Foldset"
+
+    def ready(self) -> None:
+        options = options_from_settings()
+        if options is None or not options.warmup:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None:
+            # ASGI servers that load the app on their event loop: warm up on
+            # that loop, where the async middleware path will run.
+            self._warmup_task = loop.create_task(_warmup(options))
+        else:
+            _run_async(_warmup(options))
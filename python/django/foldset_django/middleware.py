@@ -1,14 +1,27 @@
 from __future__ import annotations
 
-import asyncio
 import json
 import warnings
 from importlib.metadata import version as _pkg_version
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable
 
-from django.http import HttpRequest, HttpResponse
-from foldset import WorkerCore, report_error
-from foldset.types import FoldsetOptions
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from foldset import (
+    WorkerCore,
+    aprepend_chunks,
+    asettle_before_last,
+    prepend_chunks,
+    report_error,
+    settle_before_last,
+)
+from foldset.loop import run_sync
+from foldset.types import (
+    FacilitatorHttpOptions,
+    FoldsetOptions,
+    GrantOptions,
+    ProcessRequestResult,
+)
 
 from .adapter import DjangoAdapter
 
@@ -20,18 +33,122 @@ def _set_headers(response: HttpResponse, headers: dict[str, str]) -> None:
         response[key] = value
 
 
+def _result_response(result: ProcessRequestResult) -> HttpResponse:
+    """Build the response for a health-check or payment-error result."""
+    resp = HttpResponse(
+        result.response.body,
+        status=result.response.status,
+    )
+    _set_headers(resp, result.response.headers)
+    return resp
+
+
+def _apply_settlement(response: HttpResponse, settlement: Any) -> HttpResponse:
+    if settlement.success:
+        _set_headers(response, settlement.headers)
+        return response
+
+    return HttpResponse(
+        json.dumps({
+            "error": "Settlement failed",
+            "details": settlement.error_reason,
+        }),
+        status=402,
+        content_type="application/json",
+    )
+
+
 def _run_async(coro: Any) -> Any:
-    """Run an async coroutine from sync Django context."""
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
+    """Run an async coroutine from sync Django context on the shared background loop."""
+    return run_sync(coro)
+
+
+def _process_settlement(
+    core: WorkerCore, adapter: DjangoAdapter, result: ProcessRequestResult, status_code: int
+) -> Any:
+    return core.process_settlement(
+        adapter,
+        result.payment_payload,
+        result.payment_requirements,
+        status_code,
+        result.metadata.request_id,
+        result.http_server,
+    )
+
+
+def _settle_complete(
+    response: StreamingHttpResponse,
+    settle: Callable[[], Any],
+    asettle: Callable[[], Awaitable[Any]],
+) -> StreamingHttpResponse:
+    """Settle before the last chunk is streamed, aborting the body on failure.
+
+    A settlement that raises counts as failed: the body has not been paid
+    for, so its end is withheld all the same. An upstream error (status >=
+    400) is not charged and its body is passed through as is. Django has no
+    trailers, so PAYMENT-RESPONSE is not sent this way.
+    """
+    upstream_error = response.status_code >= 400
+
+    def settled() -> bool:
+        try:
+            return settle().success or upstream_error
+        except Exception:
+            return upstream_error
+
+    async def asettled() -> bool:
+        try:
+            return (await asettle()).success or upstream_error
+        except Exception:
+            return upstream_error
+
+    if response.is_async:
+        response.streaming_content = asettle_before_last(response.streaming_content, asettled)
+    else:
+        response.streaming_content = settle_before_last(response.streaming_content, settled)
+    return response
+
+
+def _finish_first_byte(
+    response: StreamingHttpResponse, first: Any, rest: Any, settlement: Any
+) -> HttpResponse:
+    """Put the first chunk back in front of the body and apply the settlement."""
+    if settlement is not None and not settlement.success:
+        response.close()
+        return _apply_settlement(response, settlement)
+    if settlement is not None:
+        _set_headers(response, settlement.headers)
+    if first is None:
+        response.streaming_content = []
+    elif response.is_async:
+        response.streaming_content = aprepend_chunks([first], rest)
+    else:
+        response.streaming_content = prepend_chunks([first], rest, rest)
+    return response
 
-    if loop and loop.is_running():
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            return pool.submit(asyncio.run, coro).result()
-    return asyncio.run(coro)
+
+def options_from_settings() -> FoldsetOptions | None:
+    """Build FoldsetOptions from Django settings, or None without an API key."""
+    from django.conf import settings
+    api_key = getattr(settings, "FOLDSET_API_KEY", "")
+    if not api_key:
+        return None
+
+    grants = getattr(settings, "FOLDSET_GRANTS", None)
+    return FoldsetOptions(
+        api_key=api_key,
+        platform="django",
+        sdk_version=PACKAGE_VERSION,
+        config_max_stale_ms=getattr(settings, "FOLDSET_CONFIG_MAX_STALE_MS", None),
+        warmup=getattr(settings, "FOLDSET_WARMUP", False),
+        snapshot_path=getattr(settings, "FOLDSET_SNAPSHOT_PATH", None),
+        shared_config_path=getattr(settings, "FOLDSET_SHARED_CONFIG_PATH", None),
+        settlement_mode=getattr(settings, "FOLDSET_SETTLEMENT_MODE", "before"),
+        settlement_queue_path=getattr(settings, "FOLDSET_SETTLEMENT_QUEUE_PATH", None),
+        stream_settlement=getattr(settings, "FOLDSET_STREAM_SETTLEMENT", "on-headers"),
+        facilitator_http=FacilitatorHttpOptions(**getattr(settings, "FOLDSET_FACILITATOR_HTTP", {})),
+        grants=GrantOptions(**grants) if grants else None,
+    )
 
 
 class FoldsetMiddleware:
@@ -46,85 +163,165 @@ class FoldsetMiddleware:
 
     Configure in settings.py:
         FOLDSET_API_KEY = "your-api-key"
+        FOLDSET_CONFIG_MAX_STALE_MS = 300_000  # optional
+        FOLDSET_WARMUP = True  # optional, needs "foldset_django" in INSTALLED_APPS
+        FOLDSET_SNAPSHOT_PATH = "/var/tmp/foldset.json"  # optional
+        FOLDSET_SHARED_CONFIG_PATH = "/dev/shm/foldset-config.json"  # optional
+        FOLDSET_SETTLEMENT_MODE = "concurrent"  # optional: "before", "concurrent" or "deferred"
+        FOLDSET_STREAM_SETTLEMENT = "first-byte"  # optional: "on-headers", "first-byte" or "complete"
+        FOLDSET_FACILITATOR_HTTP = {"max_connections": 50}  # optional, see FacilitatorHttpOptions
+        FOLDSET_GRANTS = {"secret": "...", "max_requests": 100}  # optional, see GrantOptions
+
+    Supports both sync (WSGI) and async (ASGI) middleware chains. Under ASGI
+    the core is awaited on the server's event loop, with no thread hop.
     """
 
-    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
-        self.get_response = get_response
+    sync_capable = True
+    async_capable = True
 
-        from django.conf import settings
-        api_key = getattr(settings, "FOLDSET_API_KEY", "")
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
 
-        self._disabled = not api_key
+        self._options = options_from_settings()
+        self._disabled = self._options is None
         if self._disabled:
             warnings.warn("[foldset] No FOLDSET_API_KEY in settings, middleware disabled")
-            self._options = None
-        else:
-            self._options = FoldsetOptions(
-                api_key=api_key,
-                platform="django",
-                sdk_version=PACKAGE_VERSION,
-            )
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self._is_async:
+            return self.__acall__(request)  # type: ignore[return-value]
+
         if self._disabled:
             return self.get_response(request)
 
+        adapter = DjangoAdapter(request)
         try:
             core = _run_async(WorkerCore.from_options(self._options))
-            adapter = DjangoAdapter(request)
             result = _run_async(core.process_request(adapter))
+        except Exception as error:
+            # On any error, allow the request through rather than blocking the user.
+            _run_async(report_error(self._options.api_key, error, adapter))
+            return self.get_response(request)
 
-            if result.type == "health-check":
-                resp = HttpResponse(
-                    result.response.body,
-                    status=result.response.status,
-                )
-                _set_headers(resp, result.response.headers)
-                return resp
-
-            if result.type == "no-payment-required":
-                response = self.get_response(request)
-                if result.headers:
-                    _set_headers(response, result.headers)
-                return response
+        if result.type in ("health-check", "payment-error"):
+            return _result_response(result)
 
-            if result.type == "payment-error":
-                resp = HttpResponse(
-                    result.response.body,
-                    status=result.response.status,
-                )
-                _set_headers(resp, result.response.headers)
-                return resp
+        # The view runs exactly once from here on, whatever settlement does
+        response = self.get_response(request)
 
-            if result.type == "payment-verified":
-                response = self.get_response(request)
+        if result.type == "payment-verified":
+            try:
+                if response.streaming and self._options.stream_settlement != "on-headers":
+                    return self._settle_streamed(core, adapter, result, response)
 
                 settlement = _run_async(
-                    core.process_settlement(
-                        adapter,
-                        result.payment_payload,
-                        result.payment_requirements,
-                        response.status_code,
-                        result.metadata.request_id,
-                    )
+                    _process_settlement(core, adapter, result, response.status_code)
                 )
+            except Exception as error:
+                _run_async(report_error(self._options.api_key, error, adapter))
+                return response
+            return _apply_settlement(response, settlement)
 
-                if settlement.success:
-                    _set_headers(response, settlement.headers)
-                else:
-                    response = HttpResponse(
-                        json.dumps({
-                            "error": "Settlement failed",
-                            "details": settlement.error_reason,
-                        }),
-                        status=402,
-                        content_type="application/json",
-                    )
+        if result.headers:
+            _set_headers(response, result.headers)
+        return response
 
-                return response
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        """Async path used under ASGI, awaiting core directly on the server loop."""
+        if self._disabled:
+            return await self.get_response(request)
 
+        adapter = DjangoAdapter(request)
+        try:
+            core = await WorkerCore.from_options(self._options)
+            result = await core.process_request(adapter)
         except Exception as error:
-            _run_async(report_error(self._options.api_key, error, DjangoAdapter(request)))
-            return self.get_response(request)
+            # On any error, allow the request through rather than blocking the user.
+            await report_error(self._options.api_key, error, adapter)
+            return await self.get_response(request)
+
+        if result.type in ("health-check", "payment-error"):
+            return _result_response(result)
+
+        # The view runs exactly once from here on, whatever settlement does
+        response = await self.get_response(request)
+
+        if result.type == "payment-verified":
+            try:
+                if response.streaming and self._options.stream_settlement != "on-headers":
+                    return await self._asettle_streamed(core, adapter, result, response)
+
+                settlement = await _process_settlement(core, adapter, result, response.status_code)
+            except Exception as error:
+                await report_error(self._options.api_key, error, adapter)
+                return response
+            return _apply_settlement(response, settlement)
+
+        if result.headers:
+            _set_headers(response, result.headers)
+        return response
 
-        return self.get_response(request)
+    def _settle_streamed(
+        self,
+        core: WorkerCore,
+        adapter: DjangoAdapter,
+        result: ProcessRequestResult,
+        response: StreamingHttpResponse,
+    ) -> HttpResponse:
+        """Settle a streamed response on its first chunk or before its last one.
+
+        Neither buffers the body. For "first-byte" the body runs up to its
+        first chunk here, so PAYMENT-RESPONSE still goes out as a header.
+        """
+
+        def settle() -> Any:
+            return _run_async(_process_settlement(core, adapter, result, response.status_code))
+
+        async def asettle() -> Any:
+            return settle()
+
+        if self._options.stream_settlement == "complete":
+            return _settle_complete(response, settle, asettle)
+
+        if response.is_async:
+            # Django buffers async bodies under WSGI anyway, and reading one
+            # here would tie it to a throwaway event loop; settle up front.
+            return _apply_settlement(response, settle())
+
+        rest = iter(response.streaming_content)
+        first = next(rest, None)
+        try:
+            settlement = settle()
+        except Exception:
+            settlement = None
+        return _finish_first_byte(response, first, rest, settlement)
+
+    async def _asettle_streamed(
+        self,
+        core: WorkerCore,
+        adapter: DjangoAdapter,
+        result: ProcessRequestResult,
+        response: StreamingHttpResponse,
+    ) -> HttpResponse:
+        """Async version of _settle_streamed, awaiting core on the server loop."""
+
+        async def asettle() -> Any:
+            return await _process_settlement(core, adapter, result, response.status_code)
+
+        if self._options.stream_settlement == "complete":
+            return _settle_complete(response, async_to_sync(asettle), asettle)
+
+        if response.is_async:
+            rest = aiter(response.streaming_content)
+            first = await anext(rest, None)
+        else:
+            rest = iter(response.streaming_content)
+            first = await sync_to_async(next)(rest, None)
+        try:
+            settlement = await asettle()
+        except Exception:
+            settlement = None
+        return _finish_first_byte(response, first, rest, settlement)
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import django
+import pytest
+from django.conf import settings
+
+from foldset import WorkerCore, get_core_registry
+from foldset.testing import FakeFacilitator, MemoryStore, use_fake_facilitators
+
+settings.configure(
+    ALLOWED_HOSTS=["*"],
+    ROOT_URLCONF="urls",
+    MIDDLEWARE=["foldset_django.FoldsetMiddleware"],
+    FOLDSET_API_KEY="key",
+)
+django.setup()
+
+
+@pytest.fixture
+def facilitators(monkeypatch: pytest.MonkeyPatch) -> list[FakeFacilitator]:
+    """Replace the HTTP facilitator and telemetry with in-memory fakes."""
+    return use_fake_facilitators(monkeypatch)
+
+
+@pytest.fixture
+def core(facilitators: list[FakeFacilitator]):
+    """The core the middleware gets for FOLDSET_API_KEY."""
+    core = WorkerCore(MemoryStore(), "key", "test", "0")
+    get_core_registry().add("key", core)
+    yield core
+    get_core_registry().clear()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable
+
+import pytest
+from django.test import AsyncClient, Client, override_settings
+
+import foldset_django.middleware
+import urls
+from foldset import SettlementError, WorkerCore
+from foldset.testing import payment_header
+
+Get = Callable[..., Awaitable[Any]]
+
+
+@pytest.fixture(autouse=True)
+def clear_calls() -> None:
+    urls.calls.clear()
+
+
+@pytest.fixture(params=["sync", "async"])
+def run(request: pytest.FixtureRequest) -> Callable[[Callable[[Get], Awaitable[Any]]], Any]:
+    """Run ``flow(get)`` against a sync ``Client`` or an ``AsyncClient``.
+
+    ``get(path, headers=None)`` requests ``path`` as GPTBot. The whole flow
+    runs in one event loop, so the async middleware path shares it.
+    """
+
+    def run(flow: Callable[[Get], Awaitable[Any]]) -> Any:
+        async def main() -> Any:
+            if request.param == "async":
+                client = AsyncClient()
+
+                async def get(path: str, headers: dict[str, str] | None = None) -> Any:
+                    return await client.get(path, headers={"User-Agent": "GPTBot", **(headers or {})})
+            else:
+                client = Client()
+
+                async def get(path: str, headers: dict[str, str] | None = None) -> Any:
+                    return await asyncio.to_thread(
+                        client.get, path, headers={"User-Agent": "GPTBot", **(headers or {})}
+                    )
+
+            return await flow(get)
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def paid(get: Get, path: str = "/api/data") -> Any:
+    unpaid = await get(path)
+    return await get(path, {"PAYMENT-SIGNATURE": payment_header(unpaid.headers["PAYMENT-REQUIRED"])})
+
+
+async def read(response: Any) -> bytes:
+    """Consume a response body the way the server would."""
+    if not response.streaming:
+        return response.content
+    if response.is_async:
+        return b"".join([chunk async for chunk in response.streaming_content])
+    # Off the loop, as Django's ASGI handler iterates sync bodies
+    return await asyncio.to_thread(b"".join, response.streaming_content)
+
+
+def stream(run: Any, mode: str, path: str = "/articles/one", before_paying: Any = None) -> Any:
+    """Pay for ``path`` under FOLDSET_STREAM_SETTLEMENT ``mode``; return the response and body."""
+
+    async def flow(get: Get) -> tuple[Any, bytes]:
+        unpaid = await get(path)
+        if before_paying is not None:
+            before_paying()
+        signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+        response = await get(path, {"PAYMENT-SIGNATURE": signature})
+        return response, await read(response)
+
+    with override_settings(FOLDSET_STREAM_SETTLEMENT=mode):
+        return run(flow)
+
+
+def test_unpaid_bot_gets_402(core, run) -> None:
+    response = run(lambda get: get("/api/data"))
+
+    assert response.status_code == 402
+    assert "PAYMENT-REQUIRED" in response.headers
+    assert urls.calls == []
+
+
+def test_human_reaches_the_view_unpaid(core, run) -> None:
+    response = run(lambda get: get("/api/data", {"User-Agent": "Mozilla/5.0"}))
+
+    assert response.status_code == 200
+    assert urls.calls == ["/api/data"]
+
+
+def test_paid_request_is_settled(core, facilitators, run) -> None:
+    response = run(paid)
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert urls.calls == ["/api/data"]
+    assert facilitators[0].settle_calls == 1
+
+
+def test_failed_settlement_replaces_the_response(core, facilitators, run) -> None:
+    async def flow(get: Get) -> Any:
+        unpaid = await get("/api/data")
+        facilitators[0].settle_error = "insufficient_funds"
+        return await get(
+            "/api/data", {"PAYMENT-SIGNATURE": payment_header(unpaid.headers["PAYMENT-REQUIRED"])}
+        )
+
+    response = run(flow)
+
+    assert response.status_code == 402
+    assert response.json()["details"] == "insufficient_funds"
+    assert urls.calls == ["/api/data"]
+
+
+def test_settlement_error_runs_the_view_once(core, run, monkeypatch) -> None:
+    reported: list[BaseException] = []
+
+    async def process_settlement(*args: Any) -> Any:
+        raise RuntimeError("facilitator down")
+
+    async def report_error(api_key: str, error: BaseException, adapter: Any = None) -> None:
+        reported.append(error)
+
+    monkeypatch.setattr(WorkerCore, "process_settlement", process_settlement)
+    monkeypatch.setattr(foldset_django.middleware, "report_error", report_error)
+    response = run(paid)
+
+    assert response.status_code == 200
+    assert "PAYMENT-RESPONSE" not in response.headers
+    assert urls.calls == ["/api/data"]
+    assert [str(error) for error in reported] == ["facilitator down"]
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_streamed_body_settles_with_its_headers(core, facilitators, run, mode) -> None:
+    response, body = stream(run, mode)
+
+    assert response.status_code == 200
+    assert body == b"abc"
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert urls.calls == ["/articles/one"]
+    assert facilitators[0].settle_calls == 1
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_failed_settlement_replaces_the_streamed_body(core, facilitators, run, mode) -> None:
+    def fail() -> None:
+        facilitators[0].settle_error = "insufficient_funds"
+
+    response, body = stream(run, mode, before_paying=fail)
+
+    assert response.status_code == 402
+    assert json.loads(body)["details"] == "insufficient_funds"
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_upstream_error_is_not_charged(core, facilitators, run, mode) -> None:
+    response, body = stream(run, mode, "/articles/one?status=500")
+
+    assert response.status_code == 402
+    assert json.loads(body)["details"] == "Upstream error"
+    assert facilitators[0].settle_calls == 0
+
+
+def test_complete_settles_before_the_last_chunk(core, facilitators, run) -> None:
+    response, body = stream(run, "complete")
+
+    assert response.status_code == 200
+    assert body == b"abc"
+    # Django has no trailers, so the receipt header is not sent
+    assert "PAYMENT-RESPONSE" not in response.headers
+    assert facilitators[0].settle_calls == 1
+
+
+def test_complete_aborts_the_body_when_settlement_fails(core, facilitators, run) -> None:
+    def fail() -> None:
+        facilitators[0].settle_error = "insufficient_funds"
+
+    with pytest.raises(SettlementError):
+        stream(run, "complete", before_paying=fail)
+
+
+def test_complete_passes_an_upstream_error_through(core, facilitators, run) -> None:
+    response, body = stream(run, "complete", "/articles/one?status=404")
+
+    assert response.status_code == 404
+    assert body == b"abc"
+    assert facilitators[0].settle_calls == 0
+
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import json
+
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import path
+
+# Paths of every request that reached a view
+calls: list[str] = []
+
+
+def data(request: HttpRequest) -> HttpResponse:
+    calls.append(request.path)
+    return JsonResponse({"ok": True}, status=int(request.GET.get("status", 200)))
+
+
+def article(request: HttpRequest, name: str) -> HttpResponse:
+    calls.append(request.path)
+    chunks = [b"a", b"b", b"c"]
+    return StreamingHttpResponse(iter(chunks), status=int(request.GET.get("status", 200)))
+
+
+def mcp(request: HttpRequest) -> HttpResponse:
+    calls.append(request.path)
+    return JsonResponse({"echo": json.loads(request.body)})
+
+
+urlpatterns = [
+    path("api/data", data),
+    path("articles/<name>", article),
+    path("mcp", mcp),
+]
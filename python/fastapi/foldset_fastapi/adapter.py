@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from typing import Any
 
 from foldset.types import RequestAdapter
@@ -10,6 +11,7 @@ class FastAPIAdapter(RequestAdapter):
     def __init__(self, request: Request) -> None:
         self._request = request
         self._body: Any | None = None
+        self._raw_body: bytes | None = None
 
     def get_ip_address(self) -> str | None:
         forwarded = self.get_header("x-forwarded-for")
@@ -58,10 +60,17 @@ class FastAPIAdapter(RequestAdapter):
             return params.get(name)
         return None
 
+    @property
+    def raw_body(self) -> bytes | None:
+        """The request body if ``get_body`` has consumed it, for replaying downstream."""
+        return self._raw_body
+
     async def get_body(self) -> Any:
         if self._body is None:
             try:
-                self._body = await self._request.json()
+                if self._raw_body is None:
+                    self._raw_body = await self._request.body()
+                self._body = json.loads(self._raw_body)
             except Exception:
                 self._body = None
         return self._body
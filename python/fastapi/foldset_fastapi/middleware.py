@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+from dataclasses import replace
 
-from foldset import WorkerCore, report_error
+from foldset import SettlementError, WorkerCore, report_error
 from foldset.types import FoldsetOptions
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from .adapter import FastAPIAdapter
 
@@ -15,88 +16,313 @@ from importlib.metadata import version as _pkg_version
 
 PACKAGE_VERSION = _pkg_version("foldset-fastapi")
 
+# Messages that carry (part of) the response body. ``pathsend`` always ends
+# the body; the other two end it unless ``more_body`` is set.
+_BODY_MESSAGES = {"http.response.body", "http.response.zerocopysend", "http.response.pathsend"}
+
 
 def _set_headers(response: Response, headers: dict[str, str]) -> None:
     for key, value in headers.items():
         response.headers[key] = value
 
 
-class FoldsetMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: Any, options: FoldsetOptions) -> None:
-        super().__init__(app)
-        self._options = FoldsetOptions(
-            api_key=options.api_key,
-            redis_credentials=options.redis_credentials,
-            platform="fastapi",
-            sdk_version=PACKAGE_VERSION,
-        )
+def _send_with_headers(send: Send, headers: dict[str, str]) -> Send:
+    """Wrap ``send`` to add headers to the response start message."""
+
+    async def wrapped(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            message_headers = MutableHeaders(scope=message)
+            for key, value in headers.items():
+                message_headers[key] = value
+        await send(message)
+
+    return wrapped
+
+
+def _settlement_failed_response(settlement) -> Response:
+    return Response(
+        content=json.dumps({
+            "error": "Settlement failed",
+            "details": settlement.error_reason,
+        }),
+        status_code=402,
+        media_type="application/json",
+    )
+
+
+def _replay_receive(adapter: FastAPIAdapter, receive: Receive) -> Receive:
+    """Replay a body the adapter already consumed, then defer to ``receive``."""
+    body = adapter.raw_body
+    if body is None:
+        return receive
+
+    replayed = False
+
+    async def wrapped() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return wrapped
+
+
+class FoldsetMiddleware:
+    """Pure ASGI middleware for Foldset x402 payment gating.
+
+    Usage:
+        app = FastAPI()
+        app.add_middleware(FoldsetMiddleware, options=FoldsetOptions(api_key="your-key"))
+
+    Non-HTTP scopes and requests that need no payment reach the app with
+    their ``receive`` and ``send`` untouched, apart from extra headers when
+    the config asks for them. The request body is only read (and replayed
+    to the app) for MCP requests. Response bodies are streamed, never
+    buffered: settlement happens when the app starts its response, or per
+    ``options.stream_settlement`` on its first or last body message.
+    """
+
+    def __init__(self, app: ASGIApp, options: FoldsetOptions) -> None:
+        self.app = app
+        self._options = replace(options, platform="fastapi", sdk_version=PACKAGE_VERSION)
         self._disabled = not options.api_key
         if self._disabled:
             import warnings
             warnings.warn("[foldset] No API key provided, middleware disabled")
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        if self._disabled:
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan" and self._options.warmup and not self._disabled:
+            receive = self._warmup_on_startup(receive)
+
+        if scope["type"] != "http" or self._disabled:
+            await self.app(scope, receive, send)
+            return
 
+        adapter = FastAPIAdapter(Request(scope, receive))
         try:
             core = await WorkerCore.from_options(self._options)
-            adapter = FastAPIAdapter(request)
             result = await core.process_request(adapter)
+        except Exception as error:
+            # On any error, allow the request through rather than blocking the user.
+            await report_error(self._options.api_key, error, adapter)
+            await self.app(scope, _replay_receive(adapter, receive), send)
+            return
 
-            if result.type == "health-check":
-                response = Response(
-                    content=result.response.body,
-                    status_code=result.response.status,
-                    media_type="application/json",
-                )
-                _set_headers(response, result.response.headers)
-                return response
-
-            if result.type == "no-payment-required":
-                response = await call_next(request)
-                if result.headers:
-                    _set_headers(response, result.headers)
-                return response
-
-            if result.type == "payment-error":
-                response = Response(
-                    content=result.response.body,
-                    status_code=result.response.status,
-                )
-                _set_headers(response, result.response.headers)
-                return response
+        receive = _replay_receive(adapter, receive)
+
+        if result.type == "health-check":
+            response = Response(
+                content=result.response.body,
+                status_code=result.response.status,
+                media_type="application/json",
+            )
+            _set_headers(response, result.response.headers)
+            await response(scope, receive, send)
+            return
+
+        if result.type == "payment-error":
+            response = Response(
+                content=result.response.body,
+                status_code=result.response.status,
+            )
+            _set_headers(response, result.response.headers)
+            await response(scope, receive, send)
+            return
 
-            if result.type == "payment-verified":
-                response = await call_next(request)
+        if result.type == "payment-verified":
+            if self._options.stream_settlement == "on-headers":
+                await self._call_with_settlement(core, adapter, result, scope, receive, send)
+            else:
+                await self._call_with_stream_settlement(core, adapter, result, scope, receive, send)
+            return
 
+        if result.type == "no-payment-required" and result.headers:
+            send = _send_with_headers(send, result.headers)
+
+        await self.app(scope, receive, send)
+
+    def _warmup_on_startup(self, receive: Receive) -> Receive:
+        """Warm up the worker core when the server sends lifespan startup."""
+
+        async def wrapped() -> Message:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await WorkerCore.warmup(self._options)
+                except Exception as error:
+                    # Startup goes on; the first request loads config instead.
+                    await report_error(self._options.api_key, error)
+            return message
+
+        return wrapped
+
+    async def _call_with_settlement(
+        self,
+        core: WorkerCore,
+        adapter: FastAPIAdapter,
+        result,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        # Once settlement fails the app's own response is replaced, so the
+        # rest of its messages are dropped.
+        replaced = False
+
+        async def settle_on_start(message: Message) -> None:
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] != "http.response.start":
+                await send(message)
+                return
+
+            try:
                 settlement = await core.process_settlement(
                     adapter,
                     result.payment_payload,
                     result.payment_requirements,
-                    response.status_code,
+                    message["status"],
                     result.metadata.request_id,
+                    result.http_server,
                 )
+            except Exception as error:
+                await report_error(self._options.api_key, error, adapter)
+                await send(message)
+                return
 
-                if settlement.success:
-                    _set_headers(response, settlement.headers)
-                else:
-                    response = Response(
-                        content=json.dumps({
-                            "error": "Settlement failed",
-                            "details": settlement.error_reason,
-                        }),
-                        status_code=402,
-                        media_type="application/json",
-                    )
+            if settlement.success:
+                message_headers = MutableHeaders(scope=message)
+                for key, value in settlement.headers.items():
+                    message_headers[key] = value
+                await send(message)
+                return
 
-                return response
+            replaced = True
+            await _settlement_failed_response(settlement)(scope, receive, send)
 
-        except Exception as error:
-            # On any error, allow the request through rather than blocking the user.
-            await report_error(self._options.api_key, error, FastAPIAdapter(request))
-            return await call_next(request)
+        await self.app(scope, receive, settle_on_start)
+
+    async def _call_with_stream_settlement(
+        self,
+        core: WorkerCore,
+        adapter: FastAPIAdapter,
+        result,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        """Settle on the first ("first-byte") or last ("complete") body message.
+
+        The start message is held until the first body message, so
+        "first-byte" puts PAYMENT-RESPONSE in the headers. "complete" holds
+        back one body message at a time (never the whole body): a body that
+        ends within two messages still gets the header, a longer one gets it
+        as an HTTP trailer if the server supports them, and is aborted before
+        its last message if settlement fails. An upstream error (status >=
+        400) is not charged, and "complete" passes its body through as is.
+
+        ``pathsend`` and ``zerocopysend`` extension messages count as body
+        messages. Any other message flushes the held start and body first, so
+        nothing reaches the server ahead of the response start.
+        """
+        first_byte = self._options.stream_settlement == "first-byte"
+        trailers = "http.response.trailers" in scope.get("extensions", {})
+        start: Message | None = None
+        held: Message | None = None
+        status = 200
+        settled = False
+        replaced = False
+        with_trailers = False
+
+        async def settle():
+            nonlocal settled
+            settled = True
+            try:
+                return await core.process_settlement(
+                    adapter,
+                    result.payment_payload,
+                    result.payment_requirements,
+                    status,
+                    result.metadata.request_id,
+                    result.http_server,
+                )
+            except Exception as error:
+                await report_error(self._options.api_key, error, adapter)
+                return None
+
+        async def send_start(settlement) -> None:
+            nonlocal start
+            head, start = start, None
+            if settlement is not None:
+                head_headers = MutableHeaders(scope=head)
+                for key, value in settlement.headers.items():
+                    head_headers[key] = value
+            await send(head)
+
+        async def flush_unsettled() -> None:
+            """Send the held start and body message before settling."""
+            nonlocal held, with_trailers
+            if start is not None:
+                if trailers:
+                    start["trailers"] = with_trailers = True
+                    MutableHeaders(scope=start)["Trailer"] = "PAYMENT-RESPONSE"
+                await send_start(None)
+            if held is not None:
+                await send(held)
+                held = None
+
+        async def settle_on_body(message: Message) -> None:
+            nonlocal start, held, status, replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                status = message["status"]
+                return
+            if settled and start is None:
+                await send(message)
+                return
+            if message["type"] not in _BODY_MESSAGES:
+                await flush_unsettled()
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            if more_body and not first_byte:
+                if held is not None:
+                    # The body is longer than two messages: start it unsettled
+                    await flush_unsettled()
+                held = message
+                return
+
+            settlement = await settle()
+            if not first_byte and status >= 400 and not (settlement and settlement.success):
+                settlement = None
+            elif settlement is None and start is None:
+                # Settling raised after the body started going out unsettled
+                raise SettlementError("Settlement failed")
+            if settlement is not None and not settlement.success:
+                if start is None:
+                    raise SettlementError(settlement.error_reason)
+                replaced = True
+                await _settlement_failed_response(settlement)(scope, receive, send)
+                return
+            if start is not None:
+                await send_start(settlement)
+            if held is not None:
+                await send(held)
+                held = None
+            await send(message)
+            if with_trailers:
+                await send({
+                    "type": "http.response.trailers",
+                    "headers": [
+                        (key.lower().encode("latin-1"), value.encode("latin-1"))
+                        for key, value in (settlement.headers if settlement else {}).items()
+                    ],
+                    "more_trailers": False,
+                })
 
-        return await call_next(request)
+        await self.app(scope, receive, settle_on_body)
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.types import Message
+
+from foldset import SettlementError
+from foldset.testing import payment_header
+from foldset.types import FoldsetOptions
+from foldset_fastapi import FoldsetMiddleware
+
+BOT = {"User-Agent": "GPTBot"}
+
+
+def make_app(calls: list[str], **options: Any) -> FastAPI:
+    """An app behind FoldsetMiddleware that records the paths it serves."""
+    app = FastAPI()
+    app.add_middleware(FoldsetMiddleware, options=FoldsetOptions(api_key="key", **options))
+
+    @app.get("/api/data")
+    def data(status: int = 200) -> JSONResponse:
+        calls.append("/api/data")
+        return JSONResponse({"ok": True}, status_code=status)
+
+    @app.get("/articles/{name}")
+    def article(name: str, status: int = 200) -> StreamingResponse:
+        calls.append(f"/articles/{name}")
+        return StreamingResponse(iter([b"a", b"b", b"c"]), status_code=status)
+
+    @app.post("/mcp")
+    async def mcp(request: Request) -> Any:
+        calls.append("/mcp")
+        return {"echo": await request.json()}
+
+    return app
+
+
+def pay(client: TestClient, method: str, path: str, **kwargs: Any) -> Any:
+    """Request ``path`` as GPTBot unpaid, then again with a payment for it."""
+    unpaid = client.request(method, path, headers=BOT, **kwargs)
+    assert unpaid.status_code == 402
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    return client.request(method, path, headers={**BOT, "PAYMENT-SIGNATURE": signature}, **kwargs)
+
+
+def test_human_needs_no_payment(core) -> None:
+    calls: list[str] = []
+    response = TestClient(make_app(calls)).get("/api/data", headers={"User-Agent": "Mozilla/5.0"})
+
+    assert response.status_code == 200
+    assert "PAYMENT-REQUIRED" not in response.headers
+    assert calls == ["/api/data"]
+
+
+def test_unpaid_bot_gets_402(core) -> None:
+    calls: list[str] = []
+    response = TestClient(make_app(calls)).get("/api/data", headers=BOT)
+
+    assert response.status_code == 402
+    assert "PAYMENT-REQUIRED" in response.headers
+    assert calls == []
+
+
+def test_paid_request_is_settled(core, facilitators) -> None:
+    calls: list[str] = []
+    response = pay(TestClient(make_app(calls)), "GET", "/api/data")
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert calls == ["/api/data"]
+    assert facilitators[0].settle_calls == 1
+
+
+def test_failed_settlement_replaces_the_response(core, facilitators) -> None:
+    client = TestClient(make_app([]))
+    unpaid = client.get("/api/data", headers=BOT)
+    facilitators[0].settle_error = "insufficient_funds"
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    response = client.get("/api/data", headers={**BOT, "PAYMENT-SIGNATURE": signature})
+
+    assert response.status_code == 402
+    assert response.json()["details"] == "insufficient_funds"
+
+
+def test_mcp_list_headers_are_added_to_the_response_start(core) -> None:
+    calls: list[str] = []
+    rpc = {"jsonrpc": "2.0", "method": "tools/list", "id": 1}
+    response = TestClient(make_app(calls)).post("/mcp", json=rpc, headers=BOT)
+
+    assert response.status_code == 200
+    requirements = json.loads(response.headers["Payment-Required"])["requirements"]
+    assert [requirement["name"] for requirement in requirements] == ["search"]
+    # The body the middleware read to parse the RPC is replayed to the app
+    assert response.json() == {"echo": rpc}
+
+
+def test_paid_mcp_call_replays_the_body(core, facilitators) -> None:
+    calls: list[str] = []
+    rpc = {"jsonrpc": "2.0", "method": "tools/call", "id": 1, "params": {"name": "search"}}
+    response = pay(TestClient(make_app(calls)), "POST", "/mcp", json=rpc)
+
+    assert response.status_code == 200
+    assert response.json() == {"echo": rpc}
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert calls == ["/mcp"]
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_streamed_body_settles_with_its_headers(core, facilitators, mode) -> None:
+    calls: list[str] = []
+    response = pay(TestClient(make_app(calls, stream_settlement=mode)), "GET", "/articles/one")
+
+    assert response.status_code == 200
+    assert response.text == "abc"
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert calls == ["/articles/one"]
+    assert facilitators[0].settle_calls == 1
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_failed_settlement_replaces_the_streamed_body(core, facilitators, mode) -> None:
+    client = TestClient(make_app([], stream_settlement=mode))
+    unpaid = client.get("/articles/one", headers=BOT)
+    facilitators[0].settle_error = "insufficient_funds"
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    response = client.get("/articles/one", headers={**BOT, "PAYMENT-SIGNATURE": signature})
+
+    assert response.status_code == 402
+    assert response.json()["details"] == "insufficient_funds"
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_upstream_error_is_not_charged(core, facilitators, mode) -> None:
+    client = TestClient(make_app([], stream_settlement=mode))
+    response = pay(client, "GET", "/articles/one?status=500")
+
+    assert response.status_code == 402
+    assert response.json()["details"] == "Upstream error"
+    assert facilitators[0].settle_calls == 0
+
+
+def test_complete_settles_before_the_last_chunk(core, facilitators) -> None:
+    response = pay(TestClient(make_app([], stream_settlement="complete")), "GET", "/articles/one")
+
+    assert response.status_code == 200
+    assert response.text == "abc"
+    # Three chunks and no trailer support: the headers went out unsettled
+    assert "PAYMENT-RESPONSE" not in response.headers
+    assert facilitators[0].settle_calls == 1
+
+
+def test_complete_short_body_still_gets_the_header(core, facilitators) -> None:
+    response = pay(TestClient(make_app([], stream_settlement="complete")), "GET", "/api/data")
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert "PAYMENT-RESPONSE" in response.headers
+
+
+def test_complete_aborts_the_body_when_settlement_fails(core, facilitators) -> None:
+    client = TestClient(make_app([], stream_settlement="complete"))
+    unpaid = client.get("/articles/one", headers=BOT)
+    facilitators[0].settle_error = "insufficient_funds"
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+
+    with pytest.raises(SettlementError):
+        client.get("/articles/one", headers={**BOT, "PAYMENT-SIGNATURE": signature})
+
+
+def test_complete_passes_an_upstream_error_through(core, facilitators) -> None:
+    client = TestClient(make_app([], stream_settlement="complete"))
+    response = pay(client, "GET", "/articles/one?status=404")
+
+    assert response.status_code == 404
+    assert response.text == "abc"
+    assert facilitators[0].settle_calls == 0
+
+
+def test_complete_sends_payment_response_as_a_trailer(core, facilitators) -> None:
+    app = make_app([], stream_settlement="complete")
+
+    async def call(headers: dict[str, str]) -> list[Message]:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/articles/one",
+            "raw_path": b"/articles/one",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("example.com", 80),
+            "extensions": {"http.response.trailers": {}},
+        }
+        messages: list[Message] = []
+        requested = False
+
+        async def receive() -> Message:
+            nonlocal requested
+            if requested:
+                # No disconnect while the response is being sent
+                await asyncio.Event().wait()
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: Message) -> None:
+            messages.append(message)
+
+        await app(scope, receive, send)
+        return messages
+
+    async def run() -> list[Message]:
+        unpaid = await call(BOT)
+        required = dict(unpaid[0]["headers"])[b"payment-required"].decode()
+        return await call({**BOT, "PAYMENT-SIGNATURE": payment_header(required)})
+
+    messages = asyncio.run(run())
+    start, *body, trailers = messages
+    headers = dict(start["headers"])
+    assert start["trailers"] is True
+    assert headers[b"trailer"] == b"PAYMENT-RESPONSE"
+    assert b"payment-response" not in headers
+    assert b"".join(message.get("body", b"") for message in body) == b"abc"
+    assert trailers["type"] == "http.response.trailers"
+    assert b"payment-response" in dict(trailers["headers"])
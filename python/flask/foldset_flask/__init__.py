@@ -1,4 +1,5 @@
 from .middleware import foldset
+from .wsgi import wrap_wsgi
 from foldset.types import FoldsetOptions
 
-__all__ = ["foldset", "FoldsetOptions"]
+__all__ = ["foldset", "wrap_wsgi", "FoldsetOptions"]
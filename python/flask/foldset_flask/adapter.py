@@ -4,6 +4,7 @@ from typing import Any
 
 from flask import Request
 from foldset.types import RequestAdapter
+from werkzeug.wrappers import Request as WSGIRequest
 
 
 class FlaskAdapter(RequestAdapter):
@@ -52,3 +53,20 @@ class FlaskAdapter(RequestAdapter):
 
     async def get_body(self) -> Any:
         return self._request.get_json(silent=True)
+
+
+class WSGIAdapter(FlaskAdapter):
+    """FlaskAdapter over a bare WSGI environ, for gating outside the Flask app.
+
+    ``raw_body`` holds the request body once ``get_body`` has read it, so the
+    caller can put it back into the environ for the wrapped app.
+    """
+
+    def __init__(self, environ: dict[str, Any]) -> None:
+        super().__init__(WSGIRequest(environ))  # type: ignore[arg-type]
+        self.raw_body: bytes | None = None
+
+    async def get_body(self) -> Any:
+        if self.raw_body is None:
+            self.raw_body = self._request.get_data(cache=True)
+        return self._request.get_json(silent=True)
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
-import asyncio
 import json
 import warnings
+from dataclasses import replace
 from importlib.metadata import version as _pkg_version
 from typing import Any
 
 from flask import Flask, Request, Response, request
-from foldset import WorkerCore, report_error
+from foldset import WorkerCore, get_core_registry, prepend_chunks, report_error, settle_before_last
+from foldset.loop import run_sync
 from foldset.types import FoldsetOptions
 
 from .adapter import FlaskAdapter
@@ -21,17 +22,60 @@ def _set_headers(response: Response, headers: dict[str, str]) -> None:
 
 
 def _run_async(coro: Any) -> Any:
-    """Run an async coroutine from sync Flask context."""
+    """Run an async coroutine from sync Flask context on the shared background loop."""
+    return run_sync(coro)
+
+
+def _settle(settlement_data: dict[str, Any], status_code: int) -> Any:
+    return _run_async(
+        settlement_data["core"].process_settlement(
+            settlement_data["adapter"],
+            settlement_data["payment_payload"],
+            settlement_data["payment_requirements"],
+            status_code,
+            settlement_data["request_id"],
+            settlement_data["http_server"],
+        )
+    )
+
+
+def _settlement_failed_response(settlement: Any) -> Response:
+    return Response(
+        json.dumps({
+            "error": "Settlement failed",
+            "details": settlement.error_reason,
+        }),
+        status=402,
+        content_type="application/json",
+    )
+
+
+def _close(body: Any) -> None:
+    close = getattr(body, "close", None)
+    if close is not None:
+        close()
+
+
+def _warmup(options: FoldsetOptions) -> WorkerCore | None:
+    """Warm up the worker core at startup, reporting failures instead of raising."""
     try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
+        return _run_async(WorkerCore.warmup(options))
+    except Exception as error:
+        warnings.warn(f"[foldset] Warmup failed, loading on first request: {error}")
+        _run_async(report_error(options.api_key, error))
+        return None
 
-    if loop and loop.is_running():
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            return pool.submit(asyncio.run, coro).result()
-    return asyncio.run(coro)
+
+def _get_core(options: FoldsetOptions) -> WorkerCore:
+    """Return the registry's core for ``options``, creating it on first use.
+
+    The core is not cached here, so one the registry evicted or replaced is
+    never used again.
+    """
+    core = get_core_registry().peek(options.api_key, options.host)
+    if core is None:
+        core = _run_async(WorkerCore.from_options(options))
+    return core
 
 
 def foldset(options: FoldsetOptions) -> Any:
@@ -49,12 +93,7 @@ def foldset(options: FoldsetOptions) -> Any:
         warnings.warn("[foldset] No API key provided, middleware disabled")
         return _NoOpExtension()
 
-    opts = FoldsetOptions(
-        api_key=options.api_key,
-        redis_credentials=options.redis_credentials,
-        platform="flask",
-        sdk_version=PACKAGE_VERSION,
-    )
+    opts = replace(options, platform="flask", sdk_version=PACKAGE_VERSION)
     return _FoldsetExtension(opts)
 
 
@@ -80,10 +119,12 @@ class _FoldsetExtension:
     def init_app(self, app: Flask) -> None:
         app.before_request(self._before_request)
         app.after_request(self._after_request)
+        if self._options.warmup:
+            _warmup(self._options)
 
     def _before_request(self) -> Response | None:
         try:
-            core = _run_async(WorkerCore.from_options(self._options))
+            core = _get_core(self._options)
             adapter = FlaskAdapter(request)
             result = _run_async(core.process_request(adapter))
 
@@ -117,6 +158,7 @@ class _FoldsetExtension:
                     "payment_payload": result.payment_payload,
                     "payment_requirements": result.payment_requirements,
                     "request_id": result.metadata.request_id,
+                    "http_server": result.http_server,
                 }
                 return None
 
@@ -135,29 +177,58 @@ class _FoldsetExtension:
         # Handle settlement
         settlement_data = getattr(request, "_foldset_settlement", None)
         if settlement_data:
+            if response.is_streamed and self._options.stream_settlement != "on-headers":
+                return self._settle_streamed(response, settlement_data)
+
             try:
-                settlement = _run_async(
-                    settlement_data["core"].process_settlement(
-                        settlement_data["adapter"],
-                        settlement_data["payment_payload"],
-                        settlement_data["payment_requirements"],
-                        response.status_code,
-                        settlement_data["request_id"],
-                    )
-                )
+                settlement = _settle(settlement_data, response.status_code)
+            except Exception as error:
+                # As in the other frameworks: report it and serve the response
+                _run_async(report_error(self._options.api_key, error, settlement_data["adapter"]))
+                return response
+            if settlement.success:
+                _set_headers(response, settlement.headers)
+            else:
+                response = _settlement_failed_response(settlement)
 
-                if settlement.success:
-                    _set_headers(response, settlement.headers)
-                else:
-                    response = Response(
-                        json.dumps({
-                            "error": "Settlement failed",
-                            "details": settlement.error_reason,
-                        }),
-                        status=402,
-                        content_type="application/json",
-                    )
-            except Exception:
-                pass
+        return response
 
+    def _settle_streamed(self, response: Response, settlement_data: dict[str, Any]) -> Response:
+        """Settle a streamed response on its first chunk or before its last one.
+
+        Neither buffers the body. "first-byte" runs the body up to its first
+        chunk here, so PAYMENT-RESPONSE still goes out with the headers;
+        "complete" settles while the server sends the body and can only
+        abort it (WSGI has no trailers), including when settling raises. An
+        upstream error (status >= 400) is not charged, and "complete" passes
+        its body through as is.
+        """
+        # The body may be iterated after the request context is gone
+        settlement_data = {**settlement_data, "adapter": FlaskAdapter(request._get_current_object())}
+        status = response.status_code
+        source = response.response
+
+        if self._options.stream_settlement == "complete":
+
+            def settle() -> bool:
+                try:
+                    return _settle(settlement_data, status).success or status >= 400
+                except Exception:
+                    return status >= 400
+
+            response.response = settle_before_last(source, settle)
+            return response
+
+        chunks = iter(source)
+        first = next(chunks, None)
+        try:
+            settlement = _settle(settlement_data, status)
+        except Exception:
+            settlement = None
+        if settlement is not None and not settlement.success:
+            _close(source)
+            return _settlement_failed_response(settlement)
+        if settlement is not None:
+            _set_headers(response, settlement.headers)
+        response.response = prepend_chunks([first], chunks, source) if first is not None else []
         return response
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import io
+import json
+import warnings
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import replace
+from typing import Any
+
+from foldset import WorkerCore, prepend_chunks, report_error, settle_before_last
+from foldset.types import FoldsetOptions, ProcessRequestResult
+from werkzeug.wrappers import Response
+
+from .adapter import WSGIAdapter
+from .middleware import PACKAGE_VERSION, _get_core, _run_async, _warmup
+
+StartResponse = Callable[..., Callable[[bytes], Any]]
+WSGIApp = Callable[[dict[str, Any], StartResponse], Iterable[bytes]]
+
+
+def wrap_wsgi(app: Any, options: FoldsetOptions) -> Any:
+    """Wrap a Flask app's WSGI callable with Foldset payment gating.
+
+    Gating is decided from the WSGI environ before Flask builds a request
+    context, so 402 and paywall responses never enter the Flask app. Use it
+    instead of the ``foldset`` extension, not alongside it.
+
+    Usage:
+        app = Flask(__name__)
+        app.wsgi_app = wrap_wsgi(app.wsgi_app, FoldsetOptions(api_key="your-key"))
+    """
+    if not options.api_key:
+        warnings.warn("[foldset] No API key provided, middleware disabled")
+        return app
+
+    opts = replace(options, platform="flask", sdk_version=PACKAGE_VERSION)
+    return FoldsetWSGIMiddleware(app, opts)
+
+
+def _result_response(result: ProcessRequestResult) -> Response:
+    response = Response(result.response.body, status=result.response.status)
+    for key, value in result.response.headers.items():
+        response.headers[key] = value
+    return response
+
+
+def _restore_body(environ: dict[str, Any], adapter: WSGIAdapter) -> None:
+    """Put a body the adapter consumed back into the environ for the app."""
+    if adapter.raw_body is not None:
+        environ["wsgi.input"] = io.BytesIO(adapter.raw_body)
+        environ["CONTENT_LENGTH"] = str(len(adapter.raw_body))
+
+
+def _with_headers(start_response: StartResponse, headers: dict[str, str]) -> StartResponse:
+    def wrapped(status: str, response_headers: list[tuple[str, str]], exc_info: Any = None):
+        return start_response(status, [*response_headers, *headers.items()], exc_info)
+
+    return wrapped
+
+
+class FoldsetWSGIMiddleware:
+    def __init__(self, app: WSGIApp, options: FoldsetOptions) -> None:
+        self.app = app
+        self._options = options
+        if options.warmup:
+            _warmup(options)
+
+    def __call__(self, environ: dict[str, Any], start_response: StartResponse) -> Iterable[bytes]:
+        adapter = WSGIAdapter(environ)
+        try:
+            core = _get_core(self._options)
+            result = _run_async(core.process_request(adapter))
+        except Exception as error:
+            _run_async(report_error(self._options.api_key, error, adapter))
+            _restore_body(environ, adapter)
+            return self.app(environ, start_response)
+
+        _restore_body(environ, adapter)
+
+        if result.type in ("health-check", "payment-error"):
+            return _result_response(result)(environ, start_response)
+
+        if result.type == "payment-verified":
+            if self._options.stream_settlement != "on-headers":
+                return self._call_with_stream_settlement(
+                    core, adapter, result, environ, start_response
+                )
+            return self._call_with_settlement(core, adapter, result, environ, start_response)
+
+        if result.type == "no-payment-required" and result.headers:
+            start_response = _with_headers(start_response, result.headers)
+
+        return self.app(environ, start_response)
+
+    def _settle(
+        self, core: WorkerCore, adapter: WSGIAdapter, result: ProcessRequestResult, status: str
+    ) -> Any:
+        """Settle the payment, or report the error and return None if settling raised."""
+        try:
+            return _run_async(
+                core.process_settlement(
+                    adapter,
+                    result.payment_payload,
+                    result.payment_requirements,
+                    int(status.split(" ", 1)[0]),
+                    result.metadata.request_id,
+                    result.http_server,
+                )
+            )
+        except Exception as error:
+            _run_async(report_error(self._options.api_key, error, adapter))
+            return None
+
+    def _call_with_stream_settlement(
+        self,
+        core: WorkerCore,
+        adapter: WSGIAdapter,
+        result: ProcessRequestResult,
+        environ: dict[str, Any],
+        start_response: StartResponse,
+    ) -> Iterable[bytes]:
+        """Settle on the body's first chunk ("first-byte") or before its last ("complete").
+
+        The app's headers are held until its first chunk (or, for
+        "complete", until it is known whether there is a second), so
+        PAYMENT-RESPONSE goes out with the headers when it can. At most two
+        chunks are held. A longer "complete" body settles while it is being
+        sent and is aborted before its last chunk if settlement fails or
+        raises; WSGI has no trailers, so it goes without PAYMENT-RESPONSE.
+        An upstream error (status >= 400) is not charged, and "complete"
+        passes its body through as is.
+        """
+        held: tuple[str, list[tuple[str, str]], Any] | None = None
+        write: Callable[[bytes], Any] | None = None
+        failure: bytes | None = None
+        status_line = "200 OK"
+        settled = False
+
+        def release(settle: bool) -> None:
+            nonlocal held, write, failure, status_line, settled
+            assert held is not None
+            status, response_headers, exc_info = held
+            held = None
+            status_line = status
+            settled = settle
+            settlement = self._settle(core, adapter, result, status) if settle else None
+            if settlement is not None and not settlement.success:
+                failure = _settlement_failure(settlement)
+                write = start_response(
+                    "402 Payment Required",
+                    [("Content-Type", "application/json"), ("Content-Length", str(len(failure)))],
+                    exc_info,
+                )
+                return
+            if settlement is not None:
+                response_headers = [*response_headers, *settlement.headers.items()]
+            write = start_response(status, response_headers, exc_info)
+
+        def hold_start(
+            status: str, response_headers: list[tuple[str, str]], exc_info: Any = None
+        ):
+            nonlocal held
+            if write is not None:
+                # Headers already went out; let the server handle exc_info
+                return start_response(status, response_headers, exc_info)
+            held = (status, response_headers, exc_info)
+
+            def write_through(data: bytes) -> None:
+                # Legacy write() output is never held back
+                if held is not None:
+                    release(settle=True)
+                if failure is None and write is not None:
+                    write(data)
+
+            return write_through
+
+        body = self.app(environ, hold_start)
+        chunks = iter(body)
+        first = next(chunks, None)
+        head = [] if first is None else [first]
+        complete = self._options.stream_settlement == "complete"
+        if complete and head and held is not None:
+            second = next(chunks, None)
+            if second is not None:
+                head.append(second)
+        if held is not None:
+            # Only a "complete" body with more to come starts unsettled
+            release(settle=not (complete and len(head) == 2))
+        if failure is not None:
+            _close(body)
+            return [failure]
+
+        stream = prepend_chunks(head, chunks, body)
+        if settled:
+            return stream
+
+        def settle() -> bool:
+            settlement = self._settle(core, adapter, result, status_line)
+            upstream_error = int(status_line.split(" ", 1)[0]) >= 400
+            return upstream_error or (settlement is not None and settlement.success)
+
+        return settle_before_last(stream, settle)
+
+    def _call_with_settlement(
+        self,
+        core: WorkerCore,
+        adapter: WSGIAdapter,
+        result: ProcessRequestResult,
+        environ: dict[str, Any],
+        start_response: StartResponse,
+    ) -> Iterable[bytes]:
+        started = False
+        failure: bytes | None = None
+
+        def settle_on_start(
+            status: str, response_headers: list[tuple[str, str]], exc_info: Any = None
+        ):
+            nonlocal started, failure
+            started = True
+            settlement = self._settle(core, adapter, result, status)
+            if settlement is None:
+                return start_response(status, response_headers, exc_info)
+
+            if settlement.success:
+                return start_response(
+                    status, [*response_headers, *settlement.headers.items()], exc_info
+                )
+
+            failure = _settlement_failure(settlement)
+            start_response(
+                "402 Payment Required",
+                [("Content-Type", "application/json"), ("Content-Length", str(len(failure)))],
+                exc_info,
+            )
+            return lambda data: None
+
+        body = self.app(environ, settle_on_start)
+        if started:
+            if failure is None:
+                return body
+            _close(body)
+            return [failure]
+
+        # The app calls start_response on first iteration instead
+        return self._settled_body(body, lambda: failure)
+
+    @staticmethod
+    def _settled_body(body: Iterable[bytes], failure: Callable[[], bytes | None]) -> Iterator[bytes]:
+        try:
+            for chunk in body:
+                replacement = failure()
+                if replacement is not None:
+                    yield replacement
+                    return
+                yield chunk
+            replacement = failure()
+            if replacement is not None:
+                yield replacement
+        finally:
+            _close(body)
+
+
+def _settlement_failure(settlement: Any) -> bytes:
+    return json.dumps({
+        "error": "Settlement failed",
+        "details": settlement.error_reason,
+    }).encode()
+
+
+def _close(body: Iterable[bytes]) -> None:
+    close = getattr(body, "close", None)
+    if close is not None:
+        close()
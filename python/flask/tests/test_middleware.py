@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+from flask import Flask, Response, request
+
+import foldset_flask.middleware
+import foldset_flask.wsgi
+from foldset import SettlementError, WorkerCore
+from foldset.testing import payment_header
+from foldset.types import FoldsetOptions
+from foldset_flask import foldset, wrap_wsgi
+
+BOT = {"User-Agent": "GPTBot"}
+
+
+@pytest.fixture(params=["extension", "wsgi"])
+def make_app(request: pytest.FixtureRequest):
+    """Build a Flask app gated by the extension or by ``wrap_wsgi``.
+
+    The app records the paths it serves in ``calls``.
+    """
+
+    def make(calls: list[str], **options: Any) -> Flask:
+        app = Flask(__name__)
+        if request.param == "extension":
+            foldset(FoldsetOptions(api_key="key", **options)).init_app(app)
+        else:
+            app.wsgi_app = wrap_wsgi(app.wsgi_app, FoldsetOptions(api_key="key", **options))
+        add_routes(app, calls)
+        return app
+
+    return make
+
+
+def add_routes(app: Flask, calls: list[str]) -> None:
+    @app.route("/api/data")
+    def data() -> Any:
+        calls.append(request.path)
+        return {"ok": True}, int(request.args.get("status", 200))
+
+    @app.route("/articles/<name>")
+    def article(name: str) -> Response:
+        calls.append(request.path)
+        return Response(iter([b"a", b"b", b"c"]), status=int(request.args.get("status", 200)))
+
+    @app.route("/mcp", methods=["POST"])
+    def mcp() -> Any:
+        calls.append(request.path)
+        return {"echo": request.get_json()}
+
+
+def pay(client: Any, path: str = "/api/data", **kwargs: Any) -> Any:
+    """Request ``path`` as GPTBot unpaid, then again with a payment for it."""
+    unpaid = client.get(path, headers=BOT, **kwargs)
+    assert unpaid.status_code == 402
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    return client.get(path, headers={**BOT, "PAYMENT-SIGNATURE": signature}, **kwargs)
+
+
+def test_human_needs_no_payment(core, make_app) -> None:
+    calls: list[str] = []
+    response = make_app(calls).test_client().get("/api/data", headers={"User-Agent": "Mozilla/5.0"})
+
+    assert response.status_code == 200
+    assert calls == ["/api/data"]
+
+
+def test_unpaid_bot_gets_402(core, make_app) -> None:
+    calls: list[str] = []
+    response = make_app(calls).test_client().get("/api/data", headers=BOT)
+
+    assert response.status_code == 402
+    assert "PAYMENT-REQUIRED" in response.headers
+    assert calls == []
+
+
+def test_paid_request_is_settled(core, facilitators, make_app) -> None:
+    calls: list[str] = []
+    response = pay(make_app(calls).test_client())
+
+    assert response.status_code == 200
+    assert response.get_json() == {"ok": True}
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert calls == ["/api/data"]
+    assert facilitators[0].settle_calls == 1
+
+
+def test_failed_settlement_replaces_the_response(core, facilitators, make_app) -> None:
+    client = make_app([]).test_client()
+    unpaid = client.get("/api/data", headers=BOT)
+    facilitators[0].settle_error = "insufficient_funds"
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    response = client.get("/api/data", headers={**BOT, "PAYMENT-SIGNATURE": signature})
+
+    assert response.status_code == 402
+    assert response.get_json()["details"] == "insufficient_funds"
+
+
+def test_settlement_error_is_reported_and_the_response_served(core, make_app, monkeypatch) -> None:
+    reported: list[BaseException] = []
+
+    async def process_settlement(*args: Any) -> Any:
+        raise RuntimeError("facilitator down")
+
+    async def report_error(api_key: str, error: BaseException, adapter: Any = None) -> None:
+        reported.append(error)
+
+    monkeypatch.setattr(WorkerCore, "process_settlement", process_settlement)
+    monkeypatch.setattr(foldset_flask.middleware, "report_error", report_error)
+    monkeypatch.setattr(foldset_flask.wsgi, "report_error", report_error)
+    calls: list[str] = []
+    response = pay(make_app(calls).test_client())
+
+    assert response.status_code == 200
+    assert "PAYMENT-RESPONSE" not in response.headers
+    assert calls == ["/api/data"]
+    assert [str(error) for error in reported] == ["facilitator down"]
+
+
+def test_paywall_revalidates_with_304(core, make_app) -> None:
+    calls: list[str] = []
+    client = make_app(calls).test_client()
+    headers = {**BOT, "Accept": "text/html"}
+
+    page = client.get("/articles/one", headers=headers)
+    assert page.status_code == 402
+    assert page.headers["Content-Type"].startswith("text/html")
+    etag = page.headers["ETag"]
+
+    revalidated = client.get("/articles/one", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.data == b""
+    assert calls == []
+
+
+def pay_streamed(client: Any, path: str = "/articles/one", before_paying: Any = None) -> Any:
+    """Pay for a streamed ``path``, running ``before_paying`` once the 402 is in."""
+    unpaid = client.get(path, headers=BOT)
+    if before_paying is not None:
+        before_paying()
+    signature = payment_header(unpaid.headers["PAYMENT-REQUIRED"])
+    return client.get(path, headers={**BOT, "PAYMENT-SIGNATURE": signature})
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_streamed_body_settles_with_its_headers(core, facilitators, make_app, mode) -> None:
+    calls: list[str] = []
+    response = pay_streamed(make_app(calls, stream_settlement=mode).test_client())
+
+    assert response.status_code == 200
+    assert response.data == b"abc"
+    assert "PAYMENT-RESPONSE" in response.headers
+    assert calls == ["/articles/one"]
+    assert facilitators[0].settle_calls == 1
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_failed_settlement_replaces_the_streamed_body(core, facilitators, make_app, mode) -> None:
+    def fail() -> None:
+        facilitators[0].settle_error = "insufficient_funds"
+
+    client = make_app([], stream_settlement=mode).test_client()
+    response = pay_streamed(client, before_paying=fail)
+
+    assert response.status_code == 402
+    assert response.get_json()["details"] == "insufficient_funds"
+
+
+@pytest.mark.parametrize("mode", ["on-headers", "first-byte"])
+def test_upstream_error_is_not_charged(core, facilitators, make_app, mode) -> None:
+    client = make_app([], stream_settlement=mode).test_client()
+    response = pay_streamed(client, "/articles/one?status=500")
+
+    assert response.status_code == 402
+    assert response.get_json()["details"] == "Upstream error"
+    assert facilitators[0].settle_calls == 0
+
+
+def test_complete_settles_before_the_last_chunk(core, facilitators, make_app) -> None:
+    response = pay_streamed(make_app([], stream_settlement="complete").test_client())
+
+    assert response.status_code == 200
+    assert response.data == b"abc"
+    # WSGI has no trailers, so the receipt header is not sent
+    assert "PAYMENT-RESPONSE" not in response.headers
+    assert facilitators[0].settle_calls == 1
+
+
+def test_complete_aborts_the_body_when_settlement_fails(core, facilitators, make_app) -> None:
+    def fail() -> None:
+        facilitators[0].settle_error = "insufficient_funds"
+
+    client = make_app([], stream_settlement="complete").test_client()
+    with pytest.raises(SettlementError):
+        pay_streamed(client, before_paying=fail).get_data()
+
+
+def test_complete_passes_an_upstream_error_through(core, facilitators, make_app) -> None:
+    client = make_app([], stream_settlement="complete").test_client()
+    response = pay_streamed(client, "/articles/one?status=404")
+
+    assert response.status_code == 404
+    assert response.data == b"abc"
+    assert facilitators[0].settle_calls == 0